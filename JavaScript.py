@@ -1,7 +1,7 @@
 import streamlit.components.v1 as components
 
 
-def brain_electrical_signals_background(num_neurons=32):
+def brain_electrical_signals_background(num_neurons=32, max_fps=30, min_neurons=8):
     components.html(f"""
     <style>
     body {{
@@ -30,7 +30,10 @@ def brain_electrical_signals_background(num_neurons=32):
     const ctx = canvas.getContext('2d');
     let width, height;
     let neurons = [];
-    const numNeurons = {num_neurons};
+    let numNeurons = {num_neurons};
+    const minNeurons = Math.min({min_neurons}, numNeurons);
+    const frameInterval = 1000 / {max_fps};
+    const maxSignals = 150;
     const neuronRadius = 2;
     const connectionDistance = 120;
     const signalSpeed = 0.008;
@@ -41,6 +44,16 @@ def brain_electrical_signals_background(num_neurons=32):
     const fluidForce = 0.00007;
     const maxSpeed = 0.4;
 
+    // Neurons are bucketed into cells of connectionDistance so neighbour lookups only scan adjacent cells.
+    const cellSize = connectionDistance;
+    let grid = new Map();
+
+    // Frame budget: cap the frame rate, and shed neurons when frames keep taking too long.
+    let lastFrame = 0;
+    let frameCost = 0;
+    let slowFrames = 0;
+    let rafId = null;
+
     function resizeCanvas() {{
         width = window.innerWidth;
         height = window.innerHeight;
@@ -74,7 +87,7 @@ def brain_electrical_signals_background(num_neurons=32):
         }}
     }}
 
-    function updateNeuronPositions(time) {{
+    function updateNeuronPositions(step) {{
         neurons.forEach(neuron => {{
             neuron.vx += (Math.random() - 0.5) * fluidForce;
             neuron.vy += (Math.random() - 0.5) * fluidForce;
@@ -85,8 +98,8 @@ def brain_electrical_signals_background(num_neurons=32):
                 neuron.vy = (neuron.vy / speed) * maxSpeed;
             }}
 
-            neuron.x += neuron.vx;
-            neuron.y += neuron.vy;
+            neuron.x += neuron.vx * step;
+            neuron.y += neuron.vy * step;
 
             if (neuron.x < 0) neuron.x = width;
             if (neuron.x > width) neuron.x = 0;
@@ -95,6 +108,20 @@ def brain_electrical_signals_background(num_neurons=32):
         }});
     }}
 
+    function cellKey(cx, cy) {{
+        return cx * 65536 + cy;
+    }}
+
+    function buildGrid() {{
+        grid = new Map();
+        neurons.forEach(neuron => {{
+            const key = cellKey(Math.floor(neuron.x / cellSize), Math.floor(neuron.y / cellSize));
+            const cell = grid.get(key);
+            if (cell) cell.push(neuron);
+            else grid.set(key, [neuron]);
+        }});
+    }}
+
     function drawNeurons() {{
         neurons.forEach(neuron => {{
             ctx.fillStyle = neuron.color;
@@ -158,9 +185,29 @@ def brain_electrical_signals_background(num_neurons=32):
         return progress < 1;
     }}
 
+    function degrade() {{
+        // Sustained slow frames: drop a quarter of the neurons and the signals in flight.
+        const target = Math.max(minNeurons, Math.floor(neurons.length * 0.75));
+        if (target < neurons.length) {{
+            neurons.length = target;
+            numNeurons = target;
+            signals = signals.slice(-Math.floor(maxSignals / 2));
+        }}
+        slowFrames = 0;
+    }}
+
     function animate(currentTime) {{
+        rafId = requestAnimationFrame(animate);
+        const elapsed = currentTime - lastFrame;
+        if (elapsed < frameInterval) return;
+        // Keep motion speed independent of the frame rate, but don't jump after a long stall.
+        const step = lastFrame ? Math.min(elapsed, 100) / 16.7 : 1;
+        lastFrame = currentTime - (elapsed % frameInterval);
+
+        const frameStart = performance.now();
         ctx.clearRect(0, 0, width, height);
-        updateNeuronPositions(currentTime);
+        updateNeuronPositions(step);
+        buildGrid();
         drawNeurons();
 
         signals = signals.filter(signal => drawFlowingElectricity(signal, currentTime));
@@ -174,7 +221,7 @@ def brain_electrical_signals_background(num_neurons=32):
                     for (let i = 0; i < nearbyNeurons.length; i++) {{
                         if (i !== s) {{
                             const targetNeuron = nearbyNeurons[i];
-                            if (Math.random() < 0.1) {{  // Increased probability for more signals
+                            if (signals.length < maxSignals && Math.random() < 0.1) {{  // Increased probability for more signals
                                 signals.push({{
                                     path: createZigZagPath(sourceNeuron.x, sourceNeuron.y, targetNeuron.x, targetNeuron.y),
                                     startTime: currentTime
@@ -186,17 +233,54 @@ def brain_electrical_signals_background(num_neurons=32):
             }}
         }}
 
-        requestAnimationFrame(animate);
+        frameCost = frameCost * 0.9 + (performance.now() - frameStart) * 0.1;
+        if (frameCost > frameInterval * 0.5) {{
+            if (++slowFrames > 30) degrade();
+        }} else {{
+            slowFrames = 0;
+        }}
     }}
 
     function getNearbyNeurons(x, y, maxDistance) {{
-        return neurons.filter(neuron => {{
-            const dx = neuron.x - x;
-            const dy = neuron.y - y;
-            return Math.sqrt(dx * dx + dy * dy) < maxDistance;
-        }});
+        const nearby = [];
+        const maxSq = maxDistance * maxDistance;
+        const reach = Math.ceil(maxDistance / cellSize);
+        const cx = Math.floor(x / cellSize);
+        const cy = Math.floor(y / cellSize);
+        for (let gx = cx - reach; gx <= cx + reach; gx++) {{
+            for (let gy = cy - reach; gy <= cy + reach; gy++) {{
+                const cell = grid.get(cellKey(gx, gy));
+                if (!cell) continue;
+                for (const neuron of cell) {{
+                    const dx = neuron.x - x;
+                    const dy = neuron.y - y;
+                    if (dx * dx + dy * dy < maxSq) nearby.push(neuron);
+                }}
+            }}
+        }}
+        return nearby;
+    }}
+
+    function start() {{
+        if (rafId === null) {{
+            lastFrame = 0;
+            rafId = requestAnimationFrame(animate);
+        }}
+    }}
+
+    function stop() {{
+        if (rafId !== null) {{
+            cancelAnimationFrame(rafId);
+            rafId = null;
+        }}
     }}
 
+    // Stop drawing entirely while the tab is hidden.
+    document.addEventListener('visibilitychange', () => {{
+        if (document.hidden) stop();
+        else start();
+    }});
+
     let lastInteractionPos = {{ x: null, y: null }};
 
     function startInteraction(x, y) {{
@@ -232,6 +316,7 @@ def brain_electrical_signals_background(num_neurons=32):
     canvas.addEventListener('touchend', stopInteraction);
 
     initializeNeurons();
-    requestAnimationFrame(animate);
+    buildGrid();
+    if (!document.hidden) start();
     </script>
     """)
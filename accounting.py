@@ -0,0 +1,135 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import metrics
+from settings import get_float, get_int
+
+# Context windows for the Groq models we use; unknown models fall back to the smallest.
+MODEL_CONTEXT_TOKENS = {
+    "llama3-8b-8192": 8192,
+    "llama3-70b-8192": 8192,
+    "llama-3.1-8b-instant": 131072,
+    "llama-3.1-70b-versatile": 131072,
+    "mixtral-8x7b-32768": 32768,
+    "gemma2-9b-it": 8192,
+}
+DEFAULT_CONTEXT_TOKENS = 8192
+
+# Rough chars-per-token ratio for English text with Llama-style tokenizers.
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+
+def context_limit(model: str) -> int:
+    return MODEL_CONTEXT_TOKENS.get(model, DEFAULT_CONTEXT_TOKENS)
+
+
+def fit_to_context(
+        chunks: List[str],
+        model: str,
+        max_tokens: int,
+        overhead_tokens: int
+) -> Tuple[List[str], List[int]]:
+    # Split chunks whose prompt would overflow the model context; return indexes we cannot send at all.
+    budget = context_limit(model) - max_tokens - overhead_tokens
+    if budget <= 0:
+        return [], list(range(len(chunks)))
+    max_chars = budget * CHARS_PER_TOKEN
+    fitted = []
+    for chunk in chunks:
+        if estimate_tokens(chunk) <= budget:
+            fitted.append(chunk)
+        else:
+            fitted.extend(chunk[i:i + max_chars] for i in range(0, len(chunk), max_chars))
+    return fitted, []
+
+
+@dataclass
+class TokenTotals:
+    requests: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    total_time: float = 0.0
+    prompt_tokens_saved: int = 0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+
+class TokenLedger:
+    def __init__(self, max_keys: int = 200):
+        self._lock = threading.Lock()
+        self._max_keys = max_keys
+        self._by: Dict[str, "OrderedDict[str, TokenTotals]"] = {
+            "job": OrderedDict(), "url": OrderedDict(), "instruction": OrderedDict()
+        }
+
+    def record(self, usage: Dict[str, Any], job_id: Optional[str], url: Optional[str], instruction: str) -> None:
+        with self._lock:
+            for dimension, key in (("job", job_id), ("url", url), ("instruction", instruction)):
+                if key is None:
+                    continue
+                table = self._by[dimension]
+                totals = table.pop(key, None) or TokenTotals()
+                totals.requests += 1
+                totals.prompt_tokens += usage.get("prompt_tokens", 0)
+                totals.completion_tokens += usage.get("completion_tokens", 0)
+                totals.total_time += usage.get("total_time", 0.0)
+                totals.prompt_tokens_saved += usage.get("prompt_tokens_saved", 0)
+                table[key] = totals
+                if len(table) > self._max_keys:
+                    table.popitem(last=False)
+
+    def totals(self, dimension: str) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                key: {**asdict(totals), "total_tokens": totals.total_tokens}
+                for key, totals in self._by[dimension].items()
+            }
+
+
+ledger = TokenLedger()
+
+
+@dataclass
+class JobBudget:
+    max_tokens: Optional[int] = None
+    max_seconds: Optional[float] = None
+    spent_tokens: int = 0
+    started_at: Optional[float] = None
+
+    @classmethod
+    def from_settings(cls) -> "JobBudget":
+        return cls(max_tokens=get_int("JOB_TOKEN_BUDGET"), max_seconds=get_float("JOB_TIME_BUDGET"))
+
+    def start(self) -> None:
+        if self.started_at is None:
+            self.started_at = time.monotonic()
+
+    def charge(self, tokens: int) -> None:
+        self.spent_tokens += tokens
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at if self.started_at is not None else 0.0
+
+    def exceeded(self, upcoming_tokens: int = 0) -> Optional[str]:
+        if self.max_tokens is not None and self.spent_tokens + upcoming_tokens > self.max_tokens:
+            return f"token budget of {self.max_tokens} exceeded"
+        if self.max_seconds is not None and self.elapsed() > self.max_seconds:
+            return f"time budget of {self.max_seconds:g}s exceeded"
+        return None
+
+
+def record_usage(usage: Dict[str, Any], url: Optional[str], instruction: str,
+                 budget: Optional[JobBudget] = None) -> None:
+    ledger.record(usage, metrics.current_job_id(), url, instruction)
+    if budget is not None:
+        budget.charge(usage.get("total_tokens", 0))
@@ -0,0 +1,338 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass, asdict
+from typing import Any, Callable, Dict, List, Optional
+
+import large_page
+from llm_backends import FakeBackend
+from scraper import scrape_website, extract_url, clean_url, batch_max_url
+from structured_data import extract_structured
+
+PAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_pages")
+
+
+class FakeElement:
+    tag_name = "body"
+
+
+class FakeWebDriver:
+    # Just enough of selenium's Remote for scrape_website and WebDriverWait.
+    def __init__(self, page_source: str, load_delay: float = 0.0):
+        self.page_source = page_source
+        self.load_delay = load_delay
+        self.current_url = None
+
+    def get(self, url: str) -> None:
+        self.current_url = url
+        if self.load_delay:
+            time.sleep(self.load_delay)
+
+    def find_element(self, by: str, value: str) -> FakeElement:
+        return FakeElement()
+
+    def execute_script(self, script: str, *args: Any) -> Any:
+        # Only the scripts large_page uses to stream the DOM out of the browser.
+        if script == large_page.SNAPSHOT_SCRIPT:
+            return len(self.page_source)
+        if script == large_page.SLICE_SCRIPT:
+            return self.page_source[args[0]:args[1]]
+        return None
+
+    def quit(self) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.quit()
+
+
+def fake_driver_factory(page_source: str, load_delay: float = 0.0) -> Callable[[Any], FakeWebDriver]:
+    return lambda chrome_options: FakeWebDriver(page_source, load_delay)
+
+
+def load_pages(names: Optional[List[str]] = None, scale: int = 1) -> Dict[str, str]:
+    pages = {}
+    for file_name in sorted(os.listdir(PAGES_DIR)):
+        name, ext = os.path.splitext(file_name)
+        if ext != ".html" or (names and name not in names):
+            continue
+        with open(os.path.join(PAGES_DIR, file_name), encoding="utf-8") as f:
+            html = f.read()
+        if scale > 1 and "<body>" in html and "</body>" in html:
+            head, rest = html.split("<body>", 1)
+            body, tail = rest.split("</body>", 1)
+            html = f"{head}<body>{body * scale}</body>{tail}"
+        pages[name] = html
+    return pages
+
+
+@dataclass
+class StageResult:
+    stage: str
+    page: str
+    runs: int
+    median_s: float
+    min_s: float
+    bytes_in: int
+    bytes_out: int
+    throughput_mb_s: float
+    peak_mem_kb: float
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    prompt_tokens_saved: int = 0
+
+
+def _size(value: Any) -> int:
+    if value is None:
+        return 0
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    if isinstance(value, list):
+        return sum(_size(item) for item in value)
+    return len(json.dumps(value, default=str).encode("utf-8"))
+
+
+def measure(stage: str, page: str, fn: Callable[[], Any], bytes_in: int, repeat: int) -> (StageResult, Any):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - started)
+
+    # tracemalloc slows allocation-heavy code down, so peak memory gets its own run.
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    median = statistics.median(timings)
+    return StageResult(
+        stage=stage,
+        page=page,
+        runs=repeat,
+        median_s=round(median, 6),
+        min_s=round(min(timings), 6),
+        bytes_in=bytes_in,
+        bytes_out=_size(result),
+        throughput_mb_s=round(bytes_in / median / 1e6, 3) if median else 0.0,
+        peak_mem_kb=round(peak / 1024, 1),
+    ), result
+
+
+def run_pipeline(page: str, html: str, args: argparse.Namespace) -> List[StageResult]:
+    results = []
+    factory = fake_driver_factory(html, args.load_delay)
+    spilled = []
+
+    def scrape():
+        result = scrape_website(f"https://bench.local/{page}", factory)
+        if isinstance(result, large_page.SpilledPage):
+            spilled.append(result)
+        return result
+
+    stage, page_source = measure("scrape_website", page, scrape, _size(html), args.repeat)
+    results.append(stage)
+    # Pages over LARGE_PAGE_CHARS come back as temp files; only the one measured below is kept.
+    for extra in spilled:
+        if extra is not page_source:
+            extra.close()
+
+    if isinstance(page_source, large_page.SpilledPage):
+        with page_source:
+            stage, cleaned = measure("clean_spilled", page, lambda: large_page.clean_spilled(page_source),
+                                     len(page_source), args.repeat)
+        results.append(stage)
+    else:
+        stage, extracted = measure("extract_url", page, lambda: extract_url(page_source), _size(page_source),
+                                   args.repeat)
+        results.append(stage)
+
+        stage, cleaned = measure("clean_url", page, lambda: clean_url(extracted), _size(extracted), args.repeat)
+        results.append(stage)
+
+        stage, _ = measure("extract_structured", page, lambda: extract_structured(page_source), _size(page_source),
+                           args.repeat)
+        results.append(stage)
+
+    stage, data_bits = measure(
+        "batch_max_url", page, lambda: batch_max_url(cleaned, args.chunk_size), _size(cleaned), args.repeat)
+    results.append(stage)
+
+    from llm_parser import async_groq_parser
+
+    def analyze():
+        backend = FakeBackend(
+            latency=args.llm_latency,
+            error_rate=args.llm_error_rate,
+            rate_limit_rate=args.llm_rate_limit_rate,
+            seed=args.seed,
+        )
+        return asyncio.run(async_groq_parser(
+            data_bits, "extract the product names and prices", batch_size=args.batch_size,
+            backend=backend, retry_min_wait=0, retry_max_wait=0))
+
+    stage, analysis = measure("async_groq_parser", page, analyze, _size(data_bits), args.llm_repeat)
+    stage.prompt_tokens = sum(item["usage"]["prompt_tokens"] for item in analysis if "usage" in item)
+    stage.completion_tokens = sum(item["usage"]["completion_tokens"] for item in analysis if "usage" in item)
+    stage.prompt_tokens_saved = sum(item["usage"]["prompt_tokens_saved"] for item in analysis if "usage" in item)
+    results.append(stage)
+    return results
+
+
+def compare(current: List[Dict[str, Any]], baseline_path: str, tolerance: float, min_delta: float) -> List[str]:
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(r["stage"], r["page"]): r for r in json.load(f)["results"]}
+    regressions = []
+    for result in current:
+        previous = baseline.get((result["stage"], result["page"]))
+        if previous is None or not previous["median_s"]:
+            continue
+        ratio = result["median_s"] / previous["median_s"]
+        # Sub-millisecond stages are dominated by timer noise.
+        if ratio > 1 + tolerance and result["median_s"] - previous["median_s"] > min_delta:
+            regressions.append(
+                f"{result['stage']}[{result['page']}]: {previous['median_s']:.4f}s -> {result['median_s']:.4f}s "
+                f"({ratio:.2f}x)")
+    return regressions
+
+
+# Cumulative import budgets (ms) with streamlit already loaded, as it is inside `streamlit run`.
+IMPORT_BUDGETS_MS = {"main": 600, "llm_parser": 300, "scraper": 500}
+
+
+def measure_import(module: str, preload: str = "streamlit") -> Dict[str, Any]:
+    # -X importtime writes "import time: self [us] | cumulative | imported package" lines to stderr.
+    code = f"import {preload}; import {module}" if preload else f"import {module}"
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True,
+                          cwd=os.path.dirname(os.path.abspath(__file__)))
+    entries = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if not parts[0].strip().isdigit():
+            continue
+        entries.append((len(parts[2]) - len(parts[2].lstrip()), int(parts[1]), parts[2].strip()))
+
+    cumulative, children = None, []
+    for index, (indent, micros, name) in enumerate(entries):
+        if name != module or (cumulative is not None and micros <= cumulative):
+            continue
+        # Children are printed before their parent, one indent level deeper.
+        cumulative, children = micros, []
+        for child_indent, child_micros, child_name in reversed(entries[:index]):
+            if child_indent <= indent:
+                break
+            if child_indent == indent + 2:
+                children.append((child_micros, child_name))
+    children.sort(reverse=True)
+    return {
+        "module": module,
+        "cumulative_ms": round(cumulative / 1000, 1) if cumulative is not None else None,
+        "heaviest": [{"name": name, "ms": round(micros / 1000, 1)} for micros, name in children[:5]],
+        "returncode": proc.returncode,
+    }
+
+
+def check_imports(budgets: Dict[str, float], repeat: int) -> int:
+    failures = []
+    report = []
+    for module, budget in budgets.items():
+        # Best of N: cold disk caches and background threads only ever add time.
+        runs = [measure_import(module) for _ in range(repeat)]
+        best = min(runs, key=lambda r: r["cumulative_ms"] if r["cumulative_ms"] is not None else float("inf"))
+        best["budget_ms"] = budget
+        report.append(best)
+        if best["returncode"] or best["cumulative_ms"] is None:
+            failures.append(f"{module}: import failed")
+        elif best["cumulative_ms"] > budget:
+            failures.append(f"{module}: {best['cumulative_ms']:.0f}ms > {budget:.0f}ms budget")
+    print(json.dumps(report, indent=2))
+    for line in failures:
+        print(f"REGRESSION {line}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    arg_parser = argparse.ArgumentParser(description="Benchmark the scrape -> clean -> chunk -> analyze pipeline")
+    arg_parser.add_argument("--pages", nargs="*", help="Fixture page names (default: all in benchmark_pages/)")
+    arg_parser.add_argument("--scale", type=int, default=1, help="Repeat each page body this many times")
+    arg_parser.add_argument("--repeat", type=int, default=5)
+    arg_parser.add_argument("--llm-repeat", type=int, default=1)
+    arg_parser.add_argument("--chunk-size", type=int, default=6000)
+    arg_parser.add_argument("--batch-size", type=int, default=5)
+    arg_parser.add_argument("--load-delay", type=float, default=0.0, help="Simulated page load time (s)")
+    arg_parser.add_argument("--llm-latency", type=float, default=0.05)
+    arg_parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    arg_parser.add_argument("--llm-rate-limit-rate", type=float, default=0.0)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("--output", help="Write JSON results here instead of stdout")
+    arg_parser.add_argument("--baseline", help="Previous JSON results to compare against")
+    arg_parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown vs baseline")
+    arg_parser.add_argument("--min-delta", type=float, default=0.005, help="Ignore slowdowns smaller than this (s)")
+    arg_parser.add_argument("--imports", action="store_true",
+                            help="Check import times against IMPORT_BUDGETS_MS instead of running the pipeline")
+    arg_parser.add_argument("--import-budget", nargs="*", default=[], metavar="MODULE=MS",
+                            help="Override or add an import budget")
+    args = arg_parser.parse_args(argv)
+
+    if args.imports:
+        budgets = dict(IMPORT_BUDGETS_MS)
+        for item in args.import_budget:
+            module, ms = item.split("=", 1)
+            budgets[module] = float(ms)
+        return check_imports(budgets, args.repeat)
+
+    logging.disable(logging.CRITICAL)
+
+    results = []
+    for page, html in load_pages(args.pages, args.scale).items():
+        results.extend(asdict(r) for r in run_pipeline(page, html, args))
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "commit": _git_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance, args.min_delta)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+import json
+import logging
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Iterable, Optional, Tuple
+
+from settings import get_int, get_setting
+
+logger = logging.getLogger(__name__)
+
+# Phrases that identify a block page, by category. Extend with BLOCK_SIGNATURES='{"category": ["phrase"]}'.
+DEFAULT_SIGNATURES: Dict[str, Tuple[str, ...]] = {
+    "access_denied": ("access denied", "403 forbidden", "you don't have permission to access",
+                      "request blocked", "you have been blocked", "sorry, you have been blocked"),
+    "captcha": ("captcha", "verify you are human", "verify you are a human", "are you a robot",
+                "prove you're not a robot", "i'm not a robot"),
+    "bot_challenge": ("just a moment...", "checking your browser", "attention required! | cloudflare",
+                      "ddos protection by", "enable javascript and cookies to continue",
+                      "please enable js and disable any ad blocker"),
+    "rate_limited": ("too many requests", "rate limit exceeded", "unusual traffic from your computer"),
+}
+
+# Challenge widgets in the markup. Legitimate pages embed some of these in forms, so they only count on pages
+# with little visible text.
+CHALLENGE_MARKERS = re.compile(
+    r"cf-challenge|/cdn-cgi/challenge-platform|cf-turnstile|g-recaptcha|h-captcha|px-captcha|"
+    r"_incapsula_resource|datadome|perimeterx",
+    re.IGNORECASE,
+)
+
+BLOCK_STATUSES = {401: "access_denied", 403: "access_denied", 407: "access_denied", 429: "rate_limited",
+                  503: "bot_challenge"}
+
+# Only the start of the page is scanned; block pages are short and always announce themselves up front.
+SCAN_CHARS = get_int("BLOCK_SCAN_CHARS", 200_000)
+# Pages with more visible text than this are real content, even if they mention "captcha" somewhere.
+SMALL_TEXT_CHARS = get_int("BLOCK_SMALL_TEXT_CHARS", 3000)
+
+_TITLE = re.compile(r"<title[^>]*>(.*?)</title\s*>", re.IGNORECASE | re.DOTALL)
+_BODY = re.compile(r"<body[\s>]", re.IGNORECASE)
+_INVISIBLE = re.compile(r"<script\b.*?</script\s*>|<style\b.*?</style\s*>|<noscript\b.*?</noscript\s*>|<!--.*?-->",
+                        re.IGNORECASE | re.DOTALL)
+_TAG = re.compile(r"<[^>]+>")
+_SPACE = re.compile(r"\s+")
+_WORDS = re.compile(r"[\W_]+")
+
+
+@dataclass
+class BlockVerdict:
+    blocked: bool
+    category: Optional[str] = None
+    reason: Optional[str] = None
+
+    def __bool__(self) -> bool:
+        return self.blocked
+
+
+class BlockDetector:
+    def __init__(self, signatures: Dict[str, Iterable[str]]):
+        self._categories = {}
+        for category, phrases in signatures.items():
+            for phrase in phrases:
+                self._categories[phrase.lower()] = category
+        # Longest phrases first so overlapping signatures report the most specific one.
+        alternation = "|".join(re.escape(p) for p in sorted(self._categories, key=len, reverse=True))
+        self._pattern = re.compile(alternation, re.IGNORECASE)
+
+    def _match(self, text: str) -> Optional[Tuple[str, str]]:
+        found = self._pattern.search(text)
+        if found is None:
+            return None
+        phrase = found.group(0).lower()
+        return self._categories[phrase], phrase
+
+    def detect(
+            self,
+            html: Optional[str],
+            status: Optional[int] = None,
+            total_chars: Optional[int] = None
+    ) -> BlockVerdict:
+        if not html:
+            return BlockVerdict(False)
+        head = html[:SCAN_CHARS]
+        total_chars = total_chars if total_chars is not None else len(html)
+
+        title = _TITLE.search(head)
+        title_text = _SPACE.sub(" ", title.group(1)).strip() if title else ""
+        # A page is "small" when all of its text fits in the scanned window and there is little of it.
+        small = False
+        if total_chars <= SCAN_CHARS:
+            body = _BODY.search(head)
+            visible = _SPACE.sub(" ", _TAG.sub(" ", _INVISIBLE.sub(" ", head[body.start():] if body else head))).strip()
+            small = len(visible) < SMALL_TEXT_CHARS
+
+        if status in BLOCK_STATUSES and small:
+            return BlockVerdict(True, BLOCK_STATUSES[status], f"HTTP {status}")
+
+        # Block pages are titled with just the phrase ("Access Denied", "Just a moment..."); on pages with real
+        # content, an article titled "How CAPTCHA works" is not one.
+        match = self._match(title_text)
+        if match and (small or _WORDS.sub(" ", title_text).strip().lower() == _WORDS.sub(" ", match[1]).strip()):
+            return BlockVerdict(True, match[0], f"title contains {match[1]!r}")
+
+        if small:
+            match = self._match(visible)
+            if match:
+                return BlockVerdict(True, match[0], f"page text contains {match[1]!r}")
+            marker = CHALLENGE_MARKERS.search(head)
+            if marker:
+                return BlockVerdict(True, "bot_challenge", f"challenge widget {marker.group(0).lower()!r}")
+
+        return BlockVerdict(False)
+
+
+def _load_signatures() -> Dict[str, Iterable[str]]:
+    signatures: Dict[str, Iterable[str]] = dict(DEFAULT_SIGNATURES)
+    extra = get_setting("BLOCK_SIGNATURES")
+    if extra:
+        try:
+            for category, phrases in (json.loads(extra) if isinstance(extra, str) else dict(extra)).items():
+                signatures[category] = tuple(signatures.get(category, ())) + tuple(phrases)
+        except (TypeError, ValueError) as e:
+            logger.warning("Ignoring invalid BLOCK_SIGNATURES: %s", e)
+    return signatures
+
+
+@lru_cache(maxsize=1)
+def default_detector() -> BlockDetector:
+    return BlockDetector(_load_signatures())
+
+
+def detect_block(
+        html: Optional[str],
+        status: Optional[int] = None,
+        total_chars: Optional[int] = None
+) -> BlockVerdict:
+    return default_detector().detect(html, status, total_chars)
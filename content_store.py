@@ -0,0 +1,89 @@
+import hashlib
+import threading
+import weakref
+from collections.abc import Sequence
+from typing import Any, Dict, List, Union, overload
+
+import metrics
+
+
+class StoredContent:
+    # One cleaned page shared by every session that scraped it. Sessions hold this handle, never a copy of the
+    # text; the store only keeps a weak reference, so the text goes away with the last session using it.
+    __slots__ = ("text", "content_digest", "structured", "__weakref__")
+
+    def __init__(self, text: str, digest: str, structured: Any = None):
+        self.text = text
+        self.content_digest = digest
+        # Tables and metadata extracted from the page's markup (structured_data.StructuredData), if any
+        self.structured = structured
+
+    def __len__(self) -> int:
+        return len(self.text)
+
+    def __str__(self) -> str:
+        return self.text
+
+    def __repr__(self) -> str:
+        return f"StoredContent({self.content_digest[:8]}, {len(self.text)} chars)"
+
+    def chunks(self, max_length: int = 6000) -> "ChunkList":
+        return ChunkList(self, max_length)
+
+
+class ChunkList(Sequence):
+    # Fixed-size chunks of a StoredContent as offsets; the text is sliced only when a chunk is read.
+    __slots__ = ("content", "max_length")
+
+    def __init__(self, content: StoredContent, max_length: int = 6000):
+        self.content = content
+        self.max_length = max_length
+
+    def __len__(self) -> int:
+        return -(-len(self.content.text) // self.max_length)
+
+    @overload
+    def __getitem__(self, index: int) -> str: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> List[str]: ...
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[str, List[str]]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("chunk index out of range")
+        start = index * self.max_length
+        return self.content.text[start:start + self.max_length]
+
+    def __repr__(self) -> str:
+        return f"ChunkList({self.content!r}, {len(self)} x {self.max_length})"
+
+
+class ContentStore:
+    def __init__(self):
+        self._entries: "weakref.WeakValueDictionary[str, StoredContent]" = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+
+    def put(self, text: str, structured: Any = None) -> StoredContent:
+        digest = hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                if entry.structured is None:
+                    entry.structured = structured
+                metrics.inc("content_store_hits")
+                return entry
+            entry = self._entries[digest] = StoredContent(text, digest, structured)
+        metrics.inc("content_store_misses")
+        return entry
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            entries = list(self._entries.values())
+        return {"pages": len(entries), "chars": sum(len(entry.text) for entry in entries)}
+
+
+content_store = ContentStore()
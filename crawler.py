@@ -0,0 +1,301 @@
+import argparse
+import hashlib
+import heapq
+import itertools
+import json
+import logging
+import posixpath
+import re
+import sys
+import xml.etree.ElementTree as ElementTree
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional, Pattern, Sequence, Set, Tuple
+from urllib.parse import parse_qsl, urldefrag, urlencode, urljoin, urlsplit, urlunsplit
+
+import metrics
+from content_store import ChunkList, StoredContent, content_store
+from search_index import index_content
+from settings import get_float, get_int
+
+logger = logging.getLogger(__name__)
+
+SITEMAP_TIMEOUT = get_float("SITEMAP_TIMEOUT", 10.0)
+MAX_SITEMAP_URLS = get_int("MAX_SITEMAP_URLS", 5000)
+
+_TRACKING_PARAMS = re.compile(r"^(utm_\w+|gclid|fbclid|msclkid|mc_cid|mc_eid|_ga|ref)$", re.IGNORECASE)
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+# Links to files we cannot turn into text.
+_SKIPPED_EXTENSIONS = re.compile(
+    r"\.(jpe?g|png|gif|svg|webp|ico|css|js|pdf|zip|gz|tar|mp[34]|avi|mov|woff2?|ttf|exe|dmg)$", re.IGNORECASE)
+
+
+def normalize_url(url: str, base: Optional[str] = None) -> Optional[str]:
+    # Canonical form used for deduplication: absolute, no fragment, lowercase host, default port and
+    # tracking parameters removed, query parameters sorted.
+    url = urldefrag(urljoin(base, url.strip()) if base else url.strip())[0]
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    if scheme not in _DEFAULT_PORTS or not parts.hostname:
+        return None
+    host = parts.hostname.lower()
+    if parts.port and parts.port != _DEFAULT_PORTS[scheme]:
+        host = f"{host}:{parts.port}"
+    path = parts.path or "/"
+    if "/." in path:
+        # Resolve ./ and ../ segments, keeping a trailing slash
+        path = posixpath.normpath(path) + ("/" if path.endswith("/") and path != "/" else "")
+        path = "/" + path.lstrip("/")
+    query = urlencode(sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                             if not _TRACKING_PARAMS.match(k)))
+    return urlunsplit((scheme, host, path, query, ""))
+
+
+def _site(host: str) -> str:
+    host = host.split(":")[0]
+    return host[4:] if host.startswith("www.") else host
+
+
+class SeenSet:
+    # Exact dedup on 8-byte digests instead of full URL strings; a collision needs ~2^32 URLs.
+    def __init__(self):
+        self._digests: Set[bytes] = set()
+
+    def add(self, url: str) -> bool:
+        digest = hashlib.blake2b(url.encode("utf-8"), digest_size=8).digest()
+        if digest in self._digests:
+            return False
+        self._digests.add(digest)
+        return True
+
+    def __len__(self) -> int:
+        return len(self._digests)
+
+
+@dataclass
+class CrawlConfig:
+    max_pages: int = 20
+    max_depth: int = 2
+    same_site: bool = True
+    allowed_domains: Sequence[str] = ()
+    include_patterns: Sequence[str] = ()
+    exclude_patterns: Sequence[str] = ()
+    use_sitemap: bool = False
+    workers: int = 2
+
+
+@dataclass
+class CrawlResult:
+    url: str
+    depth: int
+    text: Optional[str] = None
+    links: int = 0
+    error: Optional[str] = None
+
+
+@dataclass(order=True)
+class _Entry:
+    priority: float
+    seq: int
+    url: str = field(compare=False)
+    depth: int = field(compare=False)
+
+
+class Frontier:
+    # Lowest priority first: shallow pages before deep ones, sitemap priority as a tie-breaker.
+    def __init__(self, config: CrawlConfig, seed: str):
+        self.config = config
+        self.seen = SeenSet()
+        self._heap: List[_Entry] = []
+        self._seq = itertools.count()
+        seed_host = urlsplit(seed).hostname or ""
+        self._sites = {_site(seed_host)} if config.same_site else set()
+        self._sites.update(_site(d.lower()) for d in config.allowed_domains)
+        self._include: List[Pattern] = [re.compile(p) for p in config.include_patterns]
+        self._exclude: List[Pattern] = [re.compile(p) for p in config.exclude_patterns]
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def allowed(self, url: str, patterns: bool = True) -> bool:
+        parts = urlsplit(url)
+        if self._sites:
+            host = _site(parts.hostname or "")
+            if not any(host == site or host.endswith("." + site) for site in self._sites):
+                return False
+        if _SKIPPED_EXTENSIONS.search(parts.path):
+            return False
+        if not patterns:
+            return True
+        if self._exclude and any(p.search(url) for p in self._exclude):
+            return False
+        return not self._include or any(p.search(url) for p in self._include)
+
+    def push(self, url: str, depth: int, base: Optional[str] = None, boost: float = 0.0) -> bool:
+        url = normalize_url(url, base)
+        # The seed is where links are found, so URL patterns only apply to the pages below it.
+        if url is None or depth > self.config.max_depth or not self.allowed(url, depth > 0) or not self.seen.add(url):
+            return False
+        heapq.heappush(self._heap, _Entry(depth - boost, next(self._seq), url, depth))
+        return True
+
+    def pop(self) -> Tuple[str, int]:
+        entry = heapq.heappop(self._heap)
+        return entry.url, entry.depth
+
+
+def _fetch_text(url: str) -> str:
+    import requests
+    response = requests.get(url, timeout=SITEMAP_TIMEOUT)
+    response.raise_for_status()
+    return response.text
+
+
+def sitemap_urls(seed: str, fetch: Callable[[str], str] = _fetch_text) -> Iterator[Tuple[str, float]]:
+    # (url, priority) from /sitemap.xml, following one level of sitemap index.
+    parts = urlsplit(seed)
+    pending = [urlunsplit((parts.scheme, parts.netloc, "/sitemap.xml", "", ""))]
+    yielded = 0
+    for depth in range(2):
+        nested = []
+        for sitemap in pending:
+            try:
+                root = ElementTree.fromstring(fetch(sitemap))
+            except Exception as e:
+                logger.info("No usable sitemap at %s: %s", sitemap, e)
+                continue
+            for element in root:
+                tag = element.tag.rsplit("}", 1)[-1]
+                values = {child.tag.rsplit("}", 1)[-1]: (child.text or "").strip() for child in element}
+                if not values.get("loc"):
+                    continue
+                if tag == "sitemap":
+                    nested.append(values["loc"])
+                elif tag == "url":
+                    try:
+                        priority = float(values.get("priority") or 0.5)
+                    except ValueError:
+                        priority = 0.5
+                    yield values["loc"], priority
+                    yielded += 1
+                    if yielded >= MAX_SITEMAP_URLS:
+                        return
+        pending = nested
+
+
+def fetch_page(url: str) -> Tuple[str, List[str]]:
+    # One Selenium session per page, as in scrape_website; returns cleaned text and raw hrefs.
+    from large_page import SpilledPage, clean_spilled
+    from scraper import clean_url, extract_url, scrape_website
+
+    page = scrape_website(url)
+    if page is None:
+        raise RuntimeError("Failed to fetch webpage content")
+    links: List[str] = []
+    if isinstance(page, SpilledPage):
+        with page:
+            return clean_spilled(page, links=links), links
+    return clean_url(extract_url(page, links=links)), links
+
+
+def crawl(
+        seed: str,
+        config: Optional[CrawlConfig] = None,
+        fetch: Callable[[str], Tuple[str, List[str]]] = fetch_page,
+        progress_callback: Optional[Callable[[int, str], None]] = None,
+        sitemap_fetch: Callable[[str], str] = _fetch_text
+) -> Iterator[CrawlResult]:
+    config = config or CrawlConfig()
+    seed = normalize_url(seed)
+    if seed is None:
+        raise ValueError("Crawling needs an absolute http(s) URL")
+    frontier = Frontier(config, seed)
+    frontier.push(seed, 0)
+    if config.use_sitemap:
+        for url, priority in sitemap_urls(seed, sitemap_fetch):
+            # Sitemap pages are treated as one level below the seed, ordered by their declared priority.
+            frontier.push(url, 1, boost=priority)
+
+    done = 0
+    running: Dict[Future, Tuple[str, int]] = {}
+    with ThreadPoolExecutor(max_workers=config.workers, thread_name_prefix="crawl") as pool:
+        while running or (len(frontier) and done + len(running) < config.max_pages):
+            while len(frontier) and len(running) < config.workers and done + len(running) < config.max_pages:
+                url, depth = frontier.pop()
+                running[pool.submit(fetch, url)] = (url, depth)
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                url, depth = running.pop(future)
+                done += 1
+                try:
+                    text, links = future.result()
+                except Exception as e:
+                    logger.warning("Crawl fetch failed: %s", e, extra={"url": url})
+                    metrics.inc("crawl_errors")
+                    yield CrawlResult(url, depth, error=str(e))
+                else:
+                    added = sum(frontier.push(link, depth + 1, base=url) for link in links)
+                    metrics.inc("crawl_pages")
+                    logger.debug("Crawled page", extra={"url": url, "depth": depth, "links": len(links),
+                                                        "queued": added})
+                    yield CrawlResult(url, depth, text=text, links=len(links))
+                if progress_callback:
+                    progress_callback(min(99, int(done / config.max_pages * 100)),
+                                      f"Crawled {done} of up to {config.max_pages} pages ({len(frontier)} queued)")
+
+
+def crawl_to_store(
+        url: str,
+        progress_callback: Callable[[int, str], None],
+        config: Optional[CrawlConfig] = None,
+        fetch: Callable[[str], Tuple[str, List[str]]] = fetch_page
+) -> Tuple[StoredContent, ChunkList]:
+    # Same contract as scraper.scrape_to_store: all crawled pages as one stored text, each under its URL.
+    sections = []
+    with metrics.span("crawl"):
+        for result in crawl(url, config, fetch, progress_callback):
+            if result.text:
+                sections.append(f"# {result.url}\n{result.text}")
+                index_content(result.url, content_store.put(result.text))
+    if not sections:
+        raise RuntimeError("Failed to fetch webpage content")
+    content = content_store.put("\n\n".join(sections))
+    progress_callback(100, f"Crawl complete: {len(sections)} pages")
+    return content, content.chunks(6000)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    arg_parser = argparse.ArgumentParser(description="Crawl a site from a seed URL and list the pages found")
+    arg_parser.add_argument("seed")
+    arg_parser.add_argument("--max-pages", type=int, default=20)
+    arg_parser.add_argument("--max-depth", type=int, default=2)
+    arg_parser.add_argument("--workers", type=int, default=2)
+    arg_parser.add_argument("--sitemap", action="store_true", help="Also queue URLs from /sitemap.xml")
+    arg_parser.add_argument("--any-site", action="store_true", help="Follow links to other sites")
+    arg_parser.add_argument("--allow-domain", action="append", default=[])
+    arg_parser.add_argument("--include", action="append", default=[], help="Regex URLs must match")
+    arg_parser.add_argument("--exclude", action="append", default=[], help="Regex URLs must not match")
+    arg_parser.add_argument("--output", help="Write JSON lines here instead of stdout")
+    args = arg_parser.parse_args(argv)
+
+    from log_config import configure_logging
+    configure_logging()
+
+    config = CrawlConfig(max_pages=args.max_pages, max_depth=args.max_depth, same_site=not args.any_site,
+                         allowed_domains=args.allow_domain, include_patterns=args.include,
+                         exclude_patterns=args.exclude, use_sitemap=args.sitemap, workers=args.workers)
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        for result in crawl(args.seed, config):
+            out.write(json.dumps({"url": result.url, "depth": result.depth, "chars": len(result.text or ""),
+                                  "links": result.links, "error": result.error}) + "\n")
+            out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,196 @@
+import io
+import json
+from itertools import islice
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, TYPE_CHECKING
+
+import streamlit as st
+
+import metrics
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+XLSX_MAX_ROWS = 1048576
+_PREPARED_PREFIX = "_export_"
+
+EXPORT_MIME_TYPES = {
+    "txt": "text/plain",
+    "json": "application/json",
+    "jsonl": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+TEXT_FORMATS = ("txt", "json", "jsonl")
+
+_USAGE_FIELDS = (
+    ("prompt_tokens", "int64"),
+    ("completion_tokens", "int64"),
+    ("total_tokens", "int64"),
+    ("queue_time", "float64"),
+    ("prompt_time", "float64"),
+    ("completion_time", "float64"),
+    ("total_time", "float64"),
+    ("prompt_tokens_saved", "int64"),
+)
+
+
+def _excel_rows(df: "pd.DataFrame") -> Iterator[tuple]:
+    import pandas as pd
+    # Convert whole columns to Excel-native values up front, then stream rows.
+    columns = {}
+    for name in df.columns:
+        column = df[name]
+        if pd.api.types.is_datetime64_any_dtype(column):
+            column = column.dt.tz_localize(None) if column.dt.tz is not None else column
+            column = column.astype(object)
+        elif not (pd.api.types.is_numeric_dtype(column) or pd.api.types.is_bool_dtype(column)):
+            column = column.map(lambda v: json.dumps(v, default=str) if isinstance(v, (list, dict)) else v)
+        columns[name] = column.astype(object).where(column.notna(), None)
+    return zip(*columns.values()) if columns else iter(())
+
+
+def dataframes_to_xlsx(sheets: Dict[str, "pd.DataFrame"]) -> bytes:
+    import pandas as pd
+    import xlsxwriter
+
+    buffer = io.BytesIO()
+    # constant_memory flushes each row to a temp file as it is written instead of keeping every cell.
+    workbook = xlsxwriter.Workbook(buffer, {"constant_memory": True, "strings_to_urls": False})
+    date_format = workbook.add_format({"num_format": "yyyy-mm-dd hh:mm:ss"})
+    with metrics.span("export", format="xlsx"):
+        for title, df in sheets.items():
+            worksheet = workbook.add_worksheet(title[:31])
+            for index, name in enumerate(df.columns):
+                if pd.api.types.is_datetime64_any_dtype(df[name]):
+                    worksheet.set_column(index, index, 19, date_format)
+            worksheet.write_row(0, 0, [str(c) for c in df.columns])
+            for row_number, row in enumerate(_excel_rows(df), start=1):
+                if row_number >= XLSX_MAX_ROWS:
+                    break
+                worksheet.write_row(row_number, 0, row)
+        workbook.close()
+    return buffer.getvalue()
+
+
+def lazy_download_button(
+        label: str,
+        build: Callable[[], bytes],
+        file_name: str,
+        mime: str,
+        key: str,
+        prepare_label: Optional[str] = None
+) -> None:
+    # The file is only built after the user asks for it, and dropped again once downloaded.
+    state_key = f"{_PREPARED_PREFIX}{key}"
+    if state_key not in st.session_state:
+        if st.button(prepare_label or f"Prepare {file_name}", key=f"{key}_prepare"):
+            with st.spinner(f"Preparing {file_name}..."):
+                st.session_state[state_key] = build()
+        else:
+            return
+
+    st.download_button(
+        label=label,
+        data=st.session_state[state_key],
+        file_name=file_name,
+        mime=mime,
+        key=f"{key}_download",
+        on_click=lambda: st.session_state.pop(state_key, None),
+    )
+
+
+def discard_prepared() -> None:
+    # Files prepared but never downloaded belong to the previous results.
+    for state_key in [k for k in st.session_state if str(k).startswith(_PREPARED_PREFIX)]:
+        del st.session_state[state_key]
+
+
+def _result_schema():
+    import pyarrow as pa
+    # One row per result with a fixed schema; content stays JSON since its shape depends on the prompt.
+    return pa.schema(
+        [("chunk", pa.int64()), ("model", pa.string()), ("error", pa.string()), ("content", pa.string()),
+         ("source", pa.string()), ("skipped", pa.string()), ("score", pa.float64())]
+        + [(name, getattr(pa, kind)()) for name, kind in _USAGE_FIELDS]
+    )
+
+
+def _record_batches(results: Iterable[Dict[str, Any]], batch_size: int) -> Iterator[Any]:
+    import pyarrow as pa
+    schema = _result_schema()
+    iterator = iter(results)
+    while True:
+        batch: List[Dict[str, Any]] = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        usages = [item.get("usage") or {} for item in batch]
+        columns = {
+            # The page chunk a result came from; null when it is not known (local results, split chunks).
+            "chunk": [item.get("chunk") for item in batch],
+            "model": [item.get("model") for item in batch],
+            "error": [item.get("error") for item in batch],
+            "content": [json.dumps(item["content"], default=str) if "content" in item else None for item in batch],
+            "source": [item.get("source") for item in batch],
+            "skipped": [item.get("skipped") for item in batch],
+            "score": [item.get("score") for item in batch],
+        }
+        for name, _ in _USAGE_FIELDS:
+            columns[name] = [usage.get(name) for usage in usages]
+        yield pa.RecordBatch.from_pydict(columns, schema=schema)
+
+
+def write_jsonl(results: Iterable[Dict[str, Any]], sink: BinaryIO) -> int:
+    start = sink.tell()
+    for item in results:
+        sink.write(json.dumps(item, default=str).encode("utf-8"))
+        sink.write(b"\n")
+    return sink.tell() - start
+
+
+def write_parquet(results: Iterable[Dict[str, Any]], sink: BinaryIO, batch_size: int = 1000) -> int:
+    import pyarrow.parquet as pq
+    start = sink.tell()
+    with pq.ParquetWriter(sink, _result_schema(), compression="zstd") as writer:
+        for batch in _record_batches(results, batch_size):
+            writer.write_batch(batch)
+    return sink.tell() - start
+
+
+def write_arrow(results: Iterable[Dict[str, Any]], sink: BinaryIO, batch_size: int = 1000) -> int:
+    import pyarrow as pa
+    start = sink.tell()
+    with pa.ipc.new_stream(sink, _result_schema()) as writer:
+        for batch in _record_batches(results, batch_size):
+            writer.write_batch(batch)
+    return sink.tell() - start
+
+
+def export_results(results: List[Dict[str, Any]], format_type: str) -> bytes:
+    # Returns the encoded file once; callers take len() for the size instead of re-encoding.
+    with metrics.span("export", format=format_type):
+        if format_type in ("txt", "json"):
+            from llm_parser import format_parsed_result
+            return format_parsed_result(results, format_type).encode("utf-8")
+        writers = {"jsonl": write_jsonl, "parquet": write_parquet, "arrow": write_arrow}
+        buffer = io.BytesIO()
+        writers[format_type](results, buffer)
+        return buffer.getvalue()
+
+
+def describe_export(data: bytes, format_type: str, max_rows: int = 5) -> str:
+    # Text preview for binary formats, read back from the bytes we already built.
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    source = pa.BufferReader(data)
+    if format_type == "parquet":
+        parquet_file = pq.ParquetFile(source)
+        schema, rows = parquet_file.schema_arrow, parquet_file.metadata.num_rows
+        head = parquet_file.read_row_group(0).slice(0, max_rows) if parquet_file.num_row_groups else None
+    else:
+        table = pa.ipc.open_stream(source).read_all()
+        schema, rows, head = table.schema, table.num_rows, table.slice(0, max_rows)
+    preview = [f"{rows} rows", str(schema)]
+    if head is not None:
+        preview.append(head.to_pandas().to_string(max_colwidth=40))
+    return "\n\n".join(preview)
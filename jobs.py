@@ -0,0 +1,103 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, List, Optional
+
+import metrics
+from settings import get_int
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    status: str = QUEUED
+    progress: int = 0
+    message: str = "Queued"
+    result: Any = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    future: Optional[Future] = field(default=None, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED, CANCELLED)
+
+    def take_result(self) -> Any:
+        # The result usually holds page text and parsed results; once a session has it, the job lets go of it
+        # so finished jobs kept for status do not pin content for the whole server.
+        result, self.result = self.result, None
+        return result
+
+    def update(self, progress: int, message: str) -> None:
+        # Same signature as the progress_callback taken by scrape_with_progress and async_groq_parser.
+        self.progress, self.message = progress, message
+
+
+class JobExecutor:
+    # One pool per server process. Sessions keep only the job id, so a rerun or a second tab never restarts work.
+    def __init__(self, max_workers: int, max_finished: int = 200):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.max_finished = max_finished
+
+    def submit(self, kind: str, fn: Callable[..., Any], *args, **kwargs) -> Job:
+        job = Job(id=metrics.new_job_id(), kind=kind)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        job.future = self._pool.submit(self._run, job, fn, args, kwargs)
+        metrics.inc("jobs_submitted", kind=kind)
+        return job
+
+    def _run(self, job: Job, fn: Callable[..., Any], args: tuple, kwargs: dict) -> None:
+        job.status, job.started_at = RUNNING, time.time()
+        metrics.record_span("job_queue", job.started_at - job.created_at, job_id=job.id)
+        try:
+            with metrics.job_context(job.id):
+                job.result = fn(*args, progress_callback=job.update, **kwargs)
+            job.status = DONE
+        except Exception as e:
+            logger.exception("Background %s job failed", job.kind, extra={"job_id": job.id})
+            job.error, job.status = str(e), FAILED
+            metrics.inc("jobs_failed", kind=job.kind)
+        finally:
+            job.finished_at = time.time()
+
+    def get(self, job_id: Optional[str]) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id) if job_id else None
+
+    def cancel(self, job_id: str) -> bool:
+        # Only queued jobs can be cancelled; running scrapes and LLM calls are left to finish.
+        job = self.get(job_id)
+        if job is None or job.future is None or not job.future.cancel():
+            return False
+        job.status, job.finished_at = CANCELLED, time.time()
+        return True
+
+    def active(self) -> List[Job]:
+        with self._lock:
+            return [job for job in self._jobs.values() if not job.finished]
+
+    def _prune(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
+
+
+executor = JobExecutor(max_workers=get_int("JOB_WORKERS", 4))
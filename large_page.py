@@ -0,0 +1,168 @@
+import codecs
+import logging
+import mmap
+import os
+import tempfile
+from html.parser import HTMLParser
+from typing import Iterator, List, Optional
+
+import metrics
+from settings import get_int, get_setting
+
+logger = logging.getLogger(__name__)
+
+# Pages longer than LARGE_PAGE_CHARS are streamed out of the browser into a temp file and processed in
+# WINDOW_CHARS pieces; anything beyond MAX_PAGE_CHARS is dropped.
+LARGE_PAGE_CHARS = get_int("LARGE_PAGE_CHARS", 5_000_000)
+MAX_PAGE_CHARS = get_int("MAX_PAGE_CHARS", 100_000_000)
+WINDOW_CHARS = get_int("PAGE_WINDOW_CHARS", 1_000_000)
+SPILL_DIR = get_setting("SPILL_DIR")
+
+# Serialize the DOM once in the browser and hand it over in slices, so Python never holds the whole page.
+SNAPSHOT_SCRIPT = "window.__scraperHtml = document.documentElement.outerHTML; return window.__scraperHtml.length;"
+SLICE_SCRIPT = "return window.__scraperHtml.substring(arguments[0], arguments[1]);"
+RELEASE_SCRIPT = "delete window.__scraperHtml;"
+
+_SKIPPED_TAGS = {"script", "style"}
+
+
+class SpilledPage:
+    # Raw HTML on disk, read back through a memory map.
+    def __init__(self, path: str, chars: int, truncated: bool = False):
+        self.path = path
+        self.chars = chars
+        self.truncated = truncated
+
+    def __len__(self) -> int:
+        return self.chars
+
+    def __enter__(self) -> "SpilledPage":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def close(self) -> None:
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def head(self, size: int) -> str:
+        with open(self.path, "rb") as f:
+            return f.read(size).decode("utf-8", errors="ignore")
+
+    def windows(self, size: int = WINDOW_CHARS) -> Iterator[str]:
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        with open(self.path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                for offset in range(0, len(mapped), size):
+                    yield decoder.decode(mapped[offset:offset + size])
+        tail = decoder.decode(b"", final=True)
+        if tail:
+            yield tail
+
+
+def _spill(pieces: Iterator[str], chars: int) -> SpilledPage:
+    handle = tempfile.NamedTemporaryFile("wb", prefix="page-", suffix=".html", dir=SPILL_DIR, delete=False)
+    with handle:
+        for piece in pieces:
+            handle.write(piece.encode("utf-8", errors="replace"))
+    truncated = chars > MAX_PAGE_CHARS
+    if truncated:
+        logger.warning("Page truncated to MAX_PAGE_CHARS", extra={"chars": chars, "max_chars": MAX_PAGE_CHARS})
+        metrics.inc("pages_truncated")
+    metrics.inc("pages_spilled")
+    return SpilledPage(handle.name, min(chars, MAX_PAGE_CHARS), truncated)
+
+
+def page_length(driver) -> Optional[int]:
+    # None when the driver cannot run scripts; the caller falls back to page_source.
+    try:
+        length = driver.execute_script(SNAPSHOT_SCRIPT)
+    except Exception as e:
+        logger.debug("Could not measure page in the browser: %s", e)
+        return None
+    return int(length) if length is not None else None
+
+
+def release_snapshot(driver) -> None:
+    try:
+        driver.execute_script(RELEASE_SCRIPT)
+    except Exception:
+        pass
+
+
+def spill_from_driver(driver, chars: int, window: int = WINDOW_CHARS) -> SpilledPage:
+    limit = min(chars, MAX_PAGE_CHARS)
+
+    def pieces() -> Iterator[str]:
+        try:
+            for start in range(0, limit, window):
+                yield driver.execute_script(SLICE_SCRIPT, start, min(start + window, limit)) or ""
+        finally:
+            release_snapshot(driver)
+
+    return _spill(pieces(), chars)
+
+
+class _TextExtractor(HTMLParser):
+    # Streaming equivalent of extract_url + clean_url: text inside <body>, minus script/style,
+    # as stripped non-empty lines.
+    def __init__(self, links: Optional[List[str]] = None):
+        super().__init__(convert_charrefs=True)
+        self.lines: List[str] = []
+        self.links = links
+        self._in_body = False
+        self._skip_depth = 0
+        self._pending: List[str] = []
+
+    def handle_starttag(self, tag, attrs):
+        self._flush()
+        if tag == "body":
+            self._in_body = True
+        elif tag == "a" and self.links is not None:
+            href = dict(attrs).get("href")
+            if href:
+                self.links.append(href)
+        elif tag in _SKIPPED_TAGS:
+            self._skip_depth += 1
+
+    def handle_endtag(self, tag):
+        self._flush()
+        if tag == "body":
+            self._in_body = False
+        elif tag in _SKIPPED_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+
+    def handle_data(self, data):
+        # A text node can arrive split across feed() calls; join it before splitting into lines.
+        if self._in_body and not self._skip_depth:
+            self._pending.append(data)
+
+    def _flush(self) -> None:
+        if self._pending:
+            text = "".join(self._pending)
+            self._pending.clear()
+            self.lines.extend(line.strip() for line in text.splitlines() if line.strip())
+
+    def close(self):
+        super().close()
+        self._flush()
+
+
+def iter_clean_lines(page: SpilledPage, window: int = WINDOW_CHARS,
+                     links: Optional[List[str]] = None) -> Iterator[str]:
+    extractor = _TextExtractor(links)
+    for piece in page.windows(window):
+        extractor.feed(piece)
+        yield from extractor.lines
+        extractor.lines.clear()
+    extractor.close()
+    yield from extractor.lines
+
+
+def clean_spilled(page: SpilledPage, window: int = WINDOW_CHARS, links: Optional[List[str]] = None) -> str:
+    return "\n".join(iter_clean_lines(page, window, links))
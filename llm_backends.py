@@ -0,0 +1,324 @@
+import asyncio
+import json
+import logging
+import random
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, List, Optional, Protocol
+
+from settings import get_setting, get_float, get_int
+
+logger = logging.getLogger(__name__)
+
+Messages = List[Dict[str, str]]
+
+_USAGE_TIMINGS = ("completion_time", "prompt_time", "queue_time", "total_time")
+
+
+class BackendError(Exception):
+    pass
+
+
+class ServerError(BackendError):
+    pass
+
+
+class RateLimitError(BackendError):
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+@dataclass
+class Completion:
+    content: str
+    model: str
+    usage: Dict[str, Any]
+
+
+class LLMBackend(Protocol):
+    name: str
+
+    async def complete(self, messages: Messages, model: str, temperature: float, max_tokens: int) -> Completion:
+        ...
+
+    async def aclose(self) -> None:
+        ...
+
+
+def _fill_usage(usage: Dict[str, Any], elapsed: float) -> Dict[str, Any]:
+    # OpenAI-compatible servers only report token counts; Groq also reports timings.
+    usage = dict(usage or {})
+    for key in ("completion_tokens", "prompt_tokens", "total_tokens"):
+        usage[key] = int(usage.get(key) or 0)
+    for key in _USAGE_TIMINGS:
+        usage[key] = float(usage.get(key) or 0.0)
+    if not usage["total_time"]:
+        usage["total_time"] = elapsed
+    return usage
+
+
+class GroqBackend:
+    name = "groq"
+
+    def __init__(self, api_key: str):
+        from groq import AsyncGroq
+        # GroqParser owns the retry policy; SDK retries on top of it would multiply attempts and Retry-After waits.
+        self.client = AsyncGroq(api_key=api_key, max_retries=0)
+
+    async def complete(self, messages: Messages, model: str, temperature: float, max_tokens: int) -> Completion:
+        import groq
+        started = time.perf_counter()
+        try:
+            chat_completion = await self.client.chat.completions.create(
+                messages=messages,
+                model=model,
+                temperature=temperature,
+                max_tokens=max_tokens,
+            )
+        except groq.RateLimitError as e:
+            retry_after = e.response.headers.get("retry-after") if e.response is not None else None
+            raise RateLimitError(str(e), float(retry_after) if retry_after else None) from e
+        except (groq.InternalServerError, groq.APIConnectionError) as e:
+            # APITimeoutError is an APIConnectionError
+            raise ServerError(str(e)) from e
+        return Completion(
+            content=chat_completion.choices[0].message.content,
+            model=chat_completion.model,
+            usage=_fill_usage(chat_completion.usage.dict(), time.perf_counter() - started),
+        )
+
+    async def aclose(self) -> None:
+        await self.client.close()
+
+
+class OpenAICompatibleBackend:
+    name = "openai"
+
+    def __init__(self, base_url: str, api_key: Optional[str] = None, timeout: float = 60.0):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.timeout = timeout
+        self._session = None
+
+    def _get_session(self):
+        import aiohttp
+        if self._session is None or self._session.closed:
+            headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+            self._session = aiohttp.ClientSession(headers=headers, timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self._session
+
+    async def complete(self, messages: Messages, model: str, temperature: float, max_tokens: int) -> Completion:
+        payload = {"messages": messages, "model": model, "temperature": temperature, "max_tokens": max_tokens}
+        started = time.perf_counter()
+        async with self._get_session().post(f"{self.base_url}/chat/completions", json=payload) as resp:
+            if resp.status == 429:
+                retry_after = resp.headers.get("Retry-After")
+                raise RateLimitError(await resp.text(), float(retry_after) if retry_after else None)
+            if resp.status >= 500:
+                raise ServerError(f"HTTP {resp.status}: {await resp.text()}")
+            if resp.status >= 400:
+                raise BackendError(f"HTTP {resp.status}: {await resp.text()}")
+            body = await resp.json()
+        return Completion(
+            content=body["choices"][0]["message"]["content"],
+            model=body.get("model", model),
+            usage=_fill_usage(body.get("usage", {}), time.perf_counter() - started),
+        )
+
+    async def aclose(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+
+def _default_fake_responder(messages: Messages, model: str) -> str:
+    prompt = messages[-1]["content"]
+    words = prompt.split()
+    return json.dumps({"word_count": len(words), "sample": " ".join(words[-8:])})
+
+
+@dataclass
+class FakeBackendStats:
+    calls: int = 0
+    errors: int = 0
+    rate_limited: int = 0
+    completed: int = 0
+    max_in_flight: int = 0
+
+
+class FakeBackend:
+    name = "fake"
+
+    def __init__(
+            self,
+            latency: float = 0.05,
+            jitter: float = 0.0,
+            error_rate: float = 0.0,
+            rate_limit_rate: float = 0.0,
+            requests_per_minute: Optional[int] = None,
+            max_concurrency: Optional[int] = None,
+            seed: Optional[int] = None,
+            responder: Optional[Callable[[Messages, str], str]] = None,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.requests_per_minute = requests_per_minute
+        self.max_concurrency = max_concurrency
+        self.responder = responder or _default_fake_responder
+        self.stats = FakeBackendStats()
+        self._random = random.Random(seed)
+        self._window: Deque[float] = deque()
+        self._in_flight = 0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _check_rate_limit(self, now: float) -> None:
+        if self.requests_per_minute:
+            while self._window and now - self._window[0] >= 60:
+                self._window.popleft()
+            if len(self._window) >= self.requests_per_minute:
+                raise RateLimitError("Rate limit reached (fake)", retry_after=60 - (now - self._window[0]))
+            self._window.append(now)
+        if self.rate_limit_rate and self._random.random() < self.rate_limit_rate:
+            raise RateLimitError("Rate limit reached (fake)", retry_after=1.0)
+
+    async def complete(self, messages: Messages, model: str, temperature: float, max_tokens: int) -> Completion:
+        self.stats.calls += 1
+        try:
+            self._check_rate_limit(time.monotonic())
+        except RateLimitError:
+            self.stats.rate_limited += 1
+            raise
+
+        if self.max_concurrency and self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        queued = time.perf_counter()
+        if self._semaphore is not None:
+            await self._semaphore.acquire()
+        queue_time = time.perf_counter() - queued
+        self._in_flight += 1
+        self.stats.max_in_flight = max(self.stats.max_in_flight, self._in_flight)
+        try:
+            latency = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+            await asyncio.sleep(latency)
+            if self.error_rate and self._random.random() < self.error_rate:
+                self.stats.errors += 1
+                raise ServerError("Internal server error (fake)")
+            content = self.responder(messages, model)
+        finally:
+            self._in_flight -= 1
+            if self._semaphore is not None:
+                self._semaphore.release()
+
+        self.stats.completed += 1
+        prompt_tokens = sum(len(m["content"]) for m in messages) // 4
+        completion_tokens = min(max_tokens, len(content) // 4)
+        return Completion(
+            content=content,
+            model=model,
+            usage={
+                "completion_tokens": completion_tokens,
+                "prompt_tokens": prompt_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "completion_time": latency * 0.7,
+                "prompt_time": latency * 0.3,
+                "queue_time": queue_time,
+                "total_time": latency + queue_time,
+            },
+        )
+
+    async def aclose(self) -> None:
+        pass
+
+
+def create_backend(config: Optional[Dict[str, Any]] = None) -> LLMBackend:
+    def setting(name: str, default: Any = None) -> Any:
+        if config is not None:
+            return config.get(name, default)
+        return get_setting(name, default)
+
+    def number(name: str, cast: Callable, default: Any) -> Any:
+        if config is not None:
+            value = config.get(name)
+            return default if value is None else cast(value)
+        return (get_int if cast is int else get_float)(name, default)
+
+    kind = str(setting("LLM_BACKEND", "groq")).lower()
+    if kind == "groq":
+        return GroqBackend(api_key=setting("GROQ_API_KEY"))
+    if kind == "openai":
+        return OpenAICompatibleBackend(
+            base_url=setting("OPENAI_BASE_URL", "http://127.0.0.1:8808/v1"),
+            api_key=setting("OPENAI_API_KEY"),
+            timeout=number("OPENAI_TIMEOUT", float, 60.0),
+        )
+    if kind == "fake":
+        return FakeBackend(
+            latency=number("FAKE_LATENCY", float, 0.05),
+            jitter=number("FAKE_JITTER", float, 0.0),
+            error_rate=number("FAKE_ERROR_RATE", float, 0.0),
+            rate_limit_rate=number("FAKE_RATE_LIMIT_RATE", float, 0.0),
+            requests_per_minute=number("FAKE_RPM", int, None),
+            max_concurrency=number("FAKE_MAX_CONCURRENCY", int, None),
+            seed=number("FAKE_SEED", int, None),
+        )
+    raise ValueError(f"Unknown LLM_BACKEND: {kind}")
+
+
+def create_fake_app(backend: FakeBackend):
+    from aiohttp import web
+
+    async def chat_completions(request: web.Request) -> web.Response:
+        payload = await request.json()
+        try:
+            completion = await backend.complete(
+                payload["messages"],
+                payload.get("model", "fake"),
+                payload.get("temperature", 0.2),
+                payload.get("max_tokens", 1000),
+            )
+        except RateLimitError as e:
+            headers = {"Retry-After": f"{e.retry_after:.0f}"} if e.retry_after else {}
+            return web.json_response({"error": {"message": str(e)}}, status=429, headers=headers)
+        except BackendError as e:
+            return web.json_response({"error": {"message": str(e)}}, status=500)
+        return web.json_response({
+            "model": completion.model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": completion.content}}],
+            "usage": completion.usage,
+        })
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    return app
+
+
+if __name__ == "__main__":
+    import argparse
+    from aiohttp import web
+
+    arg_parser = argparse.ArgumentParser(description="Serve a fake OpenAI-compatible chat completions endpoint")
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=8808)
+    arg_parser.add_argument("--latency", type=float, default=0.05)
+    arg_parser.add_argument("--jitter", type=float, default=0.0)
+    arg_parser.add_argument("--error-rate", type=float, default=0.0)
+    arg_parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    arg_parser.add_argument("--rpm", type=int, default=None)
+    arg_parser.add_argument("--max-concurrency", type=int, default=None)
+    arg_parser.add_argument("--seed", type=int, default=None)
+    args = arg_parser.parse_args()
+
+    fake = FakeBackend(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        requests_per_minute=args.rpm,
+        max_concurrency=args.max_concurrency,
+        seed=args.seed,
+    )
+    web.run_app(create_fake_app(fake), host=args.host, port=args.port)
@@ -1,31 +1,37 @@
 import asyncio
 import json
-from typing import List, Dict, Any, Callable, Optional, Union
-import pandas as pd
-import io
-from groq import AsyncGroq
+from typing import List, Dict, Any, Callable, Optional, Sequence, Tuple, Union, TYPE_CHECKING
 import streamlit as st
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
-import aiohttp
+from tenacity import AsyncRetrying, RetryCallState, stop_after_attempt, wait_exponential, retry_if_exception_type
 import logging
 from dataclasses import dataclass
 from pydantic import BaseModel, Field
-import plotly.express as px
-import base64
-from openpyxl import Workbook
-import numpy as np
-
-# Set up logging
-logging.basicConfig(level=logging.INFO)
+import metrics
+from accounting import JobBudget, estimate_tokens, fit_to_context, record_usage
+from prompt_compaction import compact_prompt, restore
+from render_cache import cached
+from result_normalizer import ResultNormalizer
+from relevance import select_chunks
+from structured_data import StructuredData, route
+from llm_backends import LLMBackend, GroqBackend, RateLimitError, ServerError, create_backend
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# pandas, plotly (via viz) and the exporters are imported inside the functions that render results,
+# so pages that never show results do not pay for them at startup.
 logger = logging.getLogger(__name__)
 
+DEFAULT_MODEL = "llama3-8b-8192"
+DEFAULT_MAX_TOKENS = 1000
+
 
 class AnalysisRequest(BaseModel):
     text: str
     instruction: str
-    model: str = Field(default="llama3-8b-8192")
+    model: str = Field(default=DEFAULT_MODEL)
     temperature: float = Field(default=0.2, ge=0, le=1)
-    max_tokens: int = Field(default=1000, ge=1)
+    max_tokens: int = Field(default=DEFAULT_MAX_TOKENS, ge=1)
 
 
 class Usage(BaseModel):
@@ -36,6 +42,7 @@ class Usage(BaseModel):
     prompt_time: float
     queue_time: float
     total_time: float
+    prompt_tokens_saved: int = 0
 
 
 class AnalysisResponse(BaseModel):
@@ -51,65 +58,99 @@ class AnalysisResult:
     error: Optional[str] = None
 
 
+def _honor_retry_after(backoff: Callable[[RetryCallState], float]) -> Callable[[RetryCallState], float]:
+    # A 429 that says how long to wait is waited out in full, even when the backoff would retry sooner.
+    def wait(retry_state: RetryCallState) -> float:
+        delay = backoff(retry_state)
+        error = retry_state.outcome.exception() if retry_state.outcome is not None else None
+        retry_after = getattr(error, "retry_after", None) if isinstance(error, RateLimitError) else None
+        return max(delay, retry_after) if retry_after else delay
+    return wait
+
+
 class GroqParser:
-    def __init__(self, api_key: str):
-        self.client = AsyncGroq(api_key=api_key)
-        self.session = aiohttp.ClientSession()
+    def __init__(
+            self,
+            api_key: Optional[str] = None,
+            backend: Optional[LLMBackend] = None,
+            max_attempts: int = 3,
+            retry_min_wait: float = 4,
+            retry_max_wait: float = 10
+    ):
+        # A caller-supplied backend may be shared between parsers, so only close the ones we create.
+        self._owns_backend = backend is None
+        self.backend = backend if backend is not None else GroqBackend(api_key=api_key)
+        self.max_attempts = max_attempts
+        self.retry_min_wait = retry_min_wait
+        self.retry_max_wait = retry_max_wait
 
     async def __aenter__(self):
         return self
 
     async def __aexit__(self, exc_type, exc, tb):
-        await self.session.close()
+        if self._owns_backend:
+            await self.backend.aclose()
+
+    async def _complete(self, messages: List[Dict[str, str]], request: AnalysisRequest):
+        import aiohttp
+        retrying = AsyncRetrying(
+            stop=stop_after_attempt(self.max_attempts),
+            wait=_honor_retry_after(wait_exponential(multiplier=1, min=self.retry_min_wait, max=self.retry_max_wait)),
+            retry=retry_if_exception_type((aiohttp.ClientError, asyncio.TimeoutError, RateLimitError, ServerError)),
+            before_sleep=lambda retry_state: metrics.inc("retries", stage="llm"),
+            reraise=True
+        )
+        async for attempt in retrying:
+            with attempt:
+                return await self.backend.complete(
+                    messages,
+                    model=request.model,
+                    temperature=request.temperature,
+                    max_tokens=request.max_tokens,
+                )
 
-    @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=4, max=10),
-        retry=retry_if_exception_type((aiohttp.ClientError, asyncio.TimeoutError))
-    )
     async def analyze_text(self, request: AnalysisRequest) -> AnalysisResult:
         try:
-            prompt = self._get_prompt(request.text, request.instruction)
-
-            chat_completion = await self.client.chat.completions.create(
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are an AI assistant specialized in analyzing and extracting information from text based on specific instructions. Always provide your response in a structured JSON format."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                model=request.model,
-                temperature=request.temperature,
-                max_tokens=request.max_tokens,
-            )
-
-            parsed_content = self._parse_response(chat_completion.choices[0].message.content)
+            prompt = compact_prompt(request.text, request.instruction)
+
+            with metrics.span("llm_request", model=request.model):
+                completion = await self._complete(
+                    [
+                        {
+                            "role": "system",
+                            "content": prompt.system
+                        },
+                        {
+                            "role": "user",
+                            "content": prompt.user
+                        }
+                    ],
+                    request
+                )
+
+            # URLs and IDs swapped for placeholders in the prompt are put back in the answer
+            parsed_content = restore(self._parse_response(completion.content), prompt.placeholders)
 
             response = AnalysisResponse(
                 content=parsed_content,
-                model=chat_completion.model,
-                usage=Usage(**chat_completion.usage.dict())
+                model=completion.model,
+                usage=Usage(**completion.usage, prompt_tokens_saved=prompt.tokens_saved)
             )
+            metrics.record_span("llm_queue", response.usage.queue_time)
+            metrics.record_span("llm_prompt", response.usage.prompt_time)
+            metrics.record_span("llm_completion", response.usage.completion_time)
+            metrics.inc("llm_tokens", response.usage.prompt_tokens, kind="prompt")
+            metrics.inc("llm_tokens", response.usage.completion_tokens, kind="completion")
+            metrics.inc("llm_tokens_saved", prompt.tokens_saved)
+            logger.debug("Prompt compaction saved %d tokens", prompt.tokens_saved,
+                         extra={"placeholders": len(prompt.placeholders)})
 
             return AnalysisResult(success=True, data=response)
         except Exception as e:
-            logger.error(f"Error in analyze_text: {str(e)}")
+            logger.error("Error in analyze_text: %s", e)
+            metrics.inc("llm_errors")
             return AnalysisResult(success=False, error=str(e))
 
-    @staticmethod
-    def _get_prompt(text: str, instruction: str) -> str:
-        return f"""Analyze the following text and {instruction}. 
-        Provide your response in a clear, structured JSON format.
-        Ensure all keys in the JSON are strings and all values are either strings, numbers, booleans, or arrays of these types.
-
-        Text to analyze:
-        {text}
-        """
-
     @staticmethod
     def _parse_response(response: str) -> Dict[str, Any]:
         try:
@@ -126,46 +167,176 @@ class GroqParser:
             return {"raw_response": response}
 
 
+def prompt_overhead(instruction: str) -> int:
+    # Tokens every chunk's request carries besides the chunk itself, from the same prompt analyze_text sends.
+    prompt = compact_prompt("", instruction)
+    return estimate_tokens(prompt.system + prompt.user)
+
+
+def fit_chunks(data_bits: Sequence[str], instruction: str) -> Tuple[List[str], int, List[Dict[str, Any]]]:
+    # Chunks split to fit the model's context window, the per-chunk prompt overhead, and one error per chunk
+    # when the instruction alone is too long to send anything.
+    overhead = prompt_overhead(instruction)
+    fitted, rejected = fit_to_context(list(data_bits), DEFAULT_MODEL, DEFAULT_MAX_TOKENS, overhead)
+    if rejected:
+        logger.warning("Instruction too long for %s, rejected %d chunks", DEFAULT_MODEL, len(rejected))
+        return [], overhead, [{"error": "The instruction is too long for the model's context window"}
+                              for _ in rejected]
+    return fitted, overhead, []
+
+
+def budget_stop_results(stop_reason: str, skipped: int) -> List[Dict[str, Any]]:
+    logger.warning("Stopped analysis early: %s, skipped %d chunks", stop_reason, skipped)
+    metrics.inc("budget_stops")
+    return [{"error": f"Skipped: {stop_reason}"} for _ in range(skipped)]
+
+
+def within_budget(batch: List[str], overhead: int, budget: JobBudget) -> tuple:
+    # Keep as much of the batch as the budget allows, using estimated prompt tokens.
+    upcoming = 0
+    for n, bit in enumerate(batch):
+        upcoming += estimate_tokens(bit) + overhead
+        reason = budget.exceeded(upcoming)
+        if reason:
+            return batch[:n], reason
+    return batch, None
+
+
 async def async_groq_parser(
         data_bits: List[str],
         instruction: str,
         progress_callback: Optional[Callable[[int, str], None]] = None,
-        batch_size: int = 5
+        batch_size: int = 5,
+        backend: Optional[LLMBackend] = None,
+        url: Optional[str] = None,
+        budget: Optional[JobBudget] = None,
+        normalizer: Optional[ResultNormalizer] = None,
+        **parser_options
 ) -> List[Dict[str, Any]]:
-    async with GroqParser(st.secrets["GROQ_API_KEY"]) as parser:
+    data_bits, overhead, rejected = fit_chunks(data_bits, instruction)
+    if rejected:
+        return rejected
+
+    if budget is not None:
+        budget.start()
+
+    # Backends built from config belong to this call and are closed with it.
+    owns_backend = backend is None
+    if owns_backend:
+        backend = create_backend()
+    async with GroqParser(backend=backend, **parser_options) as parser:
+        parser._owns_backend = owns_backend
+
         async def process_batch(batch: List[str], start_index: int) -> tuple[Any]:
             tasks = [
                 parser.analyze_text(AnalysisRequest(text=bit, instruction=instruction))
                 for bit in batch
             ]
             results = await asyncio.gather(*tasks)
+            for result in results:
+                if result.success:
+                    record_usage(result.data.usage.dict(), url, instruction, budget)
+                    if normalizer is not None:
+                        normalizer.add(result.data.dict())
             if progress_callback:
                 progress = int((start_index + len(batch)) / len(data_bits) * 100)
                 progress_callback(progress, f"Analyzed {start_index + len(batch)} of {len(data_bits)} bits")
             return results
 
         all_results = []
+        stop_reason = None
         for i in range(0, len(data_bits), batch_size):
             batch = data_bits[i:i + batch_size]
-            batch_results = await process_batch(batch, i)
-            all_results.extend(batch_results)
-
-        if progress_callback:
-            progress_callback(100, "Analysis complete!")
-
-        return [
+            if budget is not None:
+                batch, stop_reason = within_budget(batch, overhead, budget)
+            if batch:
+                batch_results = await process_batch(batch, i)
+                all_results.extend(batch_results)
+            if stop_reason:
+                break
+
+        results = [
             result.data.dict() if result.success else {"error": result.error}
             for result in all_results
         ]
 
+        if stop_reason:
+            results.extend(budget_stop_results(stop_reason, len(data_bits) - len(results)))
+            if progress_callback:
+                progress_callback(100, f"Analysis stopped early: {stop_reason}")
+        elif progress_callback:
+            progress_callback(100, "Analysis complete!")
+
+        return results
+
+
+# (chunks, instruction, progress_callback, url, budget, normalizer) -> one result per chunk sent
+Analyzer = Callable[[List[str], str, Optional[Callable[[int, str], None]], Optional[str], JobBudget,
+                     ResultNormalizer], List[Dict[str, Any]]]
+
+
+def analyze_locally(
+        data_bits: List[str],
+        instruction: str,
+        progress_callback: Optional[Callable[[int, str], None]],
+        url: Optional[str],
+        budget: JobBudget,
+        normalizer: ResultNormalizer
+) -> List[Dict[str, Any]]:
+    return asyncio.run(async_groq_parser(data_bits, instruction, progress_callback, url=url, budget=budget,
+                                         normalizer=normalizer))
+
+
+def run_analysis(
+        data_bits: List[str],
+        instruction: str,
+        progress_callback: Optional[Callable[[int, str], None]] = None,
+        url: Optional[str] = None,
+        structured: Optional[StructuredData] = None,
+        hints: Sequence[str] = (),
+        analyze: Analyzer = analyze_locally
+) -> Tuple[List[Dict[str, Any]], ResultNormalizer]:
+    # No Streamlit calls in here, so it can run on a background job thread. `analyze` sends the chunks to
+    # the LLM, in this process by default or through the task queue in worker mode.
+    normalizer = ResultNormalizer()
+    # Table and metadata requests are answered from the page's markup; the LLM gets whatever is left.
+    routed = route(instruction, data_bits, structured)
+    normalizer.extend(routed.local_results)
+    results = list(routed.local_results)
+    if routed.reason:
+        logger.info("Structured data fast path: %s", routed.reason,
+                    extra={"local_results": len(routed.local_results), "chunks": len(routed.data_bits)})
+    if routed.data_bits:
+        # Only chunks that could answer the instruction are sent
+        selection = select_chunks(routed.data_bits, instruction, hints)
+        if progress_callback and selection.skipped:
+            progress_callback(0, f"Analyzing {len(selection.kept)} of {len(routed.data_bits)} chunks "
+                                 "relevant to the instruction")
+        results.extend(selection.number_results(analyze(
+            [routed.data_bits[i] for i in selection.kept], instruction, progress_callback, url,
+            JobBudget.from_settings(), normalizer)))
+        results.extend(selection.skipped_results())
+    elif progress_callback:
+        progress_callback(100, "Answered from the page's tables and metadata")
+    return results, normalizer
+
 
 def groq_parser(
         data_bits: List[str],
         instruction: str,
-        progress_callback: Optional[Callable[[int, str], None]] = None
+        progress_callback: Optional[Callable[[int, str], None]] = None,
+        url: Optional[str] = None,
+        visualize: bool = True,
+        structured: Optional[StructuredData] = None,
+        hints: Sequence[str] = ()
 ) -> List[Dict[str, Any]]:
     try:
-        results = asyncio.run(async_groq_parser(data_bits, instruction, progress_callback))
+        results, normalizer = run_analysis(data_bits, instruction, progress_callback, url=url, structured=structured,
+                                           hints=hints)
+
+        if not visualize:
+            store_results(results, normalizer)
+            return results
 
         # Check if the instruction contains a visualization request
         viz_type = None
@@ -175,7 +346,7 @@ def groq_parser(
             viz_type = "graph"
 
         # Automatically create visualization
-        display_visualization(results, viz_type)
+        display_visualization(results, viz_type, normalizer=normalizer)
 
         return results
     except Exception as e:
@@ -187,6 +358,9 @@ def groq_parser(
 
 
 def create_visualization(data: Union[list, dict], viz_type: str = None):
+    import pandas as pd
+    import viz
+
     if isinstance(data, list) and len(data) > 0:
         # Flatten the data structure if it contains 'data' and 'content' keys
         flattened_data = []
@@ -209,14 +383,14 @@ def create_visualization(data: Union[list, dict], viz_type: str = None):
 
     if viz_type == 'graph' or (viz_type is None and len(numeric_columns) > 0):
         if len(numeric_columns) >= 2:
-            fig = px.scatter(df, x=numeric_columns[0], y=numeric_columns[1],
-                             title=f"{numeric_columns[1]} vs {numeric_columns[0]}")
+            fig = viz.scatter_figure(df, numeric_columns[0], numeric_columns[1],
+                                     title=f"{numeric_columns[1]} vs {numeric_columns[0]}")
             fig.update_traces(marker=dict(size=10))
         elif len(numeric_columns) == 1:
-            fig = px.line(df, y=numeric_columns[0], title=f"Trend of {numeric_columns[0]}")
+            fig = viz.line_figure(df, numeric_columns[0], title=f"Trend of {numeric_columns[0]}")
         elif len(categorical_columns) >= 1:
             column_to_plot = categorical_columns[0]
-            fig = px.bar(df[column_to_plot].value_counts(), title=f"Distribution of {column_to_plot}")
+            fig = viz.bar_figure(df, column_to_plot, title=f"Distribution of {column_to_plot}")
             fig.update_layout(xaxis_title=column_to_plot, yaxis_title="Count")
         else:
             return df, 'table'
@@ -234,125 +408,90 @@ def create_visualization(data: Union[list, dict], viz_type: str = None):
     return df, 'table'
 
 
-def display_visualization(result: Union[list, dict], _: Any = None):  # Added optional second parameter
-    global content_df
-    if 'result_data' in st.session_state:
-        del st.session_state['result_data']
-    if 'content_df' in st.session_state:
-        del st.session_state['content_df']
+def _content_figure(content_df: "pd.DataFrame"):
+    import numpy as np
+    import viz
 
+    # Determine the best visualization based on the data
+    numeric_cols = content_df.select_dtypes(include=[np.number]).columns
+    categorical_cols = content_df.select_dtypes(include=['object']).columns
+
+    if len(numeric_cols) >= 2:
+        # Create a scatter plot of the first two numeric columns
+        return viz.scatter_figure(content_df, numeric_cols[0], numeric_cols[1],
+                                  title=f"{numeric_cols[1]} vs {numeric_cols[0]}")
+    elif len(numeric_cols) == 1:
+        # Create a histogram of the single numeric column
+        return viz.histogram_figure(content_df, numeric_cols[0],
+                                    title=f"Distribution of {numeric_cols[0]}")
+    elif len(categorical_cols) > 0:
+        # Create a bar chart of the first categorical column
+        return viz.bar_figure(content_df, categorical_cols[0],
+                              title=f"Counts of {categorical_cols[0]}")
+    return None
+
+
+def store_results(result: Union[list, dict], normalizer: Optional[ResultNormalizer] = None):
+    from exporters import discard_prepared
+
+    # Flatten 'content' payloads into a typed frame, reusing the one built while results arrived
+    def build():
+        source = normalizer or ResultNormalizer().extend(result if isinstance(result, list) else [result])
+        return source.to_frame()
+
+    discard_prepared()
     st.session_state.result_data = result
-    print("Result Data:")
-    print(result)
-
-    # Convert to DataFrame
-    if isinstance(st.session_state.result_data, dict):
-        df = pd.DataFrame([st.session_state.result_data])
-    elif isinstance(st.session_state.result_data, list):
-        df = pd.DataFrame(st.session_state.result_data)
-    else:
-        df = pd.DataFrame([st.session_state.result_data])
-    print("DataFrame (df):")
-    print(df)
-
-    # Parse 'content' column if it's a string or dict
-    if 'content' in df.columns:
-        content_data = []
-        for _, row in df.iterrows():
-            content = row['content']
-            if isinstance(content, str):
-                try:
-                    content = json.loads(content)
-                except json.JSONDecodeError:
-                    pass
-            if isinstance(content, dict):
-                content_data.append(content)
-            elif isinstance(content, list):
-                content_data.extend(content)
-
-        if content_data:
-            content_df = pd.json_normalize(content_data)
-            st.session_state.content_df = content_df
-            print("Content DataFrame (content_df):")
-            print(content_df)
-        st.subheader("Scraped Content Visualization")
+    st.session_state.content_df = cached("content_df", result, build=build)
+    logger.debug("Normalized content", extra={"rows": len(st.session_state.content_df)})
 
-        # Determine the best visualization based on the data
-        numeric_cols = content_df.select_dtypes(include=[np.number]).columns
-        categorical_cols = content_df.select_dtypes(include=['object']).columns
 
-        if len(numeric_cols) >= 2:
-            # Create a scatter plot of the first two numeric columns
-            fig = px.scatter(content_df, x=numeric_cols[0], y=numeric_cols[1],
-                             title=f"{numeric_cols[1]} vs {numeric_cols[0]}")
-            st.plotly_chart(fig, use_container_width=True)
+def display_visualization(result: Union[list, dict], _: Any = None, normalizer: Optional[ResultNormalizer] = None):
+    from exporters import XLSX_MIME, dataframes_to_xlsx, lazy_download_button
+    from table_view import paginated_table
 
-        elif len(numeric_cols) == 1:
-            # Create a histogram of the single numeric column
-            fig = px.histogram(content_df, x=numeric_cols[0],
-                               title=f"Distribution of {numeric_cols[0]}")
-            st.plotly_chart(fig, use_container_width=True)
+    with metrics.span("visualization"):
+        # Reruns pass the same result object back in, so only re-normalize when it changed
+        if normalizer is not None or st.session_state.get('result_data') is not result:
+            store_results(result, normalizer)
+        content_df = st.session_state.content_df
+
+        if content_df.empty:
+            st.warning("No structured content data available for visualization.")
+            return
 
-        elif len(categorical_cols) > 0:
-            # Create a bar chart of the first categorical column
-            fig = px.bar(content_df[categorical_cols[0]].value_counts(),
-                         title=f"Counts of {categorical_cols[0]}")
+        st.subheader("Scraped Content Visualization")
+
+        fig = cached("content_figure", result, build=lambda: _content_figure(content_df))
+        if fig is not None:
             st.plotly_chart(fig, use_container_width=True)
 
         # Always display the data in a table
         st.subheader("Scraped Data Table")
-        st.dataframe(content_df)
+        paginated_table(content_df, key="content_df", source=result)
 
         # Download options
         st.subheader("Download Options")
         col1, col2 = st.columns(2)
         with col1:
-            csv = content_df.to_csv(index=False)
+            csv = cached("content_csv", result, build=lambda: content_df.to_csv(index=False))
             st.download_button(
                 label="Download as CSV",
                 data=csv,
                 file_name="scraped_data.csv",
                 mime="text/csv",
             )
-        with col2:
-            # Create Excel file
-            wb = Workbook()
-            ws = wb.active
-            ws.title = "Scraped Data"
-
-            # Write data
-            for r in dataframe_to_rows(content_df, index=False, header=True):
-                ws.append(r)
-
-            # Save to BytesIO
-            excel_buffer = io.BytesIO()
-            wb.save(excel_buffer)
-            excel_buffer.seek(0)
-
-            # Create download link
-            b64 = base64.b64encode(excel_buffer.getvalue()).decode()
-            href = f'<a href="data:application/vnd.openxmlformats-officedocument.spreadsheetml.sheet;base64,{b64}" download="scraped_data.xlsx">Download Excel file</a>'
-            st.markdown(href, unsafe_allow_html=True)
-    else:
-        st.warning("No structured content data available for visualization.")
-
-    if 'result_data' in st.session_state and 'content_df' in st.session_state:
-        result_data = st.session_state.result_data
-        if isinstance(result_data, dict):
-            result_df = pd.DataFrame([result_data])
-        elif isinstance(result_data, list):
-            result_df = pd.DataFrame(result_data)
-        else:
-            result_df = result_data
-
-def dataframe_to_rows(df, index=False, header=True):
-    rows = []
-    if header:
-        rows.append(df.columns.tolist())
-    for row in df.itertuples(index=index):
-        rows.append([str(x) for x in row[1:]])
-    return rows
 
+    # The workbook is timed once, by the export stage, rather than again as part of visualization
+    with col2:
+        lazy_download_button(
+            label="Download Excel file",
+            build=lambda: cached("content_xlsx", result,
+                                 build=lambda: dataframes_to_xlsx({"Scraped Data": content_df})),
+            file_name="scraped_data.xlsx",
+            mime=XLSX_MIME,
+            key="scraped_data_xlsx",
+            prepare_label="Prepare Excel file",
+        )
 
 def display_debug_info(df, content_df):
     st.write("Debug Info:")
@@ -367,6 +506,9 @@ def display_debug_info(df, content_df):
         st.write(f"Data types: {content_df.dtypes}")
 
 def display_scraped_content(content_df):
+    import numpy as np
+    import viz
+
     st.subheader("Scraped Content Overview")
     st.write(f"Number of records: {len(content_df)}")
     st.write(f"Columns: {', '.join(content_df.columns)}")
@@ -377,32 +519,36 @@ def display_scraped_content(content_df):
     if len(numeric_cols) > 0:
         st.subheader("Numeric Data Visualization")
         selected_numeric = st.selectbox("Choose a numeric column", numeric_cols)
-        fig = px.histogram(content_df, x=selected_numeric, title=f"Distribution of {selected_numeric}")
+        fig = viz.histogram_figure(content_df, selected_numeric, title=f"Distribution of {selected_numeric}")
         st.plotly_chart(fig, use_container_width=True)
 
         if len(numeric_cols) > 1:
             st.subheader("Scatter Plot")
             x_col = st.selectbox("Choose X axis", numeric_cols, key="x_axis")
             y_col = st.selectbox("Choose Y axis", [col for col in numeric_cols if col != x_col], key="y_axis")
-            fig = px.scatter(content_df, x=x_col, y=y_col, title=f"{y_col} vs {x_col}")
+            fig = viz.scatter_figure(content_df, x_col, y_col, title=f"{y_col} vs {x_col}")
             st.plotly_chart(fig, use_container_width=True)
 
     if len(categorical_cols) > 0:
         st.subheader("Categorical Data Visualization")
         selected_categorical = st.selectbox("Choose a categorical column", categorical_cols)
-        fig = px.bar(content_df[selected_categorical].value_counts(), title=f"Counts of {selected_categorical}")
+        fig = viz.bar_figure(content_df, selected_categorical, title=f"Counts of {selected_categorical}")
         st.plotly_chart(fig, use_container_width=True)
 
 
 def display_table_view(df, content_df):
+    from table_view import paginated_table
+
     st.subheader("AI Metrics")
-    st.dataframe(df)
+    paginated_table(df, key="ai_metrics")
     if content_df is not None:
         st.subheader("Scraped Content")
-        st.dataframe(content_df)
+        paginated_table(content_df, key="scraped_content")
 
 
 def display_download_options(df, content_df):
+    from exporters import XLSX_MIME, dataframes_to_xlsx, lazy_download_button
+
     col1, col2 = st.columns(2)
     with col1:
         csv = df.to_csv(index=False)
@@ -413,30 +559,17 @@ def display_download_options(df, content_df):
             mime="text/csv",
         )
     with col2:
-        # Create Excel file using openpyxl
-        wb = Workbook()
-        ws1 = wb.active
-        ws1.title = "AI Metrics"
-
-        # Write AI Metrics
-        for row in dataframe_to_rows(df, index=False, header=True):
-            ws1.append(row)
-
+        sheets = {"AI Metrics": df}
         if content_df is not None:
-            ws2 = wb.create_sheet(title="Scraped Content")
-            # Write Scraped Content
-            for row in dataframe_to_rows(content_df, index=False, header=True):
-                ws2.append(row)
-
-        # Save to BytesIO
-        excel_buffer = io.BytesIO()
-        wb.save(excel_buffer)
-        excel_buffer.seek(0)
-
-        # Create download link
-        b64 = base64.b64encode(excel_buffer.getvalue()).decode()
-        href = f'<a href="data:application/vnd.openxmlformats-officedocument.spreadsheetml.sheet;base64,{b64}" download="scraped_data.xlsx">Download Excel file</a>'
-        st.markdown(href, unsafe_allow_html=True)
+            sheets["Scraped Content"] = content_df
+        lazy_download_button(
+            label="Download Excel file",
+            build=lambda: dataframes_to_xlsx(sheets),
+            file_name="scraped_data.xlsx",
+            mime=XLSX_MIME,
+            key="ai_metrics_xlsx",
+            prepare_label="Prepare Excel file",
+        )
 
 
 def display_debug_info(df, content_df):
@@ -459,8 +592,8 @@ def format_parsed_result(parsed_result: List[Dict[str, Any]], format_type: str =
         for item in parsed_result:
             if 'error' in item:
                 formatted.append(f"Error: {item['error']}")
-            elif 'data' in item and 'content' in item['data']:
-                content = item['data']['content']
+            elif 'content' in item or ('data' in item and 'content' in item['data']):
+                content = item['content'] if 'content' in item else item['data']['content']
                 if isinstance(content, dict):
                     formatted.extend([f"{k}: {v}" for k, v in content.items()])
                 elif isinstance(content, list):
@@ -0,0 +1,108 @@
+import json
+import logging
+import random
+import threading
+from typing import Dict, Optional
+
+from settings import get_float, get_setting
+
+# Third-party loggers that flood DEBUG/INFO output with per-request chatter.
+NOISY_LOGGERS = {
+    "selenium": logging.WARNING,
+    "urllib3": logging.WARNING,
+    "httpx": logging.WARNING,
+    "httpcore": logging.WARNING,
+    "groq": logging.WARNING,
+    "asyncio": logging.WARNING,
+    "watchdog": logging.WARNING,
+    "PIL": logging.WARNING,
+    "matplotlib": logging.WARNING,
+}
+
+# Attributes every LogRecord has; anything else was passed via `extra=` and is structured context.
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_configured = False
+_lock = threading.Lock()
+
+
+def _extras(record: logging.LogRecord) -> Dict[str, object]:
+    return {k: v for k, v in vars(record).items() if k not in _RESERVED}
+
+
+class KeyValueFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        line = f"{self.formatTime(record)} {record.levelname} {record.name}: {record.getMessage()}"
+        extras = _extras(record)
+        if extras:
+            line += " " + " ".join(f"{k}={v}" for k, v in extras.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            **_extras(record),
+        }
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    # Keeps a fraction of DEBUG records; INFO and above always pass.
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno > logging.DEBUG or self.rate >= 1 or random.random() < self.rate
+
+
+def parse_level(value: Optional[str], setting: str = "LOG_LEVEL") -> int:
+    # A typo in a level name falls back to INFO instead of stopping the app from starting.
+    name = str(value or "INFO").strip().upper()
+    level = logging.getLevelNamesMapping().get(name)
+    if level is None:
+        logging.getLogger(__name__).warning("Unknown log level %r in %s, using INFO", value, setting)
+        return logging.INFO
+    return level
+
+
+def parse_levels(spec: Optional[str]) -> Dict[str, int]:
+    levels = {}
+    for item in (spec or "").split(","):
+        if "=" not in item:
+            continue
+        name, level = item.split("=", 1)
+        levels[name.strip()] = parse_level(level, "LOG_LEVELS")
+    return levels
+
+
+def configure_logging(force: bool = False) -> None:
+    # Streamlit re-executes the script on every interaction; only the first call does any work.
+    global _configured
+    with _lock:
+        if _configured and not force:
+            return
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+
+        handler = logging.StreamHandler()
+        handler.setFormatter(JsonFormatter() if get_setting("LOG_FORMAT") == "json" else KeyValueFormatter())
+        handler.addFilter(SamplingFilter(get_float("LOG_DEBUG_SAMPLE_RATE", 1.0)))
+        root.addHandler(handler)
+        root.setLevel(parse_level(get_setting("LOG_LEVEL", "INFO")))
+
+        for name, level in {**NOISY_LOGGERS, **parse_levels(get_setting("LOG_LEVELS"))}.items():
+            logging.getLogger(name).setLevel(level)
+
+        _configured = True
@@ -1,42 +1,34 @@
 import streamlit as st
 from streamlit_lottie import st_lottie
 from JavaScript import brain_electrical_signals_background
-import requests
-from scraper import scrape_with_progress
-from llm_parser import groq_parser, format_parsed_result, get_preview
-import nltk
-import ssl
-from nltk.corpus import stopwords
-from nltk.tokenize import PunktSentenceTokenizer, word_tokenize
-from wordcloud import WordCloud
-import matplotlib.pyplot as plt
-import base64
 import logging
+import time
+import jobs
+import metrics
+import startup
+from accounting import ledger
+from content_store import content_store
+from log_config import configure_logging
+from render_cache import cached
+from search_index import SEARCH_INDEX, default_index
+from settings import get_int, get_setting
+from word_frequency import stop_words_complete, word_frequencies
 
 st.set_page_config(layout="wide", page_title="AI Web Scraper & Analyzer", page_icon="🌐", initial_sidebar_state="auto")
 
 # Set up logging
-logging.basicConfig(level=logging.INFO)
+configure_logging()
 logger = logging.getLogger(__name__)
 
+# Fetch NLTK data and animations in the background, once per server process
+startup.prefetch_assets()
 
-def download_nltk_data():
-    try:
-        nltk.download('punkt', quiet=True, raise_on_error=True)
-        nltk.download('punkt_tab', quiet=True, raise_on_error=True)
-        nltk.download('stopwords', quiet=True, raise_on_error=True)
-    except ssl.SSLError:
-        st.error("SSL Error occurred. NLTK data couldn't be downloaded securely.")
-        st.info("You may need to download NLTK data manually or check your internet connection.")
-    except Exception as e:
-        st.error(f"An error occurred while downloading NLTK data: {str(e)}")
-        st.info("You may need to download NLTK data manually or check your internet connection.")
-
-
-# Call this function at the start of your app
-download_nltk_data()
+# Expose Prometheus metrics on a side port when configured
+if get_int("METRICS_PORT"):
+    metrics.start_metrics_server(get_int("METRICS_PORT"))
 
 # Initialize session state variables
+# cleaned_content and data_bits hold references into the shared content store, not copies of the page text
 if 'cleaned_content' not in st.session_state:
     st.session_state.cleaned_content = None
 if 'data_bits' not in st.session_state:
@@ -53,65 +45,32 @@ if 'file_format' not in st.session_state:
     st.session_state.file_format = 'txt'
 
 
-# Function to load Lottie animation
-def load_lottieurl(url: str):
-    try:
-        r = requests.get(url)
-        if r.status_code != 200:
-            return None
-        return r.json()
-    except Exception as e:
-        logger.error(f"Error loading Lottie animation: {str(e)}")
-        return None
-
-
-# Load Lottie animations
-lottie_analyzing = load_lottieurl("https://lottie.host/e7b1797e-f02a-44be-b28f-c3e26c69fbd3/4PF5hVXPST.json")
-lottie_robot = load_lottieurl("https://lottie.host/2945d2be-6612-4bc3-8ffc-4bbaa755045b/y0olOO2xO7.json")
-lottie_sidebar = load_lottieurl("https://lottie.host/3af8aa11-aec4-4661-98a6-6396ff474e0f/YIpGN6tsQ9.json")
-
-
-# Function to get image as base64
-def get_image_as_base64(file):
-    try:
-        with open(file, "rb") as f:
-            return base64.b64encode(f.read()).decode()
-    except Exception as e:
-        logger.error(f"Error loading background image: {str(e)}")
-        return None
-
-
 # Set background image
-background_image = get_image_as_base64("gradient_blue.jpg")
-if background_image:
-    st.markdown(
-        f"""
-        <style>
-        .stApp {{
-            background-image: url("data:image/jpg;base64,{background_image}");
-            background-size: cover;
-        }}
-        </style>
-        """,
-        unsafe_allow_html=True
-    )
+background_css = startup.background_css("gradient_blue.jpg")
+if background_css:
+    st.markdown(background_css, unsafe_allow_html=True)
 
 
 # Function to generate word cloud
-def generate_wordcloud(text):
+def generate_wordcloud(frequencies):
+    from wordcloud import WordCloud
     try:
-        stop_words = set(stopwords.words('english'))
-        sent_tokenizer = PunktSentenceTokenizer()
-        sentences = sent_tokenizer.tokenize(text)
-        word_tokens = [word for sentence in sentences for word in word_tokenize(sentence)]
-        filtered_text = [word.lower() for word in word_tokens if word.isalnum() and word.lower() not in stop_words]
-        wordcloud = WordCloud(width=800, height=400, background_color='white').generate(' '.join(filtered_text))
-        return wordcloud
+        return WordCloud(width=800, height=400, background_color='white').generate_from_frequencies(frequencies)
     except Exception as e:
         st.error(f"An error occurred while generating the word cloud: {str(e)}")
         return None
 
 
+def render_wordcloud(text):
+    # The frequency table is cached per content hash, separately from the rendered image
+    frequencies = cached("word_frequencies", text, stop_words_complete(), build=lambda: word_frequencies(text))
+    if not frequencies:
+        return None
+    with metrics.span("wordcloud"):
+        wordcloud = generate_wordcloud(frequencies)
+    return wordcloud.to_array() if wordcloud else None
+
+
 # Add custom CSS
 st.markdown("""
      <style>
@@ -210,11 +169,119 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
+def display_diagnostics():
+    st.markdown("<h1 class='pulse'>Diagnostics</h1>", unsafe_allow_html=True)
+
+    counters = metrics.registry.counters()
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Cache hits", int(counters.get("cache_hits", 0)))
+    col2.metric("Retries", int(counters.get("retries", 0)))
+    col3.metric("Blocked pages", int(counters.get("blocks", 0)))
+    col4.metric("Running jobs", len(jobs.executor.active()))
+
+    store = content_store.stats()
+    st.caption(f"Content store: {store['pages']} pages, {store['chars'] / 1e6:.1f}M characters shared across sessions")
+    saved = int(counters.get("llm_tokens_saved", 0))
+    if saved:
+        st.caption(f"Prompt compaction: {saved:,} prompt tokens saved (estimated)")
+
+    st.subheader("Time per stage")
+    stages = metrics.registry.stage_summary()
+    if stages:
+        st.dataframe(stages, use_container_width=True)
+    else:
+        st.info("No jobs have run on this server yet.")
+
+    job_stages = metrics.registry.job_summary()
+    if job_stages:
+        st.subheader("Recent jobs")
+        job_id = st.selectbox("Job", list(reversed(list(job_stages))))
+        st.bar_chart(job_stages[job_id])
+
+    st.subheader("Token usage")
+    dimension = st.radio("Group by", ["job", "url", "instruction"], horizontal=True)
+    usage = ledger.totals(dimension)
+    if usage:
+        st.dataframe([{dimension: key, **totals} for key, totals in reversed(usage.items())],
+                     use_container_width=True)
+    else:
+        st.info("No tokens have been spent on this server yet.")
+
+    with st.expander("Prometheus metrics"):
+        st.code(metrics.registry.render_prometheus(), language="text")
+
+
+def load_indexed_page(indexed):
+    # An indexed copy stands in for a fresh scrape; the analysis section picks it up from session state
+    content = default_index().load(indexed.id)
+    st.session_state.url = indexed.url
+    st.session_state.cleaned_content, st.session_state.data_bits = content, content.chunks(6000)
+    st.session_state.scraping_complete = True
+    st.session_state.parsed_result = None
+
+
+def display_search():
+    st.markdown("<h1 class='pulse'>Search Past Scrapes</h1>", unsafe_allow_html=True)
+    if not SEARCH_INDEX:
+        st.info("The search index is turned off (SEARCH_INDEX=false).")
+        return
+
+    index = default_index()
+    stats = index.stats()
+    st.caption(f"{stats['pages']} page{'s' if stats['pages'] != 1 else ''}, "
+               f"{stats['chars'] / 1e6:.1f}M characters indexed"
+               + ("" if stats["fts"] else " (SQLite without FTS5: substring matching)"))
+    query = st.text_input("Search everything scraped so far", key="search_query", placeholder="e.g. return policy")
+    url_filter = st.text_input("Only this URL (optional)", key="search_url")
+
+    if not query:
+        recent = index.pages(50, url_filter or None)
+        if recent:
+            st.subheader("Recently indexed")
+            st.dataframe([{"url": p.url, "scraped": time.strftime("%Y-%m-%d %H:%M", time.localtime(p.scraped_at)),
+                           "characters": p.chars} for p in recent], use_container_width=True)
+        return
+
+    hits = index.search(query, limit=50, url=url_filter or None)
+    if not hits:
+        st.info("No indexed page matches that search.")
+    for n, hit in enumerate(hits):
+        with st.container(border=True):
+            scraped = time.strftime("%Y-%m-%d %H:%M", time.localtime(hit.page.scraped_at))
+            st.markdown(f"**{hit.page.url}** · part {hit.chunk + 1} · scraped {scraped}")
+            st.markdown(hit.snippet)
+            if st.button("Analyze this page", key=f"search_load_{n}"):
+                load_indexed_page(hit.page)
+                st.success("Loaded from the index. Open Scraper & Analyzer to analyze it.")
+
+
+@st.fragment(run_every=0.5)
+def job_progress(state_key):
+    # Reruns only this fragment while the job is running, then the whole page once it finishes
+    job = jobs.executor.get(st.session_state.get(state_key))
+    if job is None or job.finished:
+        st.rerun()
+    st.progress(job.progress)
+    st.text(job.message)
+
+
+def watch_job(state_key):
+    # Returns the session's job; a finished job is handed back once and then forgotten
+    job = jobs.executor.get(st.session_state.get(state_key))
+    if job is None:
+        st.session_state.pop(state_key, None)
+    elif not job.finished:
+        job_progress(state_key)
+    else:
+        del st.session_state[state_key]
+    return job
+
+
 # Main app
 def main():
     # Sidebar for navigation
     with st.sidebar:
-        page = st.sidebar.radio("Go to", ["Home", "Scraper & Analyzer", "About"])
+        page = st.sidebar.radio("Go to", ["Home", "Scraper & Analyzer", "Search", "Diagnostics", "About"])
 
         st.markdown("""
         <h1 style='text-align: center; color: #4F8BF9;'>Scrape websites with ease</h1>
@@ -225,6 +292,7 @@ def main():
     if page == "Home":
         st.markdown("<h1 class='pulse'>Groq A.I Web Scraper & Visualizer</h1>", unsafe_allow_html=True)
         st.write("This app combines the power of web scraping, Groq AI, and interactive visualizations.")
+        lottie_robot = startup.lottie("robot", timeout=1.0)
         if lottie_robot:
             st_lottie(lottie_robot, quality="high", speed=1, height=300, key="robot")
         else:
@@ -233,42 +301,79 @@ def main():
 
 
     elif page == "Scraper & Analyzer":
+        # Heavy dependencies (selenium, pandas, plotly, aiohttp) load on first use of this page only
+        from scraper import scrape_to_store
+        from crawler import CrawlConfig, crawl_to_store
+        from llm_parser import run_analysis, store_results, get_preview, display_visualization
+        from exporters import EXPORT_MIME_TYPES, TEXT_FORMATS, export_results, describe_export
+        from table_view import paginated_records
+
+        # With a shared task queue configured, fetching and LLM calls go to worker processes (see worker.py)
+        if get_setting("TASK_QUEUE_URL"):
+            from task_queue import default_queue
+            from worker import remote_analysis as run_analysis, remote_fetch
+            from worker import remote_scrape_to_store as scrape_to_store
+            fetch_options = {"fetch": remote_fetch(default_queue())}
+        else:
+            fetch_options = {}
+
         st.title("🌐 AI-Powered Web Scraper & Analyzer")
 
         # Scraping section
         st.markdown("<h3 class='pulse'>Enter a URL to begin your web exploration journey!</h3>", unsafe_allow_html=True)
         st.session_state.url = st.text_input("", value=st.session_state.url, placeholder="https://example.com")
 
+        with st.expander("🕸️ Crawl linked pages"):
+            crawl_mode = st.checkbox("Follow links from this URL", key="crawl_mode")
+            col1, col2 = st.columns(2)
+            crawl_pages = col1.number_input("Max pages", min_value=1, max_value=500, value=20, key="crawl_pages")
+            crawl_depth = col2.number_input("Max link depth", min_value=0, max_value=5, value=2, key="crawl_depth")
+            crawl_include = st.text_input("Only URLs matching (regex, optional)", key="crawl_include")
+            crawl_sitemap = st.checkbox("Also use sitemap.xml", key="crawl_sitemap")
+
+        # A URL scraped before can be reloaded from the search index instead of fetched again
+        indexed = default_index().latest(st.session_state.url) if SEARCH_INDEX and st.session_state.url else None
+        if indexed is not None:
+            scraped = time.strftime("%Y-%m-%d %H:%M", time.localtime(indexed.scraped_at))
+            if st.button(f"📚 Use the copy scraped {scraped}", key="indexed_button"):
+                load_indexed_page(indexed)
+
         if st.button('🚀 Launch Scraper', key='scrape_button'):
             if st.session_state.url:
-                progress_bar = st.progress(0)
-                status_text = st.empty()
-                st.info(
-                    "Note: Some websites may block our scraper. If you encounter issues, try a different website or check back later.")
-
-                def update_progress(progress, status):
-                    progress_bar.progress(progress)
-                    status_text.text(status)
-
-                try:
-                    with st.spinner("Scraping please wait..."):
-                        st.session_state.cleaned_content, st.session_state.data_bits = scrape_with_progress(
-                            st.session_state.url, update_progress)
-                    if st.session_state.cleaned_content is None:
-                        st.warning("⚠️ The website denied access to our scraper. Unable to retrieve content.")
-                    else:
-                        st.success("🎉 Scraping completed successfully!")
-                        st.session_state.scraping_complete = True
-
-                    # Display a sample of the cleaned content
-                    with st.expander("View Scraped Content"):
-                        st.text_area("Cleaned Content", st.session_state.cleaned_content[:1000] + "...",
-                                     height=200)
-
-                except Exception as e:
-                    logger.error(f"Error during scraping: {str(e)}")
-                    st.error(f"🚫 This website is stubborn please try another URL: {str(e)}")
-                    st.session_state.scraping_complete = False
+                # The scrape runs on the server's job pool; this script run only keeps the job id
+                if crawl_mode:
+                    config = CrawlConfig(max_pages=int(crawl_pages), max_depth=int(crawl_depth),
+                                         include_patterns=[crawl_include] if crawl_include else [],
+                                         use_sitemap=crawl_sitemap, workers=get_int("CRAWL_WORKERS", 2))
+                    job = jobs.executor.submit("crawl", crawl_to_store, st.session_state.url, config=config,
+                                               **fetch_options)
+                else:
+                    job = jobs.executor.submit("scrape", scrape_to_store, st.session_state.url)
+                st.session_state.scrape_job_id = job.id
+                st.session_state.scraping_complete = False
+
+        job = watch_job("scrape_job_id")
+        if job is not None and not job.finished:
+            st.info(
+                "Note: Some websites may block our scraper. If you encounter issues, try a different website or check back later.")
+        elif job is not None and job.status == jobs.DONE:
+            st.session_state.cleaned_content, st.session_state.data_bits = job.take_result()
+            if st.session_state.cleaned_content is None:
+                st.warning("⚠️ The website denied access to our scraper. Unable to retrieve content.")
+            else:
+                st.success("🎉 Scraping completed successfully!")
+                st.session_state.scraping_complete = True
+
+                # Display a sample of the cleaned content
+                with st.expander("View Scraped Content"):
+                    st.text_area("Cleaned Content", st.session_state.cleaned_content.text[:1000] + "...",
+                                 height=200)
+                    if st.session_state.cleaned_content.structured:
+                        st.caption(f"Found {st.session_state.cleaned_content.structured.summary()}. "
+                                   "Table and metadata requests are answered from these without the AI.")
+        elif job is not None:
+            st.error(f"🚫 This website is stubborn please try another URL: {job.error}")
+            st.session_state.scraping_complete = False
 
         # Analysis section
         if st.session_state.get('scraping_complete', False):
@@ -278,44 +383,59 @@ def main():
                 value=st.session_state.parser_input,
                 placeholder="e.g., Extract all product names and prices, or summarize the main topics"
             )
+            relevance_hints = st.text_input(
+                "Always analyze chunks containing (comma-separated keywords or regex, optional)",
+                key="relevance_hints",
+                help="Chunks that do not match the instruction are skipped; chunks matching these are always sent."
+            )
 
             if st.button('🔮 Analyze', key='parse_button'):
                 if st.session_state.parser_input:
-                    with st.expander("🔬 Analysis Dashboard", expanded=True):
-                        st.markdown("<h3 class='pulse'>🧙‍♂️ The AI is weaving its magic...</h3>",
-                                    unsafe_allow_html=True)
-                        if lottie_analyzing:
-                            st_lottie(lottie_analyzing, speed=1, height=200, key="analyzing")
-                    try:
-                        progress_bar = st.progress(0)
-                        status_text = st.empty()
-
-                        def update_progress(progress, status):
-                            progress_bar.progress(progress)
-                            status_text.text(status)
-
-                        st.session_state.parsed_result = groq_parser(
-                            st.session_state.data_bits,
-                            st.session_state.parser_input,
-                            update_progress
-                        )
-
-                        if st.session_state.parsed_result:
-                            st.success("✨ Analysis complete! Behold the insights!")
-                            st.subheader("🎨 Scraped Insights")
-                            st.write(st.session_state.parsed_result)
-
-                            # Display any errors that occurred during analysis
-                            errors = [result for result in st.session_state.parsed_result if "error" in result]
-                            if errors:
-                                st.warning("Some parts of the analysis encountered errors:")
-                                for error in errors:
-                                    st.error(error["error"])
-                        else:
-                            st.warning("The analysis did not produce any results. The parsed content might be empty.")
-                    except Exception as e:
-                        st.error(f"An error occurred during analysis: {str(e)}")
-                        logger.exception("Error during analysis")
+                    job = jobs.executor.submit("analyze", run_analysis, st.session_state.data_bits,
+                                               st.session_state.parser_input, url=st.session_state.url,
+                                               structured=st.session_state.cleaned_content.structured,
+                                               hints=relevance_hints.split(","))
+                    st.session_state.analyze_job_id = job.id
+
+            job = watch_job("analyze_job_id")
+            if job is not None and not job.finished:
+                with st.expander("🔬 Analysis Dashboard", expanded=True):
+                    st.markdown("<h3 class='pulse'>🧙‍♂️ The AI is weaving its magic...</h3>",
+                                unsafe_allow_html=True)
+                    lottie_analyzing = startup.lottie("analyzing")
+                    if lottie_analyzing:
+                        st_lottie(lottie_analyzing, speed=1, height=200, key="analyzing")
+            elif job is not None and job.status == jobs.DONE:
+                results, normalizer = job.take_result()
+                store_results(results, normalizer)
+                st.session_state.parsed_result = results
+                if results:
+                    st.success("✨ Analysis complete! Behold the insights!")
+                else:
+                    st.warning("The analysis did not produce any results. The parsed content might be empty.")
+            elif job is not None:
+                st.error(f"An error occurred during analysis: {job.error}")
+
+            if st.session_state.get('parsed_result'):
+                st.subheader("🎨 Scraped Insights")
+                skipped = [result for result in st.session_state.parsed_result if "skipped" in result]
+                paginated_records([result for result in st.session_state.parsed_result if "skipped" not in result],
+                                  key="parsed_result")
+                if skipped:
+                    with st.expander(f"⏭️ {len(skipped)} chunks skipped as not relevant to the instruction"):
+                        st.dataframe([{"chunk": r["chunk"], "score": r["score"]} for r in skipped],
+                                     use_container_width=True)
+
+                # Display any errors that occurred during analysis
+                errors = [result for result in st.session_state.parsed_result if "error" in result]
+                if errors:
+                    st.warning("Some parts of the analysis encountered errors:")
+                    for error in errors:
+                        st.error(error["error"])
+
+            # Visualize on every rerun so downloads and widgets below keep working
+            if st.session_state.get('parsed_result'):
+                display_visualization(st.session_state.parsed_result)
 
             # Display download options if parsed result exists
             if st.session_state.get('parsed_result'):
@@ -324,16 +444,18 @@ def main():
                 # File format selector using radio buttons
                 st.session_state.file_format = st.radio(
                     "Select file format for download",
-                    options=['txt', 'json'],
+                    options=list(EXPORT_MIME_TYPES),
                     format_func=lambda x: f".{x} file",
                     horizontal=True
                 )
 
-                # Format the parsed result for download
-                formatted_result = format_parsed_result(st.session_state.parsed_result, st.session_state.file_format)
+                # Encode the parsed result once per format; its length is the download size
+                export_data = cached("export", st.session_state.parsed_result, st.session_state.file_format,
+                                     build=lambda: export_results(st.session_state.parsed_result,
+                                                                  st.session_state.file_format))
 
                 # Check file size
-                file_size = len(formatted_result.encode('utf-8'))
+                file_size = len(export_data)
                 max_size = 200 * 1024 * 1024  # 200 MB limit
 
                 if file_size > max_size:
@@ -342,28 +464,38 @@ def main():
                 else:
                     # Preview of downloadable content
                     st.subheader("🔍 Preview of Downloadable Content")
-                    st.code(get_preview(formatted_result), language=st.session_state.file_format)
+                    if st.session_state.file_format in TEXT_FORMATS:
+                        st.code(get_preview(export_data[:64 * 1024].decode('utf-8', errors='ignore')),
+                                language="json" if st.session_state.file_format != 'txt' else 'txt')
+                    else:
+                        st.code(cached("export_preview", export_data, st.session_state.file_format,
+                                       build=lambda: describe_export(export_data, st.session_state.file_format)),
+                                language='text')
 
                     # Add download button for parsed results
                     st.download_button(
                         label=f"📥 Download Parsed Results (.{st.session_state.file_format})",
-                        data=formatted_result,
+                        data=export_data,
                         file_name=f"parsed_results.{st.session_state.file_format}",
-                        mime=f"text/{st.session_state.file_format}"
+                        mime=EXPORT_MIME_TYPES[st.session_state.file_format]
                     )
 
             # Word Cloud
             if st.session_state.get('cleaned_content'):
                 st.subheader("☁️ Word Cloud")
-                wordcloud = generate_wordcloud(st.session_state.cleaned_content)
-                if wordcloud:
-                    plt.figure(figsize=(10, 5))
-                    plt.imshow(wordcloud, interpolation='bilinear')
-                    plt.axis('off')
-                    st.pyplot(plt)
+                wordcloud_image = cached("wordcloud", st.session_state.cleaned_content, stop_words_complete(),
+                                         build=lambda: render_wordcloud(st.session_state.cleaned_content.text))
+                if wordcloud_image is not None:
+                    st.image(wordcloud_image, use_column_width=True)
                 else:
                     st.warning("🌪️ Oops! The word cloud generator hit a snag. But don't worry, the show must go on!")
 
+    elif page == "Search":
+        display_search()
+
+    elif page == "Diagnostics":
+        display_diagnostics()
+
     elif page == "About":
         st.markdown("<h1 class='pulse'>About</h1>", unsafe_allow_html=True)
         st.write("""
@@ -0,0 +1,194 @@
+import contextvars
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+PREFIX = "webscraper"
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_current_job: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_job", default=None)
+
+
+@dataclass
+class Span:
+    name: str
+    job_id: Optional[str]
+    started_at: float
+    duration: float
+    attrs: Dict[str, Any] = field(default_factory=dict)
+
+
+class _Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.recent: Deque[float] = deque(maxlen=1000)
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        self.recent.append(value)
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def percentile(self, q: float) -> float:
+        if not self.recent:
+            return 0.0
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class MetricsRegistry:
+    def __init__(self, max_spans: int = 5000, max_jobs: int = 50):
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, _Histogram] = defaultdict(_Histogram)
+        self._counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = defaultdict(float)
+        self._spans: Deque[Span] = deque(maxlen=max_spans)
+        self._jobs: Dict[str, Dict[str, float]] = {}
+        self._max_jobs = max_jobs
+
+    def record_span(self, name: str, duration: float, job_id: Optional[str] = None, **attrs) -> None:
+        job_id = job_id or _current_job.get()
+        with self._lock:
+            self._histograms[name].observe(duration)
+            self._spans.append(Span(name, job_id, time.time() - duration, duration, attrs))
+            if job_id is not None:
+                if job_id not in self._jobs and len(self._jobs) >= self._max_jobs:
+                    del self._jobs[next(iter(self._jobs))]
+                stages = self._jobs.setdefault(job_id, {})
+                stages[name] = stages.get(name, 0.0) + duration
+
+    @contextmanager
+    def span(self, name: str, **attrs) -> Iterator[Dict[str, Any]]:
+        started = time.perf_counter()
+        try:
+            yield attrs
+        finally:
+            self.record_span(name, time.perf_counter() - started, **attrs)
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            self._counters[key] += value
+
+    def counters(self) -> Dict[str, float]:
+        with self._lock:
+            totals: Dict[str, float] = defaultdict(float)
+            for (name, _), value in self._counters.items():
+                totals[name] += value
+            return dict(totals)
+
+    def stage_summary(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [
+                {
+                    "stage": name,
+                    "count": hist.count,
+                    "total_s": round(hist.total, 4),
+                    "mean_s": round(hist.total / hist.count, 4) if hist.count else 0.0,
+                    "p50_s": round(hist.percentile(0.5), 4),
+                    "p95_s": round(hist.percentile(0.95), 4),
+                }
+                for name, hist in sorted(self._histograms.items())
+            ]
+
+    def job_summary(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {job_id: dict(stages) for job_id, stages in self._jobs.items()}
+
+    def recent_spans(self, limit: int = 100) -> List[Span]:
+        with self._lock:
+            return list(self._spans)[-limit:]
+
+    def render_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            if self._histograms:
+                lines.append(f"# HELP {PREFIX}_stage_seconds Time spent per pipeline stage.")
+                lines.append(f"# TYPE {PREFIX}_stage_seconds histogram")
+            for name, hist in sorted(self._histograms.items()):
+                for bound, count in zip(BUCKETS, hist.counts):
+                    lines.append(f'{PREFIX}_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {count}')
+                lines.append(f'{PREFIX}_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {hist.count}')
+                lines.append(f'{PREFIX}_stage_seconds_sum{{stage="{name}"}} {hist.total}')
+                lines.append(f'{PREFIX}_stage_seconds_count{{stage="{name}"}} {hist.count}')
+
+            seen = set()
+            for (name, labels), value in sorted(self._counters.items()):
+                metric = f"{PREFIX}_{name}_total"
+                if metric not in seen:
+                    seen.add(metric)
+                    lines.append(f"# TYPE {metric} counter")
+                label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+                lines.append(f"{metric}{{{label_text}}} {value}" if label_text else f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self._spans.clear()
+            self._jobs.clear()
+
+
+registry = MetricsRegistry()
+span = registry.span
+record_span = registry.record_span
+inc = registry.inc
+
+
+def new_job_id() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+@contextmanager
+def job_context(job_id: Optional[str] = None) -> Iterator[str]:
+    job_id = job_id or new_job_id()
+    token = _current_job.set(job_id)
+    try:
+        yield job_id
+    finally:
+        _current_job.reset(token)
+
+
+def current_job_id() -> Optional[str]:
+    return _current_job.get()
+
+
+_server: Optional[ThreadingHTTPServer] = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0") -> None:
+    global _server
+    with _server_lock:
+        if _server is None:
+            _server = _serve(port, host)
+
+
+def _serve(port: int, host: str) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
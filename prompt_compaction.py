@@ -0,0 +1,108 @@
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict
+
+from accounting import estimate_tokens
+from settings import get_bool, get_int
+
+# Chunk text is squeezed before it goes into a prompt: whitespace runs collapsed and, optionally, long URLs and
+# IDs swapped for short placeholders that are put back into the parsed response.
+COMPACTION = get_bool("PROMPT_COMPACTION", True)
+PLACEHOLDERS = get_bool("PROMPT_PLACEHOLDERS", True)
+MIN_URL_CHARS = get_int("PROMPT_PLACEHOLDER_URL_CHARS", 40)
+
+SYSTEM_PROMPT = "Extract information from text as instructed. Reply with JSON only."
+# What every request used to send, kept to report how many tokens compaction saves.
+VERBOSE_SYSTEM_PROMPT = "You are an AI assistant specialized in analyzing and extracting information from text based on specific instructions. Always provide your response in a structured JSON format."
+VERBOSE_TEMPLATE = """Analyze the following text and {instruction}.
+        Provide your response in a clear, structured JSON format.
+        Ensure all keys in the JSON are strings and all values are either strings, numbers, booleans, or arrays of these types.
+
+        Text to analyze:
+        {text}
+        """
+
+_INLINE_SPACE = re.compile(r"[ \t\f\v\u00a0\u2000-\u200b\u3000]+")
+_BLANK_LINES = re.compile(r"\n\s*\n+")
+_URL = re.compile(r"https?://[^\s<>\"'`)\]}]+")
+# UUIDs, long hex digests (with at least one digit) and long digit runs such as order or tracking numbers
+_ID = re.compile(r"\b(?:[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}|(?=[a-f]*\d)[0-9a-f]{16,}|"
+                 r"\d{12,})\b", re.IGNORECASE)
+_PLACEHOLDER = re.compile(r"\[[UI]\d+\]")
+
+
+@dataclass
+class CompactText:
+    text: str
+    # placeholder -> original value
+    placeholders: Dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class CompactPrompt:
+    system: str
+    user: str
+    placeholders: Dict[str, str] = field(default_factory=dict)
+    tokens_saved: int = 0
+
+
+def normalize_whitespace(text: str) -> str:
+    text = _INLINE_SPACE.sub(" ", text)
+    text = "\n".join(line.strip() for line in text.split("\n"))
+    return _BLANK_LINES.sub("\n", text).strip()
+
+
+def compact(text: str, placeholders: bool = PLACEHOLDERS, min_url_chars: int = MIN_URL_CHARS) -> CompactText:
+    text = normalize_whitespace(text)
+    # Text that already contains placeholder-looking tokens is left alone, so restore cannot corrupt it.
+    if not placeholders or _PLACEHOLDER.search(text):
+        return CompactText(text)
+
+    values: Dict[str, str] = {}
+    names: Dict[str, str] = {}
+
+    def substitute(prefix: str, value: str) -> str:
+        name = names.get(value)
+        if name is None:
+            name = names[value] = f"[{prefix}{sum(1 for n in values if n[1] == prefix) + 1}]"
+            values[name] = value
+        return name
+
+    text = _URL.sub(lambda m: substitute("U", m.group(0)) if len(m.group(0)) >= min_url_chars else m.group(0), text)
+    text = _ID.sub(lambda m: substitute("I", m.group(0)), text)
+    return CompactText(text, values)
+
+
+def restore(value: Any, placeholders: Dict[str, str]) -> Any:
+    # Puts the original URLs and IDs back anywhere in the parsed JSON, keys included.
+    if not placeholders:
+        return value
+    if isinstance(value, str):
+        return _PLACEHOLDER.sub(lambda m: placeholders.get(m.group(0), m.group(0)), value)
+    if isinstance(value, list):
+        return [restore(item, placeholders) for item in value]
+    if isinstance(value, dict):
+        return {restore(key, placeholders): restore(item, placeholders) for key, item in value.items()}
+    return value
+
+
+def build_prompt(text: str, instruction: str, placeholders: bool = False) -> str:
+    prompt = (f"Analyze the text below and {instruction.strip().rstrip('.')}.\n"
+              "Respond with JSON only: string keys; values are strings, numbers, booleans or arrays of these.")
+    if placeholders:
+        prompt += " Copy tokens like [U1] or [I1] unchanged."
+    return f"{prompt}\nText:\n{text}"
+
+
+def verbose_prompt(text: str, instruction: str) -> str:
+    return VERBOSE_TEMPLATE.format(text=text, instruction=instruction)
+
+
+def compact_prompt(text: str, instruction: str, enabled: bool = COMPACTION) -> CompactPrompt:
+    verbose = verbose_prompt(text, instruction)
+    if not enabled:
+        return CompactPrompt(VERBOSE_SYSTEM_PROMPT, verbose)
+    compacted = compact(text)
+    user = build_prompt(compacted.text, instruction, bool(compacted.placeholders))
+    saved = estimate_tokens(VERBOSE_SYSTEM_PROMPT + verbose) - estimate_tokens(SYSTEM_PROMPT + user)
+    return CompactPrompt(SYSTEM_PROMPT, user, compacted.placeholders, saved)
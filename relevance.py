@@ -0,0 +1,191 @@
+import logging
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Pattern, Sequence
+
+import metrics
+from settings import get_bool, get_float, get_int
+from word_frequency import WORD_RE
+
+logger = logging.getLogger(__name__)
+
+# Chunks are ranked against the instruction with BM25 and only the relevant ones go to the LLM.
+RELEVANCE_FILTER = get_bool("RELEVANCE_FILTER", True)
+TOP_K = get_int("RELEVANCE_TOP_K", 12)
+# Kept chunks must score at least this fraction of the best chunk.
+THRESHOLD = get_float("RELEVANCE_THRESHOLD", 0.2)
+# Recall safeguards: never keep fewer than MIN_CHUNKS or MIN_FRACTION of the page, and keep NEIGHBORS chunks
+# on either side of every kept one, since a record can straddle a chunk boundary.
+MIN_CHUNKS = get_int("RELEVANCE_MIN_CHUNKS", 3)
+MIN_FRACTION = get_float("RELEVANCE_MIN_FRACTION", 0.1)
+NEIGHBORS = get_int("RELEVANCE_NEIGHBORS", 1)
+
+K1 = 1.5
+B = 0.75
+HINT_WEIGHT = 0.5
+
+SKIPPED_REASON = "not relevant to the instruction"
+
+# Words in an instruction that describe the task rather than what to look for.
+_QUERY_STOP_WORDS = {
+    "about", "all", "also", "and", "any", "are", "as", "be", "by", "can", "content", "data", "details", "each",
+    "every", "extract", "find", "for", "from", "get", "give", "how", "identify", "in", "information", "into",
+    "is", "it", "its", "json", "list", "me", "mentioned", "of", "on", "or", "out", "page", "please", "provide",
+    "pull", "return", "show", "site", "tell", "text", "that", "the", "their", "them", "these", "this", "those",
+    "to", "webpage", "website", "what", "which", "who", "with",
+}
+# Instructions that need the whole page: only chunks with no match at all are skipped.
+_EXHAUSTIVE = re.compile(r"\b(all|every|each|entire|whole|complete|summar\w*|overview|count)\b", re.IGNORECASE)
+
+# (instruction trigger, chunk pattern): values the instruction asks for that words alone would miss.
+DEFAULT_HINTS = (
+    (re.compile(r"\b(prices?|pricing|costs?|fees?|usd|eur)\b|\$", re.IGNORECASE),
+     re.compile(r"[$€£¥]\s?\d|\d\s?(usd|eur|gbp)\b", re.IGNORECASE)),
+    (re.compile(r"\be-?mails?\b", re.IGNORECASE), re.compile(r"[\w.+-]+@[\w-]+\.[\w.]+")),
+    (re.compile(r"\b(phones?|telephone|tel|contacts?)\b", re.IGNORECASE), re.compile(r"\+?\d[\d\s().-]{7,}\d")),
+    (re.compile(r"\b(dates?|when|schedules?|deadlines?|events?)\b", re.IGNORECASE),
+     re.compile(r"\b\d{4}-\d{2}-\d{2}\b|\b(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.? \d{1,2}\b",
+                re.IGNORECASE)),
+    (re.compile(r"\b(links?|urls?)\b", re.IGNORECASE), re.compile(r"https?://|www\.", re.IGNORECASE)),
+)
+
+
+def _stem(word: str) -> str:
+    # Enough folding for "prices"/"price" and "shipping"/"ship" to meet; not a real stemmer.
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith("es") and word[:-2].endswith(("s", "x", "z", "ch", "sh")) and len(word) > 4:
+        return word[:-2]
+    if word.endswith("s") and not word.endswith(("ss", "us", "is")) and len(word) > 3:
+        return word[:-1]
+    for suffix in ("ing", "ed"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            stem = word[:-len(suffix)]
+            # "shipping" -> "shipp" -> "ship"
+            if stem[-1] == stem[-2] and stem[-1] not in "lsz":
+                stem = stem[:-1]
+            return stem
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    return [_stem(word) for word in WORD_RE.findall(text.lower())]
+
+
+def query_terms(instruction: str) -> List[str]:
+    return sorted({_stem(word) for word in WORD_RE.findall(instruction.lower()) if word not in _QUERY_STOP_WORDS})
+
+
+def compile_hints(hints: Sequence[str]) -> List[Pattern]:
+    # Keywords or regular expressions; anything that fails to compile is matched literally.
+    patterns = []
+    for hint in hints:
+        hint = hint.strip()
+        if not hint:
+            continue
+        try:
+            patterns.append(re.compile(hint, re.IGNORECASE))
+        except re.error:
+            patterns.append(re.compile(re.escape(hint), re.IGNORECASE))
+    return patterns
+
+
+def bm25_scores(chunks: Sequence[str], terms: Sequence[str]) -> List[float]:
+    if not terms:
+        return [0.0] * len(chunks)
+    wanted = set(terms)
+    lengths, counts = [], []
+    for chunk in chunks:
+        tokens = tokenize(chunk)
+        lengths.append(len(tokens))
+        counts.append(Counter(token for token in tokens if token in wanted))
+    average = sum(lengths) / len(lengths) or 1.0
+    df = Counter(term for count in counts for term in count)
+    idf = {term: math.log((len(chunks) - df[term] + 0.5) / (df[term] + 0.5) + 1) for term in terms}
+    scores = []
+    for length, count in zip(lengths, counts):
+        norm = K1 * (1 - B + B * length / average)
+        scores.append(sum(idf[term] * tf * (K1 + 1) / (tf + norm) for term, tf in count.items()))
+    return scores
+
+
+@dataclass
+class Selection:
+    kept: List[int]
+    skipped: List[int] = field(default_factory=list)
+    scores: List[float] = field(default_factory=list)
+    reason: Optional[str] = None
+
+    def skipped_results(self) -> List[Dict[str, Any]]:
+        # One entry per chunk not sent, so reports and exports show what the analysis did not look at.
+        return [{"skipped": SKIPPED_REASON, "chunk": i, "score": round(self.scores[i], 3)} for i in self.skipped]
+
+    def number_results(self, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # Analysis results come back in the order the kept chunks were sent. Chunks split to fit the context
+        # window no longer line up one to one, so those results stay unnumbered.
+        if len(results) == len(self.kept):
+            for i, result in zip(self.kept, results):
+                result.setdefault("chunk", i)
+        return results
+
+
+def select_chunks(
+        data_bits: Sequence[str],
+        instruction: str,
+        hints: Sequence[str] = (),
+        top_k: Optional[int] = TOP_K,
+        threshold: float = THRESHOLD,
+        min_chunks: int = MIN_CHUNKS,
+        min_fraction: float = MIN_FRACTION,
+        neighbors: int = NEIGHBORS,
+        enabled: bool = RELEVANCE_FILTER
+) -> Selection:
+    n = len(data_bits)
+    everything = list(range(n))
+    if not enabled or n <= min_chunks:
+        return Selection(everything, reason="filter off" if not enabled else "too few chunks to filter")
+
+    terms = query_terms(instruction)
+    boosts = [pattern for trigger, pattern in DEFAULT_HINTS if trigger.search(instruction)]
+    required = compile_hints(hints)
+    if not terms and not boosts and not required:
+        return Selection(everything, reason="no searchable terms in the instruction")
+
+    with metrics.span("relevance", chunks=n):
+        scores = bm25_scores(data_bits, terms)
+        best = max(scores) or 1.0
+        combined = []
+        forced = set()
+        for i, chunk in enumerate(data_bits):
+            score = scores[i] / best + HINT_WEIGHT * sum(1 for pattern in boosts if pattern.search(chunk))
+            if any(pattern.search(chunk) for pattern in required):
+                forced.add(i)
+            combined.append(score)
+
+    top = max(combined)
+    if top <= 0 and not forced:
+        # Nothing on the page looks like the instruction; better to ask the LLM than to drop the page.
+        return Selection(everything, scores=combined, reason="no chunk matches the instruction")
+
+    ranked = sorted(everything, key=lambda i: combined[i], reverse=True)
+    if _EXHAUSTIVE.search(instruction):
+        keep = {i for i in everything if combined[i] > 0}
+    else:
+        keep = {i for i in ranked[:top_k] if combined[i] > 0 and combined[i] >= threshold * top}
+    keep |= forced
+    floor = max(min_chunks, math.ceil(min_fraction * n))
+    for i in ranked:
+        if len(keep) >= floor:
+            break
+        keep.add(i)
+    for i in list(keep):
+        keep.update(range(max(0, i - neighbors), min(n, i + neighbors + 1)))
+
+    kept = sorted(keep)
+    skipped = [i for i in everything if i not in keep]
+    metrics.inc("chunks_skipped", len(skipped), reason="relevance")
+    logger.info("Relevance filter kept %d of %d chunks", len(kept), n,
+                extra={"terms": terms, "skipped": skipped[:50], "best_score": round(best, 3)})
+    return Selection(kept, skipped, combined, f"kept {len(kept)} of {n} chunks relevant to the instruction")
@@ -0,0 +1,98 @@
+import hashlib
+import json
+import sys
+import threading
+from typing import Any, Callable, Hashable, Tuple
+
+from cachetools import LRUCache
+
+import metrics
+from settings import get_int
+
+
+def _sizeof(value: Any) -> int:
+    if isinstance(value, (bytes, str)):
+        return len(value)
+    memory_usage = getattr(value, "memory_usage", None)
+    if callable(memory_usage):
+        try:
+            return int(memory_usage(index=True).sum())
+        except Exception:
+            pass
+    nbytes = getattr(value, "nbytes", None)
+    if isinstance(nbytes, int):
+        return nbytes
+    return sys.getsizeof(value)
+
+
+class RenderCache:
+    def __init__(self, max_bytes: int):
+        self._lock = threading.Lock()
+        self._cache = LRUCache(maxsize=max_bytes, getsizeof=lambda entry: entry[1])
+
+    def get_or_build(self, kind: str, key: Tuple[Hashable, ...], build: Callable[[], Any]) -> Any:
+        cache_key = (kind,) + tuple(key)
+        with self._lock:
+            entry = self._cache.get(cache_key)
+        if entry is not None:
+            metrics.inc("cache_hits", kind=kind)
+            return entry[0]
+
+        metrics.inc("cache_misses", kind=kind)
+        value = build()
+        if value is None:
+            return value
+        size = _sizeof(value)
+        with self._lock:
+            if size <= self._cache.maxsize:
+                self._cache[cache_key] = (value, size)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+
+render_cache = RenderCache(max_bytes=get_int("RENDER_CACHE_MB", 256) * 1024 * 1024)
+
+# Session state hands back the same objects on every rerun, so remember their digests by identity.
+# The memo keeps a reference to each object so its id cannot be reused while it is cached here, so it is
+# bounded by the size of what it holds. Strings and bytes are hashed directly instead of being pinned.
+_digests = LRUCache(maxsize=get_int("RENDER_DIGEST_MEMO_MB", 32) * 1024 * 1024, getsizeof=lambda memo: memo[2])
+_digests_lock = threading.Lock()
+
+
+def content_hash(value: Any) -> str:
+    # Content-store handles already carry the digest of their text.
+    digest = getattr(value, "content_digest", None)
+    if digest is not None:
+        return digest
+    if isinstance(value, bytes):
+        return hashlib.blake2b(value, digest_size=16).hexdigest()
+    if isinstance(value, str):
+        return hashlib.blake2b(value.encode("utf-8"), digest_size=16).hexdigest()
+
+    key = id(value)
+    with _digests_lock:
+        memo = _digests.get(key)
+        if memo is not None and memo[0] is value:
+            return memo[1]
+
+    if type(value).__module__.startswith("pandas"):
+        # json.dumps would fall back to the truncated repr of a DataFrame.
+        import pandas as pd
+        data = pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes()
+        data += json.dumps([str(c) for c in getattr(value, "columns", [])]).encode("utf-8")
+    else:
+        data = json.dumps(value, sort_keys=True, default=str).encode("utf-8")
+    digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+
+    size = max(_sizeof(value), len(data))
+    with _digests_lock:
+        if size <= _digests.maxsize:
+            _digests[key] = (value, digest, size)
+    return digest
+
+
+def cached(kind: str, value: Any, *params: Hashable, build: Callable[[], Any]) -> Any:
+    return render_cache.get_or_build(kind, (content_hash(value),) + params, build)
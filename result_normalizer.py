@@ -0,0 +1,95 @@
+import json
+import re
+from typing import Any, Dict, Iterable, List, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+_CONVERTIBLE = {"string", "mixed", "mixed-integer", "mixed-integer-float"}
+# IDs, zip codes and phone numbers such as "00123" would lose their leading zeros as numbers.
+_LEADING_ZERO = re.compile(r"\s*[+-]?0\d")
+
+
+def _flatten(record: Dict[str, Any], prefix: str = "", out: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    # Same dotted column names as pd.json_normalize, without its per-call overhead.
+    if out is None:
+        out = {}
+    for key, value in record.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict) and value:
+            _flatten(value, f"{name}.", out)
+        else:
+            out[name] = value
+    return out
+
+
+def _content_of(item: Any) -> Any:
+    if not isinstance(item, dict):
+        return None
+    if "content" in item:
+        content = item["content"]
+    elif isinstance(item.get("data"), dict):
+        content = item["data"].get("content")
+    else:
+        return None
+    if isinstance(content, str):
+        try:
+            content = json.loads(content)
+        except json.JSONDecodeError:
+            pass
+    return content
+
+
+class ResultNormalizer:
+    # Builds a columnar table from AnalysisResponse.content payloads as they arrive.
+    def __init__(self):
+        self._columns: Dict[str, List[Any]] = {}
+        self._rows = 0
+        self._frame: Optional["pd.DataFrame"] = None
+
+    def __len__(self) -> int:
+        return self._rows
+
+    def add(self, item: Any) -> None:
+        content = _content_of(item)
+        if isinstance(content, dict):
+            self._add_record(content)
+        elif isinstance(content, list):
+            for record in content:
+                self._add_record(record if isinstance(record, dict) else {"value": record})
+
+    def extend(self, items: Iterable[Any]) -> "ResultNormalizer":
+        for item in items:
+            self.add(item)
+        return self
+
+    def _add_record(self, record: Dict[str, Any]) -> None:
+        self._frame = None
+        for key, value in _flatten(record).items():
+            column = self._columns.get(key)
+            if column is None:
+                column = self._columns[key] = [None] * self._rows
+            column.append(value)
+        self._rows += 1
+        for column in self._columns.values():
+            if len(column) < self._rows:
+                column.append(None)
+
+    def to_frame(self) -> "pd.DataFrame":
+        import pandas as pd
+        if self._frame is None:
+            frame = pd.DataFrame(self._columns)
+            # LLMs often return numbers as strings; convert whole columns that are fully numeric.
+            for name in frame.columns:
+                if pd.api.types.infer_dtype(frame[name], skipna=True) not in _CONVERTIBLE:
+                    continue
+                if any(isinstance(v, str) and _LEADING_ZERO.match(v) for v in frame[name]):
+                    continue
+                try:
+                    frame[name] = pd.to_numeric(frame[name])
+                except (TypeError, ValueError):
+                    pass
+            self._frame = frame
+        return self._frame
+
@@ -8,12 +8,17 @@ from selenium.common.exceptions import TimeoutException, WebDriverException
 from bs4 import BeautifulSoup
 import os
 import time
-from typing import Callable, Tuple, List
+from typing import Callable, Tuple, List, Optional, Union
 from retrying import retry
 import random
+import metrics
+from block_detection import SCAN_CHARS, BlockVerdict, detect_block
+from content_store import ChunkList, StoredContent, content_store
+from large_page import (LARGE_PAGE_CHARS, SpilledPage, clean_spilled, page_length, release_snapshot,
+                        spill_from_driver)
+from search_index import index_content
+from structured_data import StructuredData, extract_structured, has_structure
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 # Get WebDriver URL from environment variable
@@ -34,9 +39,37 @@ user_agents = [
 
 languages = ['en-US,en;q=0.9', 'en-GB,en;q=0.8', 'es-ES,es;q=0.9']
 
+# Status of the main document from the Navigation Timing API (Chrome 109+); None when unavailable
+NAVIGATION_STATUS_SCRIPT = "const n = performance.getEntriesByType('navigation')[0]; return n ? n.responseStatus : null;"
+
+
+def _create_driver(chrome_options: ChromeOptions) -> Remote:
+    logger.debug("Connecting to remote WebDriver: %s", SBR_WEBDRIVER)
+    sbr_connection = ChromiumRemoteConnection(SBR_WEBDRIVER, 'goog', 'chrome')
+    return Remote(sbr_connection, options=chrome_options)
+
+
+def _navigation_status(driver: Remote) -> Optional[int]:
+    try:
+        status = driver.execute_script(NAVIGATION_STATUS_SCRIPT)
+    except Exception:
+        return None
+    # responseStatus is 0 for cached or cross-origin responses
+    return int(status) if status else None
+
+
+def _log_block(site: str, verdict: BlockVerdict) -> None:
+    logger.error("Possible blocking detected: %s", verdict.reason,
+                 extra={"url": site, "block_category": verdict.category})
+    metrics.inc("blocks", category=verdict.category)
+
+
 @retry(stop_max_attempt_number=3, wait_fixed=2000)
-def scrape_website(site: str) -> str:
-    logger.info(f"Scraping website: {site}")
+def scrape_website(
+        site: str,
+        driver_factory: Optional[Callable[[ChromeOptions], Remote]] = None
+) -> Union[str, SpilledPage, None]:
+    logger.info("Scraping website: %s", site)
     chrome_options = ChromeOptions()
     chrome_options.add_argument(f"--user-agent={random.choice(user_agents)}")
     chrome_options.add_argument(f"--lang={random.choice(languages)}")
@@ -46,76 +79,149 @@ def scrape_website(site: str) -> str:
     chrome_options.platform_name = 'any'
 
     try:
-        logger.info(f"Connecting to remote WebDriver: {SBR_WEBDRIVER}")
-        sbr_connection = ChromiumRemoteConnection(SBR_WEBDRIVER, 'goog', 'chrome')
-        with Remote(sbr_connection, options=chrome_options) as driver:
-            logger.info("Successfully connected to remote WebDriver")
-            logger.info(f"Navigating to: {site}")
+        with metrics.span("fetch"), (driver_factory or _create_driver)(chrome_options) as driver:
+            logger.debug("Connected to remote WebDriver, navigating to: %s", site)
             driver.get(site)
 
             wait = WebDriverWait(driver, 20)
             wait.until(EC.presence_of_element_located((By.TAG_NAME, "body")))
 
+            status = _navigation_status(driver)
+
+            # Huge pages are streamed to a temp file instead of being pulled into memory as one string
+            length = page_length(driver)
+            if length is not None and length > LARGE_PAGE_CHARS:
+                logger.info("Large page, spilling to disk", extra={"url": site, "chars": length})
+                page = spill_from_driver(driver, length)
+                verdict = detect_block(page.head(SCAN_CHARS), status, total_chars=len(page))
+                if verdict:
+                    page.close()
+                    _log_block(site, verdict)
+                    return None
+                return page
+            release_snapshot(driver)
+
             page_source = driver.page_source
             if page_source is None:
                 logger.error("Failed to get page source: page_source is None")
                 return None
 
-            if "access denied" in page_source.lower() or "captcha" in page_source.lower():
-                logger.error("Possible blocking detected")
+            verdict = detect_block(page_source, status)
+            if verdict:
+                _log_block(site, verdict)
                 return None
 
-            logger.info("Successfully scraped the website using Selenium")
+            logger.debug("Successfully scraped the website using Selenium")
 
 
 
             return page_source
     except TimeoutException:
-        logger.error("Timeout while loading the page")
+        logger.error("Timeout while loading the page", extra={"url": site})
     except WebDriverException as e:
-        logger.error(f"WebDriver error: {str(e)}")
+        logger.error("WebDriver error: %s", e, extra={"url": site})
     except Exception as e:
-        logger.error(f"Unexpected error: {str(e)}")
-        logger.error(f"URL being scraped: {site}")
+        logger.error("Unexpected error: %s", e, extra={"url": site})
 
     return None
 
 
-def scrape_with_progress(url: str, progress_callback: Callable[[int, str], None]) -> Tuple[str, List[str]]:
-    logger.info(f"Starting scrape_with_progress for URL: {url}")
+def _fetch_and_clean(
+        url: str,
+        progress_callback: Callable[[int, str], None],
+        driver_factory: Optional[Callable[[ChromeOptions], Remote]] = None,
+        with_structure: bool = False
+) -> Tuple[str, Optional[StructuredData]]:
+    logger.debug("Starting scrape_with_progress for URL: %s", url)
     progress_callback(0, "Initializing scraper...")
     time.sleep(1)  # Simulate initialization time
 
     progress_callback(20, "Fetching webpage...")
-    html_content = scrape_website(url)
-    logger.info(f"HTML content fetched, length: {len(html_content) if html_content else 'None'}")
+    html_content = scrape_website(url, driver_factory)
+    logger.debug("HTML content fetched", extra={"chars": len(html_content) if html_content else None})
     if html_content is None:
         logger.error("Failed to fetch webpage content")
         progress_callback(100, "Scraping failed")
         raise Exception("Failed to fetch webpage content")
 
+    if isinstance(html_content, SpilledPage):
+        # Extract and clean in one streaming pass over the mapped file
+        progress_callback(40, "Extracting content from large page...")
+        with html_content:
+            structured = (extract_structured(html_content.windows())
+                          if with_structure and has_structure(html_content.windows()) else None)
+            with metrics.span("extract", large=True):
+                cleaned_content = clean_spilled(html_content)
+        progress_callback(60, "Cleaning data...")
+        logger.debug("Cleaned content", extra={"chars": len(cleaned_content), "large": True})
+        return cleaned_content, structured
+
     progress_callback(40, "Extracting content...")
-    extracted_content = extract_url(html_content)
-    logger.info(f"Extracted content length: {len(extracted_content)}")
+    # Tables and embedded metadata are read from the markup before it is flattened to text
+    structured = extract_structured(html_content) if with_structure and has_structure(html_content) else None
+    with metrics.span("extract"):
+        extracted_content = extract_url(html_content)
+    logger.debug("Extracted content", extra={"chars": len(extracted_content)})
 
     progress_callback(60, "Cleaning data...")
-    cleaned_content = clean_url(extracted_content)
-    logger.info(f"Cleaned content length: {len(cleaned_content)}")
+    with metrics.span("clean"):
+        cleaned_content = clean_url(extracted_content)
+    logger.debug("Cleaned content", extra={"chars": len(cleaned_content)})
+    return cleaned_content, structured
+
+
+def fetch_and_clean(url: str, with_structure: bool = False) -> Tuple[str, Optional[StructuredData]]:
+    # For callers without a progress bar, such as queue workers.
+    return _fetch_and_clean(url, lambda progress, message: None, with_structure=with_structure)
+
+
+def scrape_with_progress(
+        url: str,
+        progress_callback: Callable[[int, str], None],
+        driver_factory: Optional[Callable[[ChromeOptions], Remote]] = None
+) -> Tuple[str, List[str]]:
+    cleaned_content, _ = _fetch_and_clean(url, progress_callback, driver_factory)
 
     progress_callback(80, "Preparing for analysis...")
-    data_bits = batch_max_url(cleaned_content)
-    logger.info(f"Number of data bits: {len(data_bits)}")
+    with metrics.span("chunk"):
+        data_bits = batch_max_url(cleaned_content)
+    logger.debug("Chunked content", extra={"chunks": len(data_bits)})
 
     progress_callback(100, "Scraping complete!")
-    logger.info("Scraping process completed successfully")
+    logger.info("Scraping process completed successfully", extra={"url": url, "chunks": len(data_bits)})
 
     return cleaned_content, data_bits
 
 
-def extract_url(page: str) -> str:
+def scrape_to_store(
+        url: str,
+        progress_callback: Callable[[int, str], None],
+        driver_factory: Optional[Callable[[ChromeOptions], Remote]] = None
+) -> Tuple[StoredContent, ChunkList]:
+    # Like scrape_with_progress, but the text is kept once in the shared content store
+    # and the chunks are offset views into it instead of copies.
+    cleaned_content, structured = _fetch_and_clean(url, progress_callback, driver_factory, with_structure=True)
+
+    progress_callback(80, "Preparing for analysis...")
+    with metrics.span("chunk"):
+        content = content_store.put(cleaned_content, structured)
+        data_bits = content.chunks(6000)
+    logger.debug("Chunked content", extra={"chunks": len(data_bits)})
+    index_content(url, content)
+
+    progress_callback(100, "Scraping complete!")
+    logger.info("Scraping process completed successfully", extra={"url": url, "chunks": len(data_bits)})
+
+    return content, data_bits
+
+
+def extract_url(page: str, links: Optional[List[str]] = None) -> str:
     if not page:
         return ""
     soup = BeautifulSoup(page, 'html.parser')
+    if links is not None:
+        # Collected from the same parse for the crawler
+        links.extend(a['href'] for a in soup.find_all('a', href=True))
     return str(soup.body) if soup.body else ""
 
 
@@ -133,6 +239,9 @@ def batch_max_url(content: str, max_length: int = 6000) -> List[str]:
 
 
 if __name__ == "__main__":
+    from log_config import configure_logging
+    configure_logging()
+
     def print_progress(progress: int, message: str):
         print(f"Progress: {progress}% - {message}")
 
@@ -0,0 +1,192 @@
+import logging
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Iterator, List, Optional, Tuple
+
+import metrics
+from content_store import StoredContent, content_store
+from settings import get_bool, get_int, get_setting
+
+logger = logging.getLogger(__name__)
+
+# Every cleaned page is kept in a local full-text index so past scrapes can be searched and reloaded.
+SEARCH_INDEX = get_bool("SEARCH_INDEX", True)
+INDEX_PATH = get_setting("SEARCH_INDEX_PATH", "search_index.db")
+INDEX_CHUNK_CHARS = get_int("SEARCH_INDEX_CHUNK_CHARS", 2000)
+
+_TERM = re.compile(r"\w+", re.UNICODE)
+
+
+@dataclass
+class IndexedPage:
+    id: int
+    url: str
+    content_hash: str
+    scraped_at: float
+    chars: int
+
+
+@dataclass
+class SearchHit:
+    page: IndexedPage
+    chunk: int
+    snippet: str
+    score: float
+
+
+def _chunks(text: str, size: int) -> Iterator[Tuple[int, str]]:
+    # Break on the last newline in each window so hits and snippets don't cut words in half.
+    start, n = 0, 0
+    while start < len(text):
+        end = min(start + size, len(text))
+        if end < len(text):
+            newline = text.rfind("\n", start + size // 2, end)
+            end = newline + 1 if newline != -1 else end
+        yield n, text[start:end]
+        start, n = end, n + 1
+
+
+class SearchIndex:
+    # SQLite FTS5 when the sqlite3 build has it, plain LIKE queries otherwise.
+    def __init__(self, path: str = INDEX_PATH):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connection()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS pages (
+                id INTEGER PRIMARY KEY,
+                url TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                scraped_at REAL NOT NULL,
+                chars INTEGER NOT NULL,
+                UNIQUE (url, content_hash)
+            );
+            CREATE TABLE IF NOT EXISTS chunks (
+                id INTEGER PRIMARY KEY,
+                page_id INTEGER NOT NULL REFERENCES pages (id) ON DELETE CASCADE,
+                chunk INTEGER NOT NULL,
+                text TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS chunks_page ON chunks (page_id, chunk);
+        """)
+        try:
+            conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5("
+                         "text, content='chunks', content_rowid='id', tokenize='porter unicode61')")
+            self.fts = True
+        except sqlite3.OperationalError as e:
+            logger.warning("SQLite FTS5 unavailable, search falls back to LIKE: %s", e)
+            self.fts = False
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def add(self, url: str, content: StoredContent, chunk_chars: int = INDEX_CHUNK_CHARS) -> int:
+        # A page already indexed with the same text only gets its timestamp bumped.
+        conn = self._connection()
+        now = time.time()
+        with conn, metrics.span("index_page", chars=len(content)):
+            row = conn.execute("SELECT id FROM pages WHERE url = ? AND content_hash = ?",
+                               (url, content.content_digest)).fetchone()
+            if row is not None:
+                conn.execute("UPDATE pages SET scraped_at = ? WHERE id = ?", (now, row[0]))
+                return row[0]
+            page_id = conn.execute("INSERT INTO pages (url, content_hash, scraped_at, chars) VALUES (?, ?, ?, ?)",
+                                   (url, content.content_digest, now, len(content))).lastrowid
+            for n, text in _chunks(content.text, chunk_chars):
+                chunk_id = conn.execute("INSERT INTO chunks (page_id, chunk, text) VALUES (?, ?, ?)",
+                                        (page_id, n, text)).lastrowid
+                if self.fts:
+                    conn.execute("INSERT INTO chunks_fts (rowid, text) VALUES (?, ?)", (chunk_id, text))
+        metrics.inc("pages_indexed")
+        return page_id
+
+    @staticmethod
+    def _page(row) -> IndexedPage:
+        return IndexedPage(*row)
+
+    def search(self, query: str, limit: int = 20, url: Optional[str] = None) -> List[SearchHit]:
+        terms = _TERM.findall(query)
+        if not terms:
+            return []
+        with metrics.span("index_search", fts=self.fts):
+            return self._search_fts(terms, limit, url) if self.fts else self._search_like(terms, limit, url)
+
+    def _search_fts(self, terms: List[str], limit: int, url: Optional[str]) -> List[SearchHit]:
+        # Every term must match; quoting keeps user input from being read as FTS5 syntax.
+        match = " ".join(f'"{term}"' for term in terms)
+        rows = self._connection().execute(
+            "SELECT p.id, p.url, p.content_hash, p.scraped_at, p.chars, c.chunk, "
+            "snippet(chunks_fts, 0, '**', '**', '…', 16), bm25(chunks_fts) "
+            "FROM chunks_fts JOIN chunks c ON c.id = chunks_fts.rowid JOIN pages p ON p.id = c.page_id "
+            "WHERE chunks_fts MATCH ? AND (? IS NULL OR p.url = ?) ORDER BY bm25(chunks_fts) LIMIT ?",
+            (match, url, url, limit))
+        # bm25() is lower for better matches; flip it so higher scores mean better hits everywhere.
+        return [SearchHit(self._page(row[:5]), row[5], row[6], -row[7]) for row in rows]
+
+    def _search_like(self, terms: List[str], limit: int, url: Optional[str]) -> List[SearchHit]:
+        conditions = " AND ".join("c.text LIKE ?" for _ in terms)
+        rows = self._connection().execute(
+            "SELECT p.id, p.url, p.content_hash, p.scraped_at, p.chars, c.chunk, c.text "
+            f"FROM chunks c JOIN pages p ON p.id = c.page_id WHERE {conditions} AND (? IS NULL OR p.url = ?) "
+            "ORDER BY p.scraped_at DESC LIMIT ?",
+            (*(f"%{term}%" for term in terms), url, url, limit * 5))
+        hits = []
+        for row in rows:
+            text = row[6].lower()
+            first = min(text.find(term.lower()) for term in terms)
+            snippet = row[6][max(0, first - 80):first + 120].replace("\n", " ")
+            score = float(sum(text.count(term.lower()) for term in terms))
+            hits.append(SearchHit(self._page(row[:5]), row[5], f"…{snippet}…", score))
+        hits.sort(key=lambda hit: hit.score, reverse=True)
+        return hits[:limit]
+
+    def pages(self, limit: int = 50, url: Optional[str] = None) -> List[IndexedPage]:
+        rows = self._connection().execute(
+            "SELECT id, url, content_hash, scraped_at, chars FROM pages WHERE (? IS NULL OR url = ?) "
+            "ORDER BY scraped_at DESC LIMIT ?", (url, url, limit))
+        return [self._page(row) for row in rows]
+
+    def latest(self, url: str) -> Optional[IndexedPage]:
+        pages = self.pages(1, url)
+        return pages[0] if pages else None
+
+    def load(self, page_id: int) -> StoredContent:
+        # Back into the shared content store, ready for analysis without fetching the page again.
+        rows = self._connection().execute("SELECT text FROM chunks WHERE page_id = ? ORDER BY chunk", (page_id,))
+        return content_store.put("".join(row[0] for row in rows))
+
+    def stats(self) -> dict:
+        conn = self._connection()
+        pages, chars = conn.execute("SELECT COUNT(*), COALESCE(SUM(chars), 0) FROM pages").fetchone()
+        return {"pages": pages, "chars": chars, "fts": self.fts}
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+@lru_cache(maxsize=1)
+def default_index() -> SearchIndex:
+    return SearchIndex()
+
+
+def index_content(url: str, content: StoredContent) -> None:
+    # Called at the end of every scrape; a broken index never fails the scrape itself.
+    if not SEARCH_INDEX:
+        return
+    try:
+        default_index().add(url, content)
+    except Exception as e:
+        logger.warning("Could not index page: %s", e, extra={"url": url})
@@ -0,0 +1,44 @@
+import os
+from typing import Any, Optional
+
+
+# Environment variables take precedence over .streamlit/secrets.toml so that
+# benchmarks and workers can override settings without touching secrets.
+def get_setting(name: str, default: Any = None) -> Any:
+    value = os.getenv(name)
+    if value is not None:
+        return value
+    try:
+        import streamlit as st
+        return st.secrets.get(name, default)
+    except Exception:
+        return default
+
+
+def get_int(name: str, default: Optional[int] = None) -> Optional[int]:
+    value = get_setting(name)
+    if value in (None, ""):
+        return default
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def get_float(name: str, default: Optional[float] = None) -> Optional[float]:
+    value = get_setting(name)
+    if value in (None, ""):
+        return default
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def get_bool(name: str, default: bool = False) -> bool:
+    value = get_setting(name)
+    if value in (None, ""):
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
@@ -0,0 +1,150 @@
+import base64
+import hashlib
+import json
+import logging
+import os
+import ssl
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+from functools import lru_cache
+from typing import Any, Callable, Dict, Optional
+
+from settings import get_float, get_setting
+
+logger = logging.getLogger(__name__)
+
+LOTTIE_URLS = {
+    "analyzing": "https://lottie.host/e7b1797e-f02a-44be-b28f-c3e26c69fbd3/4PF5hVXPST.json",
+    "robot": "https://lottie.host/2945d2be-6612-4bc3-8ffc-4bbaa755045b/y0olOO2xO7.json",
+    "sidebar": "https://lottie.host/3af8aa11-aec4-4661-98a6-6396ff474e0f/YIpGN6tsQ9.json",
+}
+
+# (resource path checked with nltk.data.find, package passed to nltk.download)
+NLTK_RESOURCES = (
+    ("corpora/stopwords", "stopwords"),
+)
+
+ASSET_CACHE_DIR = get_setting("ASSET_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "ai-web-scraper"))
+ASSET_TIMEOUT = get_float("ASSET_TIMEOUT", 5.0)
+# A failed fetch is not retried before this many seconds, so an offline server does not refetch on every rerun.
+ASSET_RETRY_SECONDS = get_float("ASSET_RETRY_SECONDS", 300.0)
+
+# Module state lives for the whole server process, unlike the Streamlit script which reruns per interaction.
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="startup")
+_futures: Dict[str, Future] = {}
+_failed_at: Dict[str, float] = {}
+_lock = threading.Lock()
+
+
+def _failed(future: Future) -> bool:
+    return future.done() and (future.exception() is not None or not future.result())
+
+
+def _submit(key: str, fn: Callable, *args) -> Future:
+    # A fetch that failed or came back empty is retried on next use, but at most every ASSET_RETRY_SECONDS.
+    with _lock:
+        future = _futures.get(key)
+        if future is not None and _failed(future):
+            if key not in _failed_at:
+                _failed_at[key] = time.monotonic()
+                if future.exception() is not None:
+                    logger.warning("Startup asset %s failed to load: %s", key, future.exception())
+            if time.monotonic() - _failed_at[key] >= ASSET_RETRY_SECONDS:
+                future = None
+        if future is None:
+            _failed_at.pop(key, None)
+            future = _futures[key] = _executor.submit(fn, *args)
+        return future
+
+
+def _wait(future: Future, timeout: Optional[float]) -> Any:
+    try:
+        return future.result(timeout=timeout)
+    except TimeoutError:
+        return None
+    except Exception:
+        # Logged once by _submit
+        return None
+
+
+def ensure_nltk_data() -> bool:
+    import nltk
+    ok = True
+    for resource, package in NLTK_RESOURCES:
+        try:
+            nltk.data.find(resource)
+            continue
+        except LookupError:
+            pass
+        try:
+            nltk.download(package, quiet=True, raise_on_error=True)
+        except ssl.SSLError:
+            logger.warning("SSL error while downloading NLTK package %s", package)
+            ok = False
+        except Exception as e:
+            logger.warning("Could not download NLTK package %s: %s", package, e)
+            ok = False
+    return ok
+
+
+def _cache_path(url: str) -> str:
+    return os.path.join(ASSET_CACHE_DIR, hashlib.sha1(url.encode("utf-8")).hexdigest() + ".json")
+
+
+def fetch_lottie(url: str) -> Optional[dict]:
+    path = _cache_path(url)
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        pass
+
+    import requests
+    try:
+        r = requests.get(url, timeout=ASSET_TIMEOUT)
+        if r.status_code != 200:
+            return None
+        data = r.json()
+    except Exception as e:
+        logger.warning("Error loading Lottie animation %s: %s", url, e)
+        return None
+
+    try:
+        os.makedirs(ASSET_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.debug("Could not cache Lottie animation: %s", e)
+    return data
+
+
+def prefetch_assets() -> None:
+    _submit("nltk", ensure_nltk_data)
+    for name, url in LOTTIE_URLS.items():
+        _submit(f"lottie:{name}", fetch_lottie, url)
+
+
+def lottie(name: str, timeout: Optional[float] = 0.0) -> Optional[dict]:
+    # Returns None while the animation is still loading so pages render without waiting on decoration.
+    return _wait(_submit(f"lottie:{name}", fetch_lottie, LOTTIE_URLS[name]), timeout)
+
+
+@lru_cache(maxsize=4)
+def background_css(path: str) -> Optional[str]:
+    try:
+        with open(path, "rb") as f:
+            encoded = base64.b64encode(f.read()).decode()
+    except Exception as e:
+        logger.error("Error loading background image: %s", e)
+        return None
+    return f"""
+        <style>
+        .stApp {{
+            background-image: url("data:image/jpg;base64,{encoded}");
+            background-size: cover;
+        }}
+        </style>
+        """
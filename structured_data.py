@@ -0,0 +1,379 @@
+import json
+import logging
+import re
+from dataclasses import asdict, dataclass, field
+from html.parser import HTMLParser
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, TYPE_CHECKING
+
+import metrics
+from settings import get_bool
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Table and metadata requests are answered from the page's own markup instead of the LLM.
+FAST_PATH = get_bool("STRUCTURED_FAST_PATH", True)
+MODEL_NAME = "structured-data"
+
+# Cheap test for whether a page has anything worth a second parse.
+_MARKERS = re.compile(r"<table|application/ld\+json|itemscope|<meta[^>]+(?:og|twitter|article|product):",
+                      re.IGNORECASE)
+_VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source",
+              "track", "wbr"}
+# Where a microdata property takes its value from instead of the element's text.
+_VALUE_ATTRS = {"meta": "content", "a": "href", "link": "href", "area": "href", "img": "src", "audio": "src",
+                "video": "src", "source": "src", "iframe": "src", "embed": "src", "object": "data",
+                "time": "datetime", "data": "value", "meter": "value"}
+_META_PREFIXES = ("og:", "twitter:", "article:", "product:")
+_SPACE = re.compile(r"\s+")
+
+TABLE_REQUEST = re.compile(r"\b(tables?|tabular|rows?|columns?|spreadsheets?|csv)\b", re.IGNORECASE)
+METADATA_REQUEST = re.compile(
+    r"\b(meta ?data|meta tags?|json-?ld|schema(?:\.org)?|open ?graph|og tags?|structured data|microdata)\b",
+    re.IGNORECASE)
+# Words that say nothing beyond "give me the table"; anything else in the instruction still needs the LLM.
+_FILLER = {
+    "a", "all", "an", "and", "any", "as", "data", "each", "every", "extract", "find", "format", "from", "get",
+    "give", "html", "in", "info", "information", "into", "it", "its", "json", "list", "me", "of", "on", "out",
+    "page", "please", "pull", "return", "show", "site", "structured", "that", "the", "their", "them", "these",
+    "this", "those", "to", "webpage", "website", "with",
+}
+_WORD = re.compile(r"[a-z][a-z\-.]*")
+
+
+@dataclass
+class Table:
+    columns: List[str]
+    rows: List[List[str]]
+    caption: Optional[str] = None
+
+    def records(self) -> List[Dict[str, str]]:
+        return [dict(zip(self.columns, row)) for row in self.rows]
+
+    def to_frame(self) -> "pd.DataFrame":
+        import pandas as pd
+        return pd.DataFrame(self.rows, columns=self.columns)
+
+
+@dataclass
+class StructuredData:
+    tables: List[Table] = field(default_factory=list)
+    json_ld: List[Dict[str, Any]] = field(default_factory=list)
+    microdata: List[Dict[str, Any]] = field(default_factory=list)
+    # OpenGraph, Twitter card and description <meta> tags
+    metadata: Dict[str, str] = field(default_factory=dict)
+    # Lines of cleaned page text that came from table cells, used to build the residual text.
+    table_lines: Set[str] = field(default_factory=set, repr=False)
+
+    def __bool__(self) -> bool:
+        return bool(self.tables or self.json_ld or self.microdata or self.metadata)
+
+    @property
+    def has_metadata(self) -> bool:
+        return bool(self.json_ld or self.microdata or self.metadata)
+
+    def summary(self) -> str:
+        parts = [(len(self.tables), "table"), (len(self.json_ld), "JSON-LD item"),
+                 (len(self.microdata), "microdata item"), (len(self.metadata), "meta tag")]
+        return ", ".join(f"{n} {name}{'s' if n != 1 else ''}" for n, name in parts if n)
+
+    def to_dict(self) -> Dict[str, Any]:
+        # JSON-safe, for handing structure from a queue worker back to the app.
+        return {**asdict(self), "table_lines": sorted(self.table_lines)}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "StructuredData":
+        return cls(tables=[Table(**table) for table in data.get("tables", [])], json_ld=data.get("json_ld", []),
+                   microdata=data.get("microdata", []), metadata=data.get("metadata", {}),
+                   table_lines=set(data.get("table_lines", [])))
+
+
+class _TableBuilder:
+    def __init__(self):
+        self.rows: List[List[str]] = []
+        self.header_rows: List[bool] = []
+        self.row: Optional[List[str]] = None
+        self.row_is_header = True
+        self.cell: Optional[List[str]] = None
+        self.lines: Set[str] = set()
+        self.colspan = 1
+        self.caption: Optional[List[str]] = None
+        self.caption_text: Optional[str] = None
+        self.in_head = False
+
+    def start_row(self) -> None:
+        self.end_row()
+        self.row, self.row_is_header = [], True
+
+    def start_cell(self, header: bool, colspan: int) -> None:
+        if self.row is None:
+            self.start_row()
+        self.end_cell()
+        self.cell, self.colspan = [], colspan
+        self.row_is_header = self.row_is_header and (header or self.in_head)
+
+    def end_cell(self) -> None:
+        if self.cell is not None:
+            text = _SPACE.sub(" ", " ".join(self.cell)).strip()
+            self.row.extend([text] * self.colspan)
+            self.cell = None
+
+    def end_row(self) -> None:
+        self.end_cell()
+        if self.row:
+            self.rows.append(self.row)
+            self.header_rows.append(self.row_is_header)
+        self.row = None
+
+    def finish(self) -> Optional[Table]:
+        self.end_row()
+        if not self.rows:
+            return None
+        width = max(len(row) for row in self.rows)
+        rows = [row + [""] * (width - len(row)) for row in self.rows]
+        if self.header_rows[0]:
+            header, rows = rows[0], rows[1:]
+        else:
+            header = [""] * width
+        # Layout tables (one column, or no data rows) are not data.
+        if width < 2 or not rows:
+            return None
+        columns, seen = [], {}
+        for i, name in enumerate(header):
+            name = name or f"column_{i + 1}"
+            seen[name] = seen.get(name, 0) + 1
+            columns.append(name if seen[name] == 1 else f"{name}_{seen[name]}")
+        return Table(columns, rows, self.caption_text)
+
+
+class _StructureParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.result = StructuredData()
+        self._depth = 0
+        self._skip = 0
+        self._script: Optional[List[str]] = None
+        self._tables: List[_TableBuilder] = []
+        # (depth, item) for open itemscopes and (depth, names, text, item) for open text properties
+        self._scopes: List[tuple] = []
+        self._props: List[tuple] = []
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag not in _VOID_TAGS:
+            self._depth += 1
+        if tag == "script":
+            if "ld+json" in (attrs.get("type") or "").lower():
+                self._script = []
+            else:
+                self._skip += 1
+        elif tag == "style":
+            self._skip += 1
+        elif tag == "meta":
+            self._meta(attrs)
+        self._table_start(tag, attrs)
+        self._microdata_start(tag, attrs)
+
+    def handle_endtag(self, tag):
+        if tag in _VOID_TAGS:
+            return
+        if tag == "script" and self._script is not None:
+            self._json_ld("".join(self._script))
+            self._script = None
+        elif tag in ("script", "style") and self._skip:
+            self._skip -= 1
+        self._table_end(tag)
+        while self._props and self._props[-1][0] >= self._depth:
+            _, names, text, item = self._props.pop()
+            self._set_property(item, names, _SPACE.sub(" ", " ".join(text)).strip())
+        while self._scopes and self._scopes[-1][0] >= self._depth:
+            self._scopes.pop()
+        self._depth = max(0, self._depth - 1)
+
+    def handle_data(self, data):
+        if self._script is not None:
+            self._script.append(data)
+            return
+        if self._skip:
+            return
+        if self._tables:
+            table = self._tables[-1]
+            if table.cell is not None:
+                table.cell.append(data)
+                table.lines.update(line.strip() for line in data.splitlines() if line.strip())
+            elif table.caption is not None:
+                table.caption.append(data)
+        for prop in self._props:
+            prop[2].append(data)
+
+    def _meta(self, attrs: Dict[str, Optional[str]]) -> None:
+        name = (attrs.get("property") or attrs.get("name") or "").lower()
+        content = attrs.get("content")
+        if content and (name.startswith(_META_PREFIXES) or name == "description"):
+            self.result.metadata.setdefault(name, content)
+
+    def _json_ld(self, source: str) -> None:
+        try:
+            data = json.loads(source)
+        except json.JSONDecodeError as e:
+            logger.debug("Skipping invalid JSON-LD: %s", e)
+            return
+        items = data if isinstance(data, list) else [data]
+        for item in items:
+            if isinstance(item, dict) and isinstance(item.get("@graph"), list):
+                self.result.json_ld.extend(i for i in item["@graph"] if isinstance(i, dict))
+            elif isinstance(item, dict):
+                self.result.json_ld.append(item)
+
+    def _table_start(self, tag: str, attrs: Dict[str, Optional[str]]) -> None:
+        if tag == "table":
+            self._tables.append(_TableBuilder())
+        elif not self._tables:
+            return
+        table = self._tables[-1]
+        if tag == "tr":
+            table.start_row()
+        elif tag in ("td", "th"):
+            try:
+                colspan = min(max(int(attrs.get("colspan") or 1), 1), 50)
+            except ValueError:
+                colspan = 1
+            table.start_cell(tag == "th", colspan)
+        elif tag == "thead":
+            table.in_head = True
+        elif tag == "caption":
+            table.caption = []
+
+    def _table_end(self, tag: str) -> None:
+        if not self._tables:
+            return
+        table = self._tables[-1]
+        if tag == "table":
+            self._tables.pop()
+            finished = table.finish()
+            if finished is not None:
+                self.result.tables.append(finished)
+                self.result.table_lines.update(table.lines)
+        elif tag in ("td", "th"):
+            table.end_cell()
+        elif tag == "tr":
+            table.end_row()
+        elif tag == "thead":
+            table.end_row()
+            table.in_head = False
+        elif tag == "caption" and table.caption is not None:
+            table.caption_text = _SPACE.sub(" ", " ".join(table.caption)).strip() or None
+            table.caption = None
+
+    def _microdata_start(self, tag: str, attrs: Dict[str, Optional[str]]) -> None:
+        names = (attrs.get("itemprop") or "").split()
+        parent = self._scopes[-1][1] if self._scopes else None
+        if "itemscope" in attrs:
+            item: Dict[str, Any] = {}
+            if attrs.get("itemtype"):
+                item["@type"] = attrs["itemtype"].split()[0].rstrip("/").rsplit("/", 1)[-1]
+            if names and parent is not None:
+                self._set_property(parent, names, item)
+            else:
+                self.result.microdata.append(item)
+            if tag not in _VOID_TAGS:
+                self._scopes.append((self._depth, item))
+        elif names and parent is not None:
+            attr = _VALUE_ATTRS.get(tag)
+            if attr and attrs.get(attr) is not None:
+                self._set_property(parent, names, attrs[attr])
+            elif "content" in attrs:
+                self._set_property(parent, names, attrs["content"])
+            elif tag not in _VOID_TAGS:
+                self._props.append((self._depth, names, [], parent))
+
+    @staticmethod
+    def _set_property(item: Dict[str, Any], names: List[str], value: Any) -> None:
+        for name in names:
+            if name not in item:
+                item[name] = value
+            elif isinstance(item[name], list):
+                item[name].append(value)
+            else:
+                item[name] = [item[name], value]
+
+    def close(self):
+        super().close()
+        while self._tables:
+            self._table_end("table")
+
+
+def extract_structured(pieces: Iterable[str]) -> StructuredData:
+    # Accepts the whole page or an iterable of consecutive pieces (e.g. SpilledPage.windows()).
+    if isinstance(pieces, str):
+        pieces = (pieces,)
+    parser = _StructureParser()
+    with metrics.span("structured_extract"):
+        for piece in pieces:
+            parser.feed(piece)
+        parser.close()
+    return parser.result
+
+
+def has_structure(pieces: Iterable[str]) -> bool:
+    if isinstance(pieces, str):
+        return _MARKERS.search(pieces) is not None
+    return any(_MARKERS.search(piece) for piece in pieces)
+
+
+def residual_text(text: str, structured: StructuredData) -> str:
+    # The page text without the lines that came from table cells.
+    return "\n".join(line for line in text.split("\n") if line not in structured.table_lines)
+
+
+def _local_results(structured: StructuredData, tables: bool, metadata: bool) -> List[Dict[str, Any]]:
+    # Shaped like analysis results so the normalizer, table view and exporters treat them the same way.
+    results: List[Dict[str, Any]] = []
+    if tables:
+        for n, table in enumerate(structured.tables, 1):
+            source = f"table {n}" + (f": {table.caption}" if table.caption else "")
+            results.append({"content": table.records(), "model": MODEL_NAME, "source": source})
+    if metadata:
+        results.extend({"content": item, "model": MODEL_NAME, "source": "json-ld"} for item in structured.json_ld)
+        results.extend({"content": item, "model": MODEL_NAME, "source": "microdata"}
+                       for item in structured.microdata)
+        if structured.metadata:
+            results.append({"content": dict(structured.metadata), "model": MODEL_NAME, "source": "meta tags"})
+    return results
+
+
+@dataclass
+class Route:
+    local_results: List[Dict[str, Any]]
+    # What still goes to the LLM; empty when the instruction was answered locally.
+    data_bits: Sequence[str]
+    reason: Optional[str] = None
+
+
+def route(instruction: str, data_bits: Sequence[str], structured: Optional[StructuredData]) -> Route:
+    if not FAST_PATH or not structured:
+        return Route([], data_bits)
+    wants_tables = bool(TABLE_REQUEST.search(instruction)) and bool(structured.tables)
+    wants_metadata = bool(METADATA_REQUEST.search(instruction)) and structured.has_metadata
+    if not (wants_tables or wants_metadata):
+        return Route([], data_bits)
+
+    local = _local_results(structured, wants_tables, wants_metadata)
+    remainder = METADATA_REQUEST.sub(" ", TABLE_REQUEST.sub(" ", instruction.lower()))
+    if not [word for word in _WORD.findall(remainder) if word not in _FILLER]:
+        metrics.inc("structured_fast_path", route="local")
+        return Route(local, [], "answered from the page's " + ("tables" if wants_tables else "metadata"))
+
+    # The instruction asks for more than the structure: the LLM still runs, but only on the text outside tables.
+    if wants_tables and data_bits:
+        # The bits are contiguous slices of one text, cut anywhere, so they are rejoined without separators.
+        content = getattr(data_bits, "content", None)
+        text = content.text if content is not None else "".join(data_bits)
+        residual = residual_text(text, structured)
+        size = getattr(data_bits, "max_length", None) or max(len(bit) for bit in data_bits)
+        data_bits = [residual[i:i + size] for i in range(0, len(residual), size)]
+        logger.info("Sending residual text to the LLM", extra={"chars": len(residual), "original_chars": len(text)})
+    metrics.inc("structured_fast_path", route="residual")
+    return Route(local, data_bits, "structure extracted locally, remaining text sent to the LLM")
@@ -0,0 +1,88 @@
+import math
+from typing import Any, List, Optional, Sequence, TYPE_CHECKING
+
+import numpy as np
+import streamlit as st
+
+from render_cache import cached
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+PAGE_SIZES = (25, 50, 100, 250)
+
+
+def _filter_mask(df: "pd.DataFrame", columns: Sequence[str], query: str) -> np.ndarray:
+    mask = np.zeros(len(df), dtype=bool)
+    for name in columns:
+        mask |= df[name].astype(str).str.contains(query, case=False, regex=False, na=False).to_numpy()
+    return mask
+
+
+def view_positions(df: "pd.DataFrame", columns: Sequence[str], query: str = "",
+                   sort_by: Optional[str] = None, ascending: bool = True) -> np.ndarray:
+    # Row positions of the filtered, sorted view; the frame itself is never copied.
+    positions = np.arange(len(df))
+    if query:
+        positions = positions[_filter_mask(df, columns, query)]
+    if sort_by:
+        column = df[sort_by].iloc[positions]
+        try:
+            order = np.argsort(column.to_numpy(), kind="stable")
+        except TypeError:
+            # Mixed types in one column (common in LLM output) sort by their text form, missing values first.
+            text = [str(value) for value in column.astype(object).where(column.notna(), "")]
+            order = np.argsort(np.array(text, dtype=str), kind="stable")
+        if not ascending:
+            order = order[::-1]
+        positions = positions[order]
+    return positions
+
+
+def _page_controls(key: str, total: int) -> tuple:
+    col1, col2 = st.columns([1, 3])
+    page_size = col1.selectbox("Rows per page", PAGE_SIZES, key=f"{key}_page_size")
+    pages = max(1, math.ceil(total / page_size))
+    page_key = f"{key}_page"
+    if st.session_state.get(page_key, 1) > pages:
+        st.session_state[page_key] = pages
+    page = col2.number_input(f"Page (of {pages})", min_value=1, max_value=pages, step=1, key=page_key)
+    start = (int(page) - 1) * page_size
+    return start, min(start + page_size, total)
+
+
+def paginated_table(df: "pd.DataFrame", key: str, source: Any = None) -> None:
+    # Only the visible page is serialized to the browser. `source` is the object the frame was built from,
+    # when there is one, so the filtered view can be cached by its content hash.
+    if df is None or df.empty:
+        st.info("No rows to display.")
+        return
+
+    all_columns: List[str] = [str(c) for c in df.columns]
+    with st.expander("Filter, sort and columns"):
+        columns = st.multiselect("Columns", all_columns, default=all_columns, key=f"{key}_columns") or all_columns
+        query = st.text_input("Filter rows containing", key=f"{key}_query").strip()
+        col1, col2 = st.columns([3, 1])
+        sort_by = col1.selectbox("Sort by", [None] + all_columns, key=f"{key}_sort",
+                                 format_func=lambda c: "(original order)" if c is None else c)
+        ascending = col2.radio("Order", ["Ascending", "Descending"], key=f"{key}_order") == "Ascending"
+
+    positions = cached("table_view", df if source is None else source, key, tuple(columns), query, sort_by,
+                       ascending, build=lambda: view_positions(df, columns, query, sort_by, ascending))
+    total = len(positions)
+    if total == 0:
+        st.info("No rows match the filter.")
+        return
+
+    start, end = _page_controls(key, total)
+    st.dataframe(df.iloc[positions[start:end]][columns], use_container_width=True)
+    st.caption(f"Rows {start + 1}-{end} of {total} (filtered from {len(df)})")
+
+
+def paginated_records(records: Sequence[Any], key: str) -> None:
+    # Raw parsed results, a page at a time instead of the whole list.
+    if not records:
+        return
+    start, end = _page_controls(key, len(records))
+    st.write(list(records[start:end]))
+    st.caption(f"Results {start + 1}-{end} of {len(records)}")
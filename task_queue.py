@@ -0,0 +1,374 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional, Protocol, Sequence
+from urllib.parse import urlsplit
+
+from settings import get_float, get_int, get_setting
+
+logger = logging.getLogger(__name__)
+
+# A task whose worker stops heartbeating for LEASE_SECONDS goes back on the queue, up to MAX_ATTEMPTS times.
+LEASE_SECONDS = get_float("TASK_LEASE_SECONDS", 60.0)
+MAX_ATTEMPTS = get_int("TASK_MAX_ATTEMPTS", 3)
+# Redis only: finished tasks expire on their own after this long.
+RESULT_TTL = get_int("TASK_RESULT_TTL", 86400)
+DEFAULT_QUEUE_URL = "sqlite:///tasks.db"
+
+QUEUED = "queued"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+
+@dataclass
+class Task:
+    id: str
+    kind: str
+    payload: Dict[str, Any]
+    status: str = QUEUED
+    attempts: int = 0
+    max_attempts: int = MAX_ATTEMPTS
+    worker: Optional[str] = None
+    lease_until: Optional[float] = None
+    result: Any = None
+    error: Optional[str] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+
+class TaskQueue(Protocol):
+    def enqueue_many(self, kind: str, payloads: Sequence[Dict[str, Any]],
+                     max_attempts: Optional[int] = None) -> List[str]:
+        ...
+
+    def lease(self, worker_id: str, kinds: Sequence[str], lease_seconds: float = LEASE_SECONDS) -> Optional[Task]:
+        ...
+
+    def heartbeat(self, task_id: str, worker_id: str, lease_seconds: float = LEASE_SECONDS) -> bool:
+        ...
+
+    def complete(self, task_id: str, worker_id: str, result: Any) -> bool:
+        ...
+
+    def fail(self, task_id: str, worker_id: str, error: str) -> bool:
+        ...
+
+    def get_many(self, task_ids: Sequence[str]) -> List[Optional[Task]]:
+        ...
+
+    def delete(self, task_ids: Sequence[str]) -> None:
+        ...
+
+    def counts(self) -> Dict[str, int]:
+        ...
+
+    def close(self) -> None:
+        ...
+
+
+def _new_id() -> str:
+    return uuid.uuid4().hex
+
+
+class SQLiteQueue:
+    # File-backed queue for workers on one machine (or a shared filesystem that supports locking).
+    # Every state change is a single guarded UPDATE, so two workers can never both own a task.
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        with self._transaction() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS tasks (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_attempts INTEGER NOT NULL,
+                    worker TEXT,
+                    lease_until REAL,
+                    result TEXT,
+                    error TEXT,
+                    updated_at REAL NOT NULL
+                )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, kind)")
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections must stay on the thread that opened them; the worker heartbeats from another thread.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def enqueue_many(self, kind: str, payloads: Sequence[Dict[str, Any]],
+                     max_attempts: Optional[int] = None) -> List[str]:
+        now = time.time()
+        rows = [(_new_id(), kind, json.dumps(payload), QUEUED, max_attempts or MAX_ATTEMPTS, now)
+                for payload in payloads]
+        with self._transaction() as conn:
+            conn.executemany("INSERT INTO tasks (id, kind, payload, status, max_attempts, updated_at) "
+                             "VALUES (?, ?, ?, ?, ?, ?)", rows)
+        return [row[0] for row in rows]
+
+    def lease(self, worker_id: str, kinds: Sequence[str], lease_seconds: float = LEASE_SECONDS) -> Optional[Task]:
+        now = time.time()
+        marks = ",".join("?" * len(kinds))
+        with self._transaction() as conn:
+            # Tasks whose last lease ran out on the final attempt are given up on rather than handed out again.
+            conn.execute("UPDATE tasks SET status = ?, error = 'Lease expired', worker = NULL, updated_at = ? "
+                         "WHERE status = ? AND lease_until < ? AND attempts >= max_attempts",
+                         (FAILED, now, LEASED, now))
+            row = conn.execute(
+                f"SELECT id FROM tasks WHERE kind IN ({marks}) AND "
+                f"(status = ? OR (status = ? AND lease_until < ?)) ORDER BY rowid LIMIT 1",
+                (*kinds, QUEUED, LEASED, now)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE tasks SET status = ?, worker = ?, lease_until = ?, attempts = attempts + 1, "
+                         "updated_at = ? WHERE id = ?", (LEASED, worker_id, now + lease_seconds, now, row[0]))
+            return self._read(conn, [row[0]])[0]
+
+    def heartbeat(self, task_id: str, worker_id: str, lease_seconds: float = LEASE_SECONDS) -> bool:
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute("UPDATE tasks SET lease_until = ?, updated_at = ? "
+                                  "WHERE id = ? AND worker = ? AND status = ?",
+                                  (now + lease_seconds, now, task_id, worker_id, LEASED))
+        return cursor.rowcount == 1
+
+    def complete(self, task_id: str, worker_id: str, result: Any) -> bool:
+        with self._transaction() as conn:
+            cursor = conn.execute("UPDATE tasks SET status = ?, result = ?, error = NULL, lease_until = NULL, "
+                                  "updated_at = ? WHERE id = ? AND worker = ? AND status = ?",
+                                  (DONE, json.dumps(result, default=str), time.time(), task_id, worker_id, LEASED))
+        return cursor.rowcount == 1
+
+    def fail(self, task_id: str, worker_id: str, error: str) -> bool:
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE tasks SET status = CASE WHEN attempts < max_attempts THEN ? ELSE ? END, "
+                "error = ?, worker = NULL, lease_until = NULL, updated_at = ? "
+                "WHERE id = ? AND worker = ? AND status = ?",
+                (QUEUED, FAILED, error, time.time(), task_id, worker_id, LEASED))
+        return cursor.rowcount == 1
+
+    @staticmethod
+    def _read(conn: sqlite3.Connection, task_ids: Sequence[str]) -> List[Optional[Task]]:
+        found: Dict[str, Task] = {}
+        # Stay well under SQLite's bound-parameter limit
+        for start in range(0, len(task_ids), 500):
+            batch = task_ids[start:start + 500]
+            rows = conn.execute(
+                "SELECT id, kind, payload, status, attempts, max_attempts, worker, lease_until, result, error "
+                f"FROM tasks WHERE id IN ({','.join('?' * len(batch))})", batch)
+            for row in rows:
+                found[row[0]] = Task(row[0], row[1], json.loads(row[2]), row[3], row[4], row[5], row[6], row[7],
+                                     json.loads(row[8]) if row[8] is not None else None, row[9])
+        return [found.get(task_id) for task_id in task_ids]
+
+    def get_many(self, task_ids: Sequence[str]) -> List[Optional[Task]]:
+        return self._read(self._connection(), list(task_ids))
+
+    def delete(self, task_ids: Sequence[str]) -> None:
+        task_ids = list(task_ids)
+        with self._transaction() as conn:
+            for start in range(0, len(task_ids), 500):
+                batch = task_ids[start:start + 500]
+                conn.execute(f"DELETE FROM tasks WHERE id IN ({','.join('?' * len(batch))})", batch)
+
+    def counts(self) -> Dict[str, int]:
+        rows = self._connection().execute("SELECT status, COUNT(*) FROM tasks GROUP BY status")
+        return {status: count for status, count in rows}
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+# Each state change runs as one script on the server, which gives the same guarantees as SQLiteQueue's
+# guarded UPDATEs. KEYS[1] is the lease set (task id scored by lease expiry).
+_LEASE_SCRIPT = """
+local prefix, now, expiry, worker = ARGV[1], tonumber(ARGV[2]), ARGV[3], ARGV[4]
+for _, id in ipairs(redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', now)) do
+    local key = prefix .. ':task:' .. id
+    redis.call('ZREM', KEYS[1], id)
+    if redis.call('EXISTS', key) == 0 then
+        -- deleted by its submitter
+    elseif tonumber(redis.call('HGET', key, 'attempts')) >= tonumber(redis.call('HGET', key, 'max_attempts')) then
+        redis.call('HSET', key, 'status', 'failed', 'error', 'Lease expired', 'worker', '')
+        redis.call('EXPIRE', key, ARGV[5])
+    else
+        redis.call('HSET', key, 'status', 'queued', 'worker', '')
+        redis.call('LPUSH', prefix .. ':pending:' .. redis.call('HGET', key, 'kind'), id)
+    end
+end
+for i = 6, #ARGV do
+    local pending = prefix .. ':pending:' .. ARGV[i]
+    local id = redis.call('LPOP', pending)
+    while id do
+        local key = prefix .. ':task:' .. id
+        if redis.call('EXISTS', key) == 1 then
+            redis.call('HSET', key, 'status', 'leased', 'worker', worker, 'lease_until', expiry)
+            redis.call('HINCRBY', key, 'attempts', 1)
+            redis.call('ZADD', KEYS[1], expiry, id)
+            return id
+        end
+        id = redis.call('LPOP', pending)
+    end
+end
+return false
+"""
+
+_HEARTBEAT_SCRIPT = """
+local key = ARGV[1] .. ':task:' .. ARGV[2]
+if redis.call('HGET', key, 'status') ~= 'leased' or redis.call('HGET', key, 'worker') ~= ARGV[3] then
+    return 0
+end
+redis.call('HSET', key, 'lease_until', ARGV[4])
+redis.call('ZADD', KEYS[1], ARGV[4], ARGV[2])
+return 1
+"""
+
+_FINISH_SCRIPT = """
+local key = ARGV[1] .. ':task:' .. ARGV[2]
+if redis.call('HGET', key, 'status') ~= 'leased' or redis.call('HGET', key, 'worker') ~= ARGV[3] then
+    return 0
+end
+redis.call('ZREM', KEYS[1], ARGV[2])
+if ARGV[4] == 'done' then
+    redis.call('HSET', key, 'status', 'done', 'result', ARGV[5], 'error', '')
+elseif tonumber(redis.call('HGET', key, 'attempts')) < tonumber(redis.call('HGET', key, 'max_attempts')) then
+    redis.call('HSET', key, 'status', 'queued', 'error', ARGV[5], 'worker', '')
+    redis.call('LPUSH', ARGV[1] .. ':pending:' .. redis.call('HGET', key, 'kind'), ARGV[2])
+    return 1
+else
+    redis.call('HSET', key, 'status', 'failed', 'error', ARGV[5], 'worker', '')
+end
+redis.call('EXPIRE', key, ARGV[6])
+return 1
+"""
+
+
+class RedisQueue:
+    # Same queue on any Redis-compatible server (Redis, Valkey, KeyDB, ...), for workers on several machines.
+    # Requires the optional redis package.
+    def __init__(self, url: str, prefix: str = "scraper"):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("The redis package is required for redis:// task queues") from e
+        self._client = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self._leases = f"{prefix}:leases"
+        self._lease = self._client.register_script(_LEASE_SCRIPT)
+        self._heartbeat = self._client.register_script(_HEARTBEAT_SCRIPT)
+        self._finish = self._client.register_script(_FINISH_SCRIPT)
+
+    def _key(self, task_id: str) -> str:
+        return f"{self.prefix}:task:{task_id}"
+
+    def enqueue_many(self, kind: str, payloads: Sequence[Dict[str, Any]],
+                     max_attempts: Optional[int] = None) -> List[str]:
+        ids = [_new_id() for _ in payloads]
+        pipe = self._client.pipeline()
+        for task_id, payload in zip(ids, payloads):
+            pipe.hset(self._key(task_id), mapping={
+                "kind": kind, "payload": json.dumps(payload), "status": QUEUED, "attempts": 0,
+                "max_attempts": max_attempts or MAX_ATTEMPTS, "worker": "", "lease_until": "", "result": "",
+                "error": ""})
+        if ids:
+            pipe.rpush(f"{self.prefix}:pending:{kind}", *ids)
+        pipe.execute()
+        return ids
+
+    def lease(self, worker_id: str, kinds: Sequence[str], lease_seconds: float = LEASE_SECONDS) -> Optional[Task]:
+        now = time.time()
+        task_id = self._lease(keys=[self._leases],
+                              args=[self.prefix, now, now + lease_seconds, worker_id, RESULT_TTL, *kinds])
+        return self.get_many([task_id])[0] if task_id else None
+
+    def heartbeat(self, task_id: str, worker_id: str, lease_seconds: float = LEASE_SECONDS) -> bool:
+        return bool(self._heartbeat(keys=[self._leases],
+                                    args=[self.prefix, task_id, worker_id, time.time() + lease_seconds]))
+
+    def complete(self, task_id: str, worker_id: str, result: Any) -> bool:
+        return bool(self._finish(keys=[self._leases], args=[
+            self.prefix, task_id, worker_id, DONE, json.dumps(result, default=str), RESULT_TTL]))
+
+    def fail(self, task_id: str, worker_id: str, error: str) -> bool:
+        return bool(self._finish(keys=[self._leases],
+                                 args=[self.prefix, task_id, worker_id, FAILED, error, RESULT_TTL]))
+
+    def get_many(self, task_ids: Sequence[str]) -> List[Optional[Task]]:
+        pipe = self._client.pipeline()
+        for task_id in task_ids:
+            pipe.hgetall(self._key(task_id))
+        tasks: List[Optional[Task]] = []
+        for task_id, fields in zip(task_ids, pipe.execute()):
+            if not fields:
+                tasks.append(None)
+                continue
+            tasks.append(Task(
+                task_id, fields["kind"], json.loads(fields["payload"]), fields["status"], int(fields["attempts"]),
+                int(fields["max_attempts"]), fields["worker"] or None,
+                float(fields["lease_until"]) if fields["lease_until"] else None,
+                json.loads(fields["result"]) if fields["result"] else None, fields["error"] or None))
+        return tasks
+
+    def delete(self, task_ids: Sequence[str]) -> None:
+        if task_ids:
+            # Ids of deleted tasks left in a pending list are skipped by the lease script.
+            self._client.delete(*(self._key(task_id) for task_id in task_ids))
+            self._client.zrem(self._leases, *task_ids)
+
+    def counts(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for key in self._client.scan_iter(match=f"{self.prefix}:task:*", count=1000):
+            status = self._client.hget(key, "status")
+            if status:
+                counts[status] = counts.get(status, 0) + 1
+        return counts
+
+    def close(self) -> None:
+        self._client.close()
+
+
+def open_queue(url: Optional[str] = None) -> TaskQueue:
+    # sqlite:///relative.db, sqlite:////absolute/path.db, redis://host:6379/0 or rediss://...
+    url = url or get_setting("TASK_QUEUE_URL") or DEFAULT_QUEUE_URL
+    scheme = urlsplit(url).scheme
+    if scheme == "sqlite":
+        return SQLiteQueue(url[len("sqlite:///"):] if url.startswith("sqlite:///") else url[len("sqlite:"):])
+    if scheme in ("redis", "rediss", "unix"):
+        return RedisQueue(url, prefix=get_setting("TASK_QUEUE_PREFIX", "scraper"))
+    raise ValueError(f"Unsupported task queue URL: {url}")
+
+
+@lru_cache(maxsize=1)
+def default_queue() -> TaskQueue:
+    return open_queue()
@@ -0,0 +1,45 @@
+from block_detection import BlockDetector, DEFAULT_SIGNATURES, SCAN_CHARS
+
+detector = BlockDetector(DEFAULT_SIGNATURES)
+
+
+def page(title, body):
+    return f"<html><head><title>{title}</title></head><body>{body}</body></html>"
+
+
+ARTICLE = "<p>" + "CAPTCHAs ask people to pick out traffic lights and crosswalks in a grid of photos. " * 75 + "</p>"
+
+
+def test_article_about_captcha_is_not_blocked():
+    assert not detector.detect(page("How CAPTCHA works", ARTICLE))
+
+
+def test_short_page_with_block_title_is_blocked():
+    verdict = detector.detect(page("Access Denied", "<h1>Access Denied</h1><p>Reference #18.2f</p>"))
+    assert verdict and verdict.category == "access_denied"
+
+
+def test_title_that_is_just_the_phrase_blocks_long_pages():
+    verdict = detector.detect(page("Attention Required! | Cloudflare", ARTICLE))
+    assert verdict and verdict.category == "bot_challenge"
+
+
+def test_small_page_text_signature():
+    verdict = detector.detect(page("example.com", "<p>Please verify you are human to continue.</p>"))
+    assert verdict and verdict.category == "captcha"
+
+
+def test_challenge_widget_only_counts_on_small_pages():
+    widget = '<div class="g-recaptcha"></div>'
+    assert detector.detect(page("Sign in", widget)).category == "bot_challenge"
+    assert not detector.detect(page("Contact us", widget + ARTICLE))
+
+
+def test_status_code_needs_a_small_page():
+    assert detector.detect(page("Oops", "<p>Slow down</p>"), status=429).category == "rate_limited"
+    assert not detector.detect(page("Catalogue", ARTICLE), status=429)
+
+
+def test_pages_larger_than_the_scan_window_are_never_small():
+    html = page("example.com", "<p>verify you are human</p>")
+    assert not detector.detect(html, total_chars=SCAN_CHARS + 1)
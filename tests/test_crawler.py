@@ -0,0 +1,47 @@
+import pytest
+
+from crawler import CrawlConfig, crawl, normalize_url
+
+
+@pytest.mark.parametrize("url, expected", [
+    ("HTTPS://Example.COM", "https://example.com/"),
+    ("https://example.com:443/a#section", "https://example.com/a"),
+    ("http://example.com:8080/a", "http://example.com:8080/a"),
+    ("https://example.com/a?b=2&utm_source=x&a=1&fbclid=y", "https://example.com/a?a=1&b=2"),
+    ("https://example.com/a/./b/../c/", "https://example.com/a/c/"),
+    ("  https://example.com/a  ", "https://example.com/a"),
+])
+def test_normalize_url(url, expected):
+    assert normalize_url(url) == expected
+
+
+def test_normalize_relative_url():
+    assert normalize_url("../c?x=1#top", base="https://example.com/a/b/page") == "https://example.com/a/c?x=1"
+    assert normalize_url("/c", base="https://example.com/a/b") == "https://example.com/c"
+
+
+@pytest.mark.parametrize("url", ["mailto:someone@example.com", "javascript:void(0)", "ftp://example.com/file",
+                                 "/relative/without/base", "https://"])
+def test_normalize_rejects_non_http_urls(url):
+    assert normalize_url(url) is None
+
+
+def test_crawl_follows_matching_links_from_the_seed():
+    links = {
+        "https://example.com/": ["/docs/a", "/blog/b", "https://other.com/docs/c", "/docs/a#again", "/logo.png"],
+        "https://example.com/docs/a": ["/docs/d?utm_source=x"],
+        "https://example.com/docs/d": [],
+    }
+    fetched = []
+
+    def fetch(url):
+        fetched.append(url)
+        return f"text of {url}", links[url]
+
+    # The seed does not match the include pattern but is still fetched for its links.
+    config = CrawlConfig(max_pages=10, max_depth=2, include_patterns=[r"/docs/"], workers=1)
+    results = list(crawl("https://example.com", config, fetch=fetch))
+    assert fetched == ["https://example.com/", "https://example.com/docs/a", "https://example.com/docs/d"]
+    assert [(r.url, r.depth) for r in results] == [
+        ("https://example.com/", 0), ("https://example.com/docs/a", 1), ("https://example.com/docs/d", 2)]
+    assert all(r.error is None for r in results)
@@ -0,0 +1,36 @@
+import pytest
+
+from relevance import _stem, bm25_scores, query_terms, select_chunks
+
+
+@pytest.mark.parametrize("singular, other", [
+    ("price", "prices"),
+    ("name", "names"),
+    ("ship", "shipping"),
+    ("ship", "shipped"),
+    ("box", "boxes"),
+    ("city", "cities"),
+])
+def test_word_forms_share_a_stem(singular, other):
+    assert _stem(singular) == _stem(other)
+
+
+def test_plural_query_matches_singular_chunk():
+    terms = query_terms("extract product names and prices")
+    assert terms == ["name", "price", "product"]
+    assert bm25_scores(["the price is 5"], terms)[0] > 0
+
+
+def test_select_chunks_keeps_relevant_chunk_and_neighbors():
+    bits = [f"filler text number {i} about the weather" for i in range(20)]
+    bits[7] = "price list: widget costs 5"
+    selection = select_chunks(bits, "extract the prices", min_chunks=1, min_fraction=0, neighbors=1)
+    assert selection.kept == [6, 7, 8]
+    assert {entry["chunk"] for entry in selection.skipped_results()} == set(range(20)) - {6, 7, 8}
+
+
+def test_select_chunks_sends_everything_when_nothing_matches():
+    bits = [f"filler text number {i}" for i in range(10)]
+    selection = select_chunks(bits, "extract the prices")
+    assert selection.kept == list(range(10))
+    assert not selection.skipped
@@ -0,0 +1,23 @@
+from result_normalizer import ResultNormalizer
+
+
+def frame(*contents):
+    return ResultNormalizer().extend({"content": content} for content in contents).to_frame()
+
+
+def test_numeric_strings_become_numbers():
+    df = frame({"price": "5.5", "ratio": "0.5"}, {"price": "3", "ratio": "1"})
+    assert df["price"].tolist() == [5.5, 3.0]
+    assert df["ratio"].tolist() == [0.5, 1.0]
+
+
+def test_leading_zeros_keep_column_as_text():
+    df = frame({"zip": "02139", "id": "0042"}, {"zip": "10001", "id": "7"})
+    assert df["zip"].tolist() == ["02139", "10001"]
+    assert df["id"].tolist() == ["0042", "7"]
+
+
+def test_nested_records_and_lists_are_flattened():
+    df = frame({"item": {"name": "widget", "price": "5"}}, [{"item": {"name": "gadget"}}, "loose"])
+    assert list(df.columns) == ["item.name", "item.price", "value"]
+    assert df["item.name"].tolist()[:2] == ["widget", "gadget"]
@@ -0,0 +1,50 @@
+from content_store import content_store
+from structured_data import MODEL_NAME, extract_structured, route
+
+PAGE = """<html><head><meta property="og:title" content="Shop"></head><body>
+<p>Intro paragraph here</p>
+<table><caption>Prices</caption>
+<tr><th>Item</th><th>Price</th></tr>
+<tr><td>Widget</td><td>5</td></tr>
+<tr><td>Gadget</td><td>9</td></tr>
+</table>
+<p>Closing words</p>
+</body></html>"""
+TEXT = "Intro paragraph here\nItem\nPrice\nWidget\n5\nGadget\n9\nClosing words"
+
+
+def chunks(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def test_table_request_is_answered_locally():
+    routed = route("extract the table", chunks(TEXT, 7), extract_structured(PAGE))
+    assert routed.data_bits == []
+    assert [result["source"] for result in routed.local_results] == ["table 1: Prices"]
+    assert routed.local_results[0]["model"] == MODEL_NAME
+    assert routed.local_results[0]["content"] == [{"Item": "Widget", "Price": "5"}, {"Item": "Gadget", "Price": "9"}]
+
+
+def test_mixed_request_sends_residual_text_without_breaking_words():
+    routed = route("extract the table and summarize the intro", chunks(TEXT, 7), extract_structured(PAGE))
+    assert len(routed.local_results) == 1
+    assert "".join(routed.data_bits) == "Intro paragraph here\nClosing words"
+    assert all(len(bit) <= 7 for bit in routed.data_bits)
+
+
+def test_mixed_request_reads_chunk_list_content():
+    content = content_store.put(TEXT)
+    routed = route("extract the table and summarize the intro", content.chunks(7), extract_structured(PAGE))
+    assert "".join(routed.data_bits) == "Intro paragraph here\nClosing words"
+
+
+def test_other_instructions_are_not_routed():
+    bits = chunks(TEXT, 7)
+    routed = route("summarize the page", bits, extract_structured(PAGE))
+    assert routed.local_results == [] and routed.data_bits == bits
+
+
+def test_metadata_request_uses_meta_tags():
+    routed = route("get the page metadata", chunks(TEXT, 7), extract_structured(PAGE))
+    assert routed.data_bits == []
+    assert {"content": {"og:title": "Shop"}, "model": MODEL_NAME, "source": "meta tags"} in routed.local_results
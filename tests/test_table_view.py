@@ -0,0 +1,22 @@
+import numpy as np
+import pandas as pd
+
+from table_view import view_positions
+
+
+def test_sorts_numeric_column():
+    df = pd.DataFrame({"price": [3.0, 1.0, 2.0]})
+    assert list(view_positions(df, ["price"], sort_by="price")) == [1, 2, 0]
+    assert list(view_positions(df, ["price"], sort_by="price", ascending=False)) == [0, 2, 1]
+
+
+def test_mixed_column_with_missing_values_sorts_by_text():
+    df = pd.DataFrame({"value": [3, "b", None, np.nan, 1]})
+    order = list(view_positions(df, ["value"], sort_by="value"))
+    assert sorted(order[:2]) == [2, 3]
+    assert order[2:] == [4, 0, 1]
+
+
+def test_filter_then_sort():
+    df = pd.DataFrame({"name": ["widget", "gadget", "widget pro"], "price": [5, 9, 7]})
+    assert list(view_positions(df, ["name"], query="WIDGET", sort_by="price", ascending=False)) == [2, 0]
@@ -0,0 +1,73 @@
+import pytest
+
+from task_queue import DONE, FAILED, LEASED, QUEUED, open_queue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = open_queue(f"sqlite:///{tmp_path / 'tasks.db'}")
+    yield queue
+    queue.close()
+
+
+def test_lease_and_complete(queue):
+    first, second = queue.enqueue_many("analyze", [{"text": "a"}, {"text": "b"}])
+    task = queue.lease("w1", ["analyze"])
+    assert (task.id, task.status, task.worker, task.attempts) == (first, LEASED, "w1", 1)
+    assert task.payload == {"text": "a"}
+    # Another worker cannot finish a task it does not hold.
+    assert not queue.complete(first, "w2", {"ok": False})
+    assert queue.complete(first, "w1", {"ok": True})
+    done, queued = queue.get_many([first, second])
+    assert (done.status, done.result) == (DONE, {"ok": True})
+    assert queued.status == QUEUED
+    assert queue.counts() == {DONE: 1, QUEUED: 1}
+
+
+def test_lease_only_matching_kinds(queue):
+    queue.enqueue_many("scrape", [{"url": "https://example.com/"}])
+    assert queue.lease("w1", ["analyze"]) is None
+    assert queue.lease("w1", ["analyze", "scrape"]).kind == "scrape"
+
+
+def test_expired_lease_is_handed_to_another_worker(queue):
+    task_id, = queue.enqueue_many("analyze", [{"text": "a"}])
+    queue.lease("w1", ["analyze"], lease_seconds=-1)
+    task = queue.lease("w2", ["analyze"])
+    assert (task.id, task.worker, task.attempts) == (task_id, "w2", 2)
+    assert not queue.heartbeat(task_id, "w1")
+    assert not queue.complete(task_id, "w1", {})
+
+
+def test_heartbeat_keeps_the_lease(queue):
+    task_id, = queue.enqueue_many("analyze", [{"text": "a"}])
+    queue.lease("w1", ["analyze"], lease_seconds=-1)
+    assert queue.heartbeat(task_id, "w1", lease_seconds=60)
+    assert queue.lease("w2", ["analyze"]) is None
+
+
+def test_failed_task_is_retried_until_max_attempts(queue):
+    task_id, = queue.enqueue_many("analyze", [{"text": "a"}], max_attempts=2)
+    queue.lease("w1", ["analyze"])
+    assert queue.fail(task_id, "w1", "boom")
+    assert queue.get_many([task_id])[0].status == QUEUED
+    queue.lease("w1", ["analyze"])
+    assert queue.fail(task_id, "w1", "boom again")
+    task = queue.get_many([task_id])[0]
+    assert (task.status, task.error, task.attempts) == (FAILED, "boom again", 2)
+    assert queue.lease("w1", ["analyze"]) is None
+
+
+def test_expired_lease_on_last_attempt_fails(queue):
+    task_id, = queue.enqueue_many("analyze", [{"text": "a"}], max_attempts=1)
+    queue.lease("w1", ["analyze"], lease_seconds=-1)
+    assert queue.lease("w2", ["analyze"]) is None
+    task = queue.get_many([task_id])[0]
+    assert (task.status, task.error) == (FAILED, "Lease expired")
+
+
+def test_delete(queue):
+    ids = queue.enqueue_many("analyze", [{"text": "a"}, {"text": "b"}])
+    queue.delete(ids[:1])
+    assert queue.get_many(ids)[0] is None
+    assert queue.counts() == {QUEUED: 1}
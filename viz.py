@@ -0,0 +1,83 @@
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+
+from settings import get_int
+
+# Figures are aggregated here so the browser receives at most a few thousand points, whatever the result size.
+MAX_POINTS = get_int("VIZ_MAX_POINTS", 2000)
+WEBGL_ROWS = get_int("VIZ_WEBGL_ROWS", 1000)
+HISTOGRAM_BINS = get_int("VIZ_HISTOGRAM_BINS", 50)
+TOP_N = get_int("VIZ_TOP_N", 30)
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    # Largest-Triangle-Three-Buckets: keeps the point per bucket that best preserves the visual shape.
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    every = (n - 2) / (n_out - 2)
+    indices = np.empty(n_out, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        if end < next_end:
+            avg_x, avg_y = x[end:next_end].mean(), y[end:next_end].mean()
+        else:
+            avg_x, avg_y = x[-1], y[-1]
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(area.argmax())
+        indices[i + 1] = a
+    return indices
+
+
+def downsample(df: pd.DataFrame, x: Optional[str], y: str, max_points: int = MAX_POINTS) -> pd.DataFrame:
+    # x=None plots y against row order, like px.line(df, y=...).
+    columns = [y] if x is None else [x, y]
+    data = df[columns].dropna()
+    if x is not None:
+        data = data.sort_values(x, kind="stable")
+    if len(data) <= max_points:
+        return data
+    x_values = np.arange(len(data), dtype=float) if x is None else data[x].to_numpy(dtype=float)
+    keep = lttb_indices(x_values, data[y].to_numpy(dtype=float), max_points)
+    return data.iloc[keep]
+
+
+def _render_mode(rows: int) -> str:
+    return "webgl" if rows > WEBGL_ROWS else "svg"
+
+
+def scatter_figure(df: pd.DataFrame, x: str, y: str, title: str):
+    data = downsample(df, x, y)
+    return px.scatter(data, x=x, y=y, title=title, render_mode=_render_mode(len(df)))
+
+
+def line_figure(df: pd.DataFrame, y: str, title: str):
+    data = downsample(df, None, y)
+    return px.line(data, x=data.index, y=y, title=title, render_mode=_render_mode(len(df)))
+
+
+def histogram_figure(df: pd.DataFrame, column: str, title: str, bins: int = HISTOGRAM_BINS):
+    # Bin on the server and ship counts, not every raw value.
+    values = df[column].dropna().to_numpy(dtype=float)
+    counts, edges = np.histogram(values, bins=min(bins, max(len(np.unique(values)), 1)))
+    fig = px.bar(x=(edges[:-1] + edges[1:]) / 2, y=counts, title=title, labels={"x": column, "y": "count"})
+    fig.update_layout(bargap=0)
+    return fig
+
+
+def top_counts(series: pd.Series, n: int = TOP_N) -> pd.Series:
+    counts = series.value_counts()
+    if len(counts) > n:
+        counts = pd.concat([counts.iloc[:n], pd.Series({"Other": counts.iloc[n:].sum()})])
+    return counts
+
+
+def bar_figure(df: pd.DataFrame, column: str, title: str, n: int = TOP_N):
+    return px.bar(top_counts(df[column], n), title=title)
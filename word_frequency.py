@@ -0,0 +1,54 @@
+import re
+from collections import Counter
+from typing import Dict, FrozenSet, Optional
+
+import metrics
+from settings import get_int
+
+# Words of two or more characters starting with a letter; WordCloud drops shorter tokens and bare numbers anyway.
+WORD_RE = re.compile(r"[^\W\d_][^\W_]+")
+
+SAMPLE_CHARS = get_int("WORDCLOUD_SAMPLE_CHARS", 2_000_000)
+SAMPLE_WINDOWS = 64
+
+
+_stop_words: Optional[FrozenSet[str]] = None
+
+
+def stop_words() -> FrozenSet[str]:
+    # Only the full list is kept: NLTK data may still be downloading, and WordCloud's own list is just a stopgap.
+    global _stop_words
+    if _stop_words is not None:
+        return _stop_words
+    from wordcloud import STOPWORDS
+    words = set(STOPWORDS)
+    try:
+        from nltk.corpus import stopwords
+        words.update(stopwords.words("english"))
+    except LookupError:
+        return frozenset(words)
+    _stop_words = frozenset(words)
+    return _stop_words
+
+
+def stop_words_complete() -> bool:
+    # Part of the cache key for anything built from stop_words(), so tables built from the stopgap are rebuilt.
+    stop_words()
+    return _stop_words is not None
+
+
+def _sample(text: str, max_chars: int) -> str:
+    # Evenly spaced windows keep the word mix of the whole page while bounding the work.
+    window = max_chars // SAMPLE_WINDOWS
+    step = len(text) // SAMPLE_WINDOWS
+    return " ".join(text[i * step:i * step + window] for i in range(SAMPLE_WINDOWS))
+
+
+def word_frequencies(text: str, max_words: int = 200, sample_chars: int = SAMPLE_CHARS) -> Dict[str, int]:
+    with metrics.span("word_frequencies", chars=len(text)):
+        if sample_chars and len(text) > sample_chars:
+            text = _sample(text, sample_chars)
+        counts = Counter(WORD_RE.findall(text.lower()))
+        for word in stop_words().intersection(counts):
+            del counts[word]
+        return dict(counts.most_common(max_words))
@@ -0,0 +1,381 @@
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import sys
+import threading
+import time
+import uuid
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import metrics
+from accounting import JobBudget, record_usage
+from content_store import ChunkList, StoredContent, content_store
+from settings import get_float, get_int
+from result_normalizer import ResultNormalizer
+from search_index import index_content
+from structured_data import StructuredData
+from task_queue import LEASE_SECONDS, Task, TaskQueue, default_queue, open_queue
+
+logger = logging.getLogger(__name__)
+
+# Task kinds: "scrape" fetches and cleans one URL, "analyze" runs one chunk through the LLM.
+KINDS = ("scrape", "analyze")
+POLL_SECONDS = get_float("WORKER_POLL_SECONDS", 0.5)
+# How long the app waits for workers before reporting the remaining tasks as failed.
+WAIT_SECONDS = get_float("TASK_WAIT_SECONDS", 1800.0)
+
+
+class Worker:
+    # Leases tasks one at a time and heartbeats while each runs. Run several per process with threads,
+    # and as many processes or machines as the queue can feed.
+    def __init__(
+            self,
+            queue: TaskQueue,
+            worker_id: Optional[str] = None,
+            kinds: Sequence[str] = KINDS,
+            lease_seconds: float = LEASE_SECONDS,
+            poll_seconds: float = POLL_SECONDS
+    ):
+        self.queue = queue
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.kinds = list(kinds)
+        self.lease_seconds = lease_seconds
+        self.poll_seconds = poll_seconds
+        self.processed = 0
+        self._handlers: Dict[str, Callable[[Dict[str, Any]], Any]] = {
+            "scrape": self._scrape,
+            "analyze": self._analyze,
+        }
+        # One event loop and LLM backend per worker, so connections are reused across tasks.
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._backend = None
+
+    def _scrape(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        if payload.get("structure"):
+            # A single-page scrape: the app wants the page's tables and metadata, not its links.
+            from scraper import fetch_and_clean
+            text, structured = fetch_and_clean(payload["url"], with_structure=True)
+            return {"text": text, "links": [], "structured": structured.to_dict() if structured else None}
+        from crawler import fetch_page
+        text, links = fetch_page(payload["url"])
+        return {"text": text, "links": links}
+
+    def _analyze(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        from llm_backends import create_backend
+        from llm_parser import AnalysisRequest, GroqParser
+
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+            self._backend = create_backend()
+        parser = GroqParser(backend=self._backend)
+        result = self._loop.run_until_complete(parser.analyze_text(AnalysisRequest(
+            text=payload["text"], instruction=payload["instruction"])))
+        # The parser has already retried; a failed call is the answer for this chunk, as in async_groq_parser.
+        return result.data.dict() if result.success else {"error": result.error}
+
+    def _heartbeat(self, task: Task, stop: threading.Event) -> None:
+        interval = self.lease_seconds / 3
+        while not stop.wait(interval):
+            if not self.queue.heartbeat(task.id, self.worker_id, self.lease_seconds):
+                logger.warning("Lost lease on task", extra={"task_id": task.id, "worker": self.worker_id})
+                return
+
+    def run_once(self) -> bool:
+        task = self.queue.lease(self.worker_id, self.kinds, self.lease_seconds)
+        if task is None:
+            return False
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(task, stop), daemon=True)
+        heartbeat.start()
+        try:
+            with metrics.job_context(task.id), metrics.span(f"task_{task.kind}"):
+                result = self._handlers[task.kind](task.payload)
+        except Exception as e:
+            logger.exception("Task failed", extra={"task_id": task.id, "kind": task.kind,
+                                                   "attempt": task.attempts})
+            self.queue.fail(task.id, self.worker_id, str(e))
+            metrics.inc("tasks_failed", kind=task.kind)
+        else:
+            if not self.queue.complete(task.id, self.worker_id, result):
+                # The lease ran out and another worker took the task over; its result wins.
+                logger.warning("Result discarded, lease lost", extra={"task_id": task.id})
+            metrics.inc("tasks_done", kind=task.kind)
+        finally:
+            stop.set()
+            heartbeat.join()
+        self.processed += 1
+        return True
+
+    def run(self, max_tasks: Optional[int] = None, idle_exit: Optional[float] = None,
+            stop: Optional[threading.Event] = None) -> int:
+        stop = stop or threading.Event()
+        idle_since = time.monotonic()
+        try:
+            while not stop.is_set() and (max_tasks is None or self.processed < max_tasks):
+                if self.run_once():
+                    idle_since = time.monotonic()
+                elif idle_exit is not None and time.monotonic() - idle_since >= idle_exit:
+                    break
+                else:
+                    stop.wait(self.poll_seconds)
+        finally:
+            self.close()
+        return self.processed
+
+    def close(self) -> None:
+        if self._loop is not None:
+            self._loop.run_until_complete(self._backend.aclose())
+            self._loop.close()
+            self._loop = None
+
+
+def wait_for(
+        queue: TaskQueue,
+        task_ids: Sequence[str],
+        on_finished: Optional[Callable[[int, Task], None]] = None,
+        timeout: Optional[float] = WAIT_SECONDS,
+        poll_seconds: float = POLL_SECONDS
+) -> List[Optional[Task]]:
+    # Polls until every task is done or failed; on_finished gets (index, task) as each one lands.
+    results: List[Optional[Task]] = [None] * len(task_ids)
+    pending = list(range(len(task_ids)))
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    while pending:
+        still_pending = []
+        for index, task in zip(pending, queue.get_many([task_ids[i] for i in pending])):
+            if task is not None and task.finished:
+                results[index] = task
+                if on_finished:
+                    on_finished(index, task)
+            else:
+                still_pending.append(index)
+        pending = still_pending
+        if pending:
+            if deadline is not None and time.monotonic() >= deadline:
+                logger.warning("Timed out waiting for workers", extra={"pending": len(pending)})
+                break
+            time.sleep(poll_seconds)
+    return results
+
+
+def _remote_scrape(queue: TaskQueue, payload: Dict[str, Any]) -> Dict[str, Any]:
+    task_ids = queue.enqueue_many("scrape", [payload])
+    try:
+        task = wait_for(queue, task_ids)[0]
+    finally:
+        queue.delete(task_ids)
+    if task is None:
+        raise RuntimeError("Timed out waiting for a worker")
+    if task.status != "done":
+        raise RuntimeError(task.error or "Failed to fetch webpage content")
+    return task.result
+
+
+def remote_fetch(queue: TaskQueue) -> Callable[[str], Tuple[str, List[str]]]:
+    # Drop-in for crawler.fetch_page that has a worker do the fetching.
+    def fetch(url: str) -> Tuple[str, List[str]]:
+        result = _remote_scrape(queue, {"url": url})
+        return result["text"], result["links"]
+
+    return fetch
+
+
+def remote_scrape_to_store(
+        url: str,
+        progress_callback: Callable[[int, str], None],
+        queue: Optional[TaskQueue] = None
+) -> Tuple[StoredContent, ChunkList]:
+    # Same contract as scraper.scrape_to_store, with the browser session on a worker.
+    queue = queue or default_queue()
+    progress_callback(20, "Waiting for a worker to fetch the page...")
+    with metrics.span("remote_fetch"):
+        result = _remote_scrape(queue, {"url": url, "structure": True})
+    progress_callback(80, "Preparing for analysis...")
+    structured = StructuredData.from_dict(result["structured"]) if result.get("structured") else None
+    content = content_store.put(result["text"], structured)
+    index_content(url, content)
+    progress_callback(100, "Scraping complete!")
+    return content, content.chunks(6000)
+
+
+def analyze_remotely(
+        data_bits: List[str],
+        instruction: str,
+        progress_callback: Optional[Callable[[int, str], None]],
+        url: Optional[str],
+        budget: JobBudget,
+        normalizer: ResultNormalizer,
+        queue: Optional[TaskQueue] = None
+) -> List[Dict[str, Any]]:
+    # The analyze step of llm_parser.run_analysis, with every chunk analysed by whichever worker leases it.
+    from llm_parser import budget_stop_results, fit_chunks, within_budget
+
+    queue = queue or default_queue()
+    data_bits, overhead, rejected = fit_chunks(data_bits, instruction)
+    if rejected:
+        return rejected
+    budget.start()
+    # Workers cannot stop each other mid-job, so the token budget is applied to estimates before submitting.
+    submitted, stop_reason = within_budget(data_bits, overhead, budget)
+
+    task_ids = queue.enqueue_many("analyze", [{"text": bit, "instruction": instruction} for bit in submitted])
+    finished = 0
+
+    def on_finished(index: int, task: Task) -> None:
+        nonlocal finished
+        finished += 1
+        if task.status == "done" and "error" not in task.result:
+            record_usage(task.result["usage"], url, instruction, budget)
+        if progress_callback:
+            progress_callback(int(finished / len(submitted) * 100), f"Analyzed {finished} of {len(submitted)} bits")
+
+    try:
+        with metrics.span("remote_analysis", chunks=len(task_ids)):
+            tasks = wait_for(queue, task_ids, on_finished)
+    finally:
+        queue.delete(task_ids)
+
+    results: List[Dict[str, Any]] = []
+    for task in tasks:
+        if task is None:
+            results.append({"error": "Timed out waiting for a worker"})
+        elif task.status != "done":
+            results.append({"error": task.error or "Task failed"})
+        else:
+            results.append(task.result)
+            if "error" not in task.result:
+                normalizer.add(task.result)
+    if stop_reason:
+        results.extend(budget_stop_results(stop_reason, len(data_bits) - len(submitted)))
+    if progress_callback:
+        progress_callback(100, f"Analysis stopped early: {stop_reason}" if stop_reason else "Analysis complete!")
+    return results
+
+
+def remote_analysis(
+        data_bits: Sequence[str],
+        instruction: str,
+        progress_callback: Optional[Callable[[int, str], None]] = None,
+        url: Optional[str] = None,
+        structured: Optional[StructuredData] = None,
+        hints: Sequence[str] = (),
+        queue: Optional[TaskQueue] = None
+) -> Tuple[List[Dict[str, Any]], ResultNormalizer]:
+    # Same contract as llm_parser.run_analysis, which it runs with analyze_remotely as the analyze step.
+    from llm_parser import run_analysis
+    return run_analysis(data_bits, instruction, progress_callback, url, structured, hints,
+                        analyze=partial(analyze_remotely, queue=queue))
+
+
+def _work(queue_url: Optional[str], kinds: Sequence[str], threads: int, max_tasks: Optional[int],
+          idle_exit: Optional[float]) -> int:
+    # Entry point of one worker process.
+    from log_config import configure_logging
+    configure_logging()
+    queue = open_queue(queue_url)
+    workers = [Worker(queue, kinds=kinds) for _ in range(threads)]
+    runners = [threading.Thread(target=w.run, args=(max_tasks, idle_exit), name=w.worker_id) for w in workers]
+    for runner in runners:
+        runner.start()
+    for runner in runners:
+        runner.join()
+    queue.close()
+    processed = sum(w.processed for w in workers)
+    logger.info("Worker process finished", extra={"processed": processed})
+    return processed
+
+
+def run_workers(queue_url: Optional[str], processes: int, threads: int = 1, kinds: Sequence[str] = KINDS,
+                max_tasks: Optional[int] = None, idle_exit: Optional[float] = None) -> None:
+    if processes == 1:
+        _work(queue_url, kinds, threads, max_tasks, idle_exit)
+        return
+    # spawn, not fork: the parent may hold sqlite connections and event loops that must not be inherited.
+    context = multiprocessing.get_context("spawn")
+    children = [context.Process(target=_work, args=(queue_url, kinds, threads, max_tasks, idle_exit),
+                                name=f"worker-{n}") for n in range(processes)]
+    for child in children:
+        child.start()
+    try:
+        for child in children:
+            child.join()
+    except KeyboardInterrupt:
+        for child in children:
+            child.terminate()
+
+
+def _demo(args: argparse.Namespace) -> int:
+    # Several local worker processes against a throwaway SQLite queue and the fake LLM backend.
+    import tempfile
+
+    os.environ["LLM_BACKEND"] = "fake"
+    os.environ.setdefault("FAKE_LATENCY", str(args.latency))
+    with tempfile.TemporaryDirectory() as tmp:
+        queue_url = f"sqlite:///{os.path.join(tmp, 'tasks.db')}"
+        queue = open_queue(queue_url)
+        chunks = [f"Chunk {n}: " + "lorem ipsum dolor sit amet " * 200 for n in range(args.chunks)]
+        started = time.perf_counter()
+        pool = threading.Thread(target=run_workers, args=(queue_url, args.processes, args.threads, ["analyze"]),
+                                kwargs={"idle_exit": 2.0})
+        pool.start()
+        results, _ = remote_analysis(chunks, "extract the key topics", queue=queue)
+        elapsed = time.perf_counter() - started
+        pool.join()
+        queue.close()
+    errors = sum(1 for r in results if "error" in r)
+    print(json.dumps({"processes": args.processes, "threads": args.threads, "chunks": len(results),
+                      "errors": errors, "seconds": round(elapsed, 3),
+                      "chunks_per_second": round(len(results) / elapsed, 2)}))
+    return 1 if errors else 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    arg_parser = argparse.ArgumentParser(description="Scrape and analysis workers sharing a task queue")
+    arg_parser.add_argument("--queue", help="Queue URL (default: TASK_QUEUE_URL or sqlite:///tasks.db)")
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Process tasks until interrupted")
+    run.add_argument("--processes", type=int, default=get_int("WORKER_PROCESSES", 1))
+    run.add_argument("--threads", type=int, default=get_int("WORKER_THREADS", 1), help="Workers per process")
+    run.add_argument("--kinds", nargs="*", default=list(KINDS), choices=KINDS)
+    run.add_argument("--max-tasks", type=int, help="Stop each worker after this many tasks")
+    run.add_argument("--idle-exit", type=float, help="Stop after this many seconds without work")
+
+    scrape = commands.add_parser("scrape", help="Queue URLs for fetching")
+    scrape.add_argument("urls", nargs="+")
+
+    commands.add_parser("status", help="Task counts by status")
+
+    demo = commands.add_parser("demo", help="Analyse fake chunks with local worker processes and report throughput")
+    demo.add_argument("--processes", type=int, default=3)
+    demo.add_argument("--threads", type=int, default=1)
+    demo.add_argument("--chunks", type=int, default=30)
+    demo.add_argument("--latency", type=float, default=0.2, help="Fake LLM latency per call (s)")
+    args = arg_parser.parse_args(argv)
+
+    from log_config import configure_logging
+    configure_logging()
+
+    if args.command == "run":
+        run_workers(args.queue, args.processes, args.threads, args.kinds, args.max_tasks, args.idle_exit)
+    elif args.command == "scrape":
+        queue = open_queue(args.queue)
+        for task_id in queue.enqueue_many("scrape", [{"url": url} for url in args.urls]):
+            print(task_id)
+        queue.close()
+    elif args.command == "status":
+        queue = open_queue(args.queue)
+        print(json.dumps(queue.counts()))
+        queue.close()
+    elif args.command == "demo":
+        return _demo(args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())